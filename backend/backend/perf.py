@@ -0,0 +1,233 @@
+"""
+Mesure des requêtes HTTP : nombre de requêtes SQL, temps SQL, temps de
+rendu (sérialisation JSON), temps total et taille de la réponse, agrégés
+par nom d'URL dans des histogrammes gardés en mémoire (par processus).
+
+Les budgets se configurent dans settings.PERF_BUDGETS :
+
+    PERF_BUDGETS = {
+        '*': {'queries': 50},                               # par défaut
+        'personne-list': {'queries': 10, 'ms': 300},
+    }
+
+Un dépassement est signalé par un avertissement dans le logger "backend.perf".
+La mesure n'a lieu que si settings.PERF_ENABLED est vrai.
+"""
+import logging
+import threading
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+logger = logging.getLogger(__name__)
+
+# Bornes supérieures des classes des histogrammes (la dernière est ouverte)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+MS_BUCKETS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+SIZE_BUCKETS = (1_000, 10_000, 100_000, 1_000_000, 10_000_000)
+
+UNRESOLVED = '<non résolue>'
+
+
+class Histogram:
+    """Effectifs par classe, avec total, minimum et maximum."""
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def add(self, value):
+        index = len(self.bounds)
+        for i, bound in enumerate(self.bounds):
+            if value <= bound:
+                index = i
+                break
+        self.counts[index] += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def percentile(self, q):
+        """Borne supérieure de la classe contenant le q-ième centile (approché)."""
+        n = sum(self.counts)
+        if not n:
+            return None
+        seuil = q / 100 * n
+        cumul = 0
+        for i, count in enumerate(self.counts):
+            cumul += count
+            if cumul >= seuil:
+                return self.bounds[i] if i < len(self.bounds) else self.max
+        return self.max
+
+    def as_dict(self):
+        n = sum(self.counts)
+        return {
+            'mean': round(self.total / n, 2) if n else None,
+            'min': self.min,
+            'max': self.max,
+            'p50': self.percentile(50),
+            'p95': self.percentile(95),
+            'buckets': {
+                **{f'<={bound}': count for bound, count in zip(self.bounds, self.counts)},
+                f'>{self.bounds[-1]}': self.counts[-1],
+            },
+        }
+
+
+class EndpointStats:
+    def __init__(self):
+        self.count = 0
+        self.over_budget = 0
+        self.queries = Histogram(QUERY_BUCKETS)
+        self.sql_ms = Histogram(MS_BUCKETS)
+        self.render_ms = Histogram(MS_BUCKETS)
+        self.total_ms = Histogram(MS_BUCKETS)
+        self.size = Histogram(SIZE_BUCKETS)
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'over_budget': self.over_budget,
+            'queries': self.queries.as_dict(),
+            'sql_ms': self.sql_ms.as_dict(),
+            'render_ms': self.render_ms.as_dict(),
+            'total_ms': self.total_ms.as_dict(),
+            'size': self.size.as_dict(),
+        }
+
+
+class PerfRegistry:
+    """Statistiques agrégées par nom d'URL, partagées par les threads du processus."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._endpoints = {}
+
+    def record(self, name, sample, over_budget=False):
+        with self._lock:
+            stats = self._endpoints.setdefault(name, EndpointStats())
+            stats.count += 1
+            stats.over_budget += int(over_budget)
+            stats.queries.add(sample.queries)
+            stats.sql_ms.add(sample.sql_ms)
+            stats.render_ms.add(sample.render_ms)
+            stats.total_ms.add(sample.total_ms)
+            if sample.size is not None:
+                stats.size.add(sample.size)
+
+    def snapshot(self):
+        with self._lock:
+            return {name: stats.as_dict() for name, stats in sorted(self._endpoints.items())}
+
+    def reset(self):
+        with self._lock:
+            self._endpoints.clear()
+
+
+registry = PerfRegistry()
+
+
+class RequestSample:
+    """Mesures d'une requête HTTP ; sert aussi d'execute_wrapper pour compter le SQL."""
+
+    def __init__(self):
+        self.queries = 0
+        self.sql_ms = 0.0
+        self.render_ms = 0.0
+        self.total_ms = 0.0
+        self.size = None
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.sql_ms += (time.perf_counter() - start) * 1000
+
+
+def budget_for(name):
+    budgets = getattr(settings, 'PERF_BUDGETS', {})
+    return budgets.get(name, budgets.get('*', {}))
+
+
+class PerfMiddleware:
+    """Mesure chaque requête et l'enregistre dans `registry` sous le nom de son URL."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not getattr(settings, 'PERF_ENABLED', False):
+            return self.get_response(request)
+
+        sample = RequestSample()
+        request._perf_sample = sample
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(sample))
+            response = self.get_response(request)
+        sample.total_ms = (time.perf_counter() - start) * 1000
+        if not response.streaming:
+            sample.size = len(response.content)
+
+        match = getattr(request, 'resolver_match', None)
+        name = match.view_name if match and match.view_name else UNRESOLVED
+        self._record(name, sample, request)
+        return response
+
+    def process_template_response(self, request, response):
+        # Réponses DRF : le rendu (sérialisation JSON) a lieu après la vue
+        sample = getattr(request, '_perf_sample', None)
+        if sample is not None:
+            render = response.render
+
+            def timed_render():
+                start = time.perf_counter()
+                try:
+                    return render()
+                finally:
+                    sample.render_ms += (time.perf_counter() - start) * 1000
+
+            response.render = timed_render
+        return response
+
+    @staticmethod
+    def _record(name, sample, request):
+        budget = budget_for(name)
+        depassements = []
+        if budget.get('queries') is not None and sample.queries > budget['queries']:
+            depassements.append(f"{sample.queries} requêtes SQL (budget {budget['queries']})")
+        if budget.get('ms') is not None and sample.total_ms > budget['ms']:
+            depassements.append(f"{sample.total_ms:.0f} ms (budget {budget['ms']} ms)")
+        if depassements:
+            logger.warning("%s %s [%s] : %s", request.method, request.path, name, ", ".join(depassements))
+        registry.record(name, sample, over_budget=bool(depassements))
+
+
+class PerfView(APIView):
+    """
+    GET : statistiques par nom d'URL depuis le démarrage du processus.
+    DELETE : remise à zéro.
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response({
+            'budgets': getattr(settings, 'PERF_BUDGETS', {}),
+            'endpoints': registry.snapshot(),
+        })
+
+    def delete(self, request):
+        registry.reset()
+        return Response(status=204)
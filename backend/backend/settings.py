@@ -2,6 +2,7 @@
 from pathlib import Path
 from datetime import timedelta
 import os
+import sys
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -55,6 +56,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Mesures par URL (requêtes SQL, temps, taille) : voir backend/perf.py
+    'backend.perf.PerfMiddleware',
+
     # Cors middleware
     'corsheaders.middleware.CorsMiddleware',
 
@@ -190,4 +194,34 @@ TEMPLATES[0]['DIRS'] = [
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
-X_FRAME_OPTIONS = 'ALLOWALL'
\ No newline at end of file
+X_FRAME_OPTIONS = 'ALLOWALL'
+
+# Mesures par URL (backend.perf) : actives par défaut en développement
+# seulement, hors `manage.py test` (les temps des tests n'ont pas de sens face
+# aux budgets) ; PERF_ENABLED=True / False dans l'environnement pour forcer.
+TESTING = len(sys.argv) > 1 and sys.argv[1] == 'test'
+PERF_ENABLED = os.environ.get('PERF_ENABLED', str(DEBUG and not TESTING)) == 'True'
+
+# Budgets par nom d'URL ('*' : par défaut) ; un dépassement est journalisé
+# par backend.perf et visible sur /api/_perf/ (administrateurs).
+# Requêtes : nombres vérifiés par les tests (formation/tests.py,
+# personne/tests.py) + 1 pour le chargement de l'utilisateur par le jeton JWT.
+# Durées : 2 × le p95 le plus élevé de deux exécutions de
+# `manage.py benchmark --scale 1000` (10 et 20 itérations), arrondi au-dessus.
+# p95 mesurés : formation-list 1230 ms, formation-progress 38, userformation-list
+# 147, quiz-competence-table 234, quiz-radar-scores 11, personne-list 3884,
+# hierarchie 486, dashboard-stats 47.
+PERF_AUTH_QUERIES = 1
+PERF_BUDGETS = {
+    '*': {'queries': 50, 'ms': 1000},
+    'formation-list': {'queries': 11 + PERF_AUTH_QUERIES, 'ms': 2500},
+    'formation-progress': {'queries': 29 + PERF_AUTH_QUERIES, 'ms': 80},
+    'userformation-list': {'queries': 12 + PERF_AUTH_QUERIES, 'ms': 300},
+    'quiz-competence-table': {'queries': 4 + PERF_AUTH_QUERIES, 'ms': 500},
+    # 3 avec ?manager_id= (lecture du chemin hiérarchique du manager)
+    'quiz-radar-scores': {'queries': 3 + PERF_AUTH_QUERIES, 'ms': 25},
+    # Liste complète (~4 Mo pour 1000 personnes) ; ?fields= / ?page_size= pour l'annuaire
+    'personne-list': {'queries': 4 + PERF_AUTH_QUERIES, 'ms': 8000},
+    'hierarchie': {'queries': 5 + PERF_AUTH_QUERIES, 'ms': 1000},
+    'dashboard-stats': {'queries': 15 + PERF_AUTH_QUERIES, 'ms': 100},
+}
\ No newline at end of file
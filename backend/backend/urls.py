@@ -5,11 +5,14 @@ from django.conf import settings
 from django.conf.urls.static import static
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView, TokenBlacklistView
 
+from .perf import PerfView
+
 
 urlpatterns = [
     path('admin/', admin.site.urls),
 
     # APIs
+    path('api/_perf/', PerfView.as_view(), name='perf'),
     path('api/personne/', include('personne.urls')),
     path('api/projet/', include('projet.urls')),
     path('api/', include('formation.urls')),
@@ -0,0 +1,112 @@
+"""
+Mesure des points d'entrée les plus sollicités de l'API à travers le client
+de test de Django : latence (p50 / p95) et nombre de requêtes SQL par appel.
+"""
+import time
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from personne.models import Personne
+
+from .models import Equipe, Formation
+
+
+def _percentile(values, q):
+    """Centile par rang le plus proche (valeurs triées)."""
+    rang = max(0, min(len(values) - 1, round(q / 100 * len(values) + 0.5) - 1))
+    return values[rang]
+
+
+def hot_endpoints():
+    """
+    (nom, utilisateur, url) des appels mesurés ; les paramètres sont pris
+    dans la base courante. Un Country Leader voit tout, un collaborateur
+    ses propres formations.
+    """
+    admin = Personne.objects.filter(role='CL', is_staff=True).order_by('pk').first()
+    collaborateur = (
+        Personne.objects.filter(role='COLLABORATEUR', userformation__isnull=False).order_by('pk').first()
+    )
+    manager = Personne.objects.filter(role='TL2').order_by('pk').first()
+    equipe = Equipe.objects.order_by('pk').first()
+    formation = Formation.objects.filter(statut='actif').order_by('pk').first()
+
+    endpoints = [
+        ('dashboard-stats', admin, '/api/personne/stats/'),
+        ('hierarchie', admin, '/api/personne/hierarchie/'),
+        ('personne-list', admin, '/api/personne/personnes/'),
+        ('personne-list-directory', admin,
+         '/api/personne/personnes/?fields=matricule,first_name,last_name,status,equipe_id&page_size=50'),
+        ('projet-list', admin, '/api/projet/projets/'),
+        ('formation-list', admin, '/api/formations/'),
+        ('quiz-competence-table', admin, '/api/quizzes/competence_table/'),
+        ('quiz-competence-table-compact', admin, '/api/quizzes/competence_table/?layout=compact'),
+        ('quiz-radar-scores', admin, '/api/quizzes/radar_scores/'),
+        ('userformation-list', collaborateur, '/api/user-formations/'),
+    ]
+    if manager:
+        endpoints.append(
+            ('quiz-radar-scores-manager', admin, f'/api/quizzes/radar_scores/?manager_id={manager.pk}'))
+    if equipe:
+        endpoints.append(
+            ('quiz-competence-table-equipe', admin, f'/api/quizzes/competence_table/?equipe_id={equipe.pk}'))
+    if formation:
+        endpoints.append(
+            ('formation-progress', admin, f'/api/formations/{formation.pk}/progress/'))
+    return [(name, user, url) for name, user, url in endpoints if user is not None]
+
+
+def measure(client, url, iterations, warmup):
+    """Appelle `url` warmup + iterations fois ; statistiques des `iterations` dernières."""
+    for _ in range(warmup):
+        client.get(url)
+
+    durees, requetes = [], []
+    for _ in range(iterations):
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            response = client.get(url)
+            durees.append((time.perf_counter() - start) * 1000)
+        requetes.append(len(queries))
+
+    durees.sort()
+    return {
+        'url': url,
+        'status': response.status_code,
+        'size': len(response.content) if not response.streaming else None,
+        'queries': max(requetes),
+        'p50_ms': round(_percentile(durees, 50), 2),
+        'p95_ms': round(_percentile(durees, 95), 2),
+        'mean_ms': round(sum(durees) / len(durees), 2),
+        'min_ms': round(durees[0], 2),
+        'max_ms': round(durees[-1], 2),
+    }
+
+
+def run_benchmark(iterations=10, warmup=2, only=None):
+    """Mesure chaque point d'entrée ; `only` : noms à garder (tous par défaut)."""
+    client = APIClient()
+    resultats = {}
+    for name, user, url in hot_endpoints():
+        if only and name not in only:
+            continue
+        client.force_authenticate(user)
+        resultats[name] = measure(client, url, iterations, warmup)
+    client.force_authenticate(None)
+    return resultats
+
+
+def compare(before, after):
+    """Écart relatif (après / avant) des latences et des requêtes de deux exécutions."""
+    ecarts = {}
+    for name, apres in after.items():
+        avant = before.get(name)
+        if avant is None:
+            continue
+        ecarts[name] = {
+            key: round(apres[key] / avant[key], 2) if avant[key] else None
+            for key in ('queries', 'p50_ms', 'p95_ms')
+        }
+    return ecarts
@@ -0,0 +1,312 @@
+import numpy as np
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import Case, Count, F, FloatField, Sum, When
+from django.db.models.functions import Cast, Coalesce
+
+from .models import Domain, Equipe, Formation, UserDomainScore, UserQuiz, quiz_max_points
+from .pending import PerTransaction
+
+BATCH_SIZE = 500
+SCORE_FIELDS = ['total_score', 'total_max', 'pct', 'pct_sum', 'quiz_count', 'updated_at']
+
+
+def _pct(total_score, total_max):
+    return round(float(total_score) / total_max * 100) if total_max else 0
+
+
+def domain_score_rows(user_quizzes):
+    """
+    Cumule par (utilisateur, domaine) les quiz terminés de `user_quizzes` :
+    score, maximum possible, somme des % par quiz et nombre de quiz.
+    """
+    return (
+        user_quizzes
+        .filter(completed=True, quiz__formation__domain__isnull=False)
+        .annotate(max_points=Coalesce(quiz_max_points('quiz_id'), 0))
+        .values('user_id', 'quiz__formation__domain_id')
+        .annotate(
+            total_score=Sum('score'),
+            total_max=Sum('max_points'),
+            pct_sum=Sum(Case(
+                When(max_points__gt=0, then=Cast(F('score'), FloatField()) * 100.0 / F('max_points')),
+                default=0.0,
+                output_field=FloatField(),
+            )),
+            quiz_count=Count('id'),
+        )
+        .order_by()
+    )
+
+
+def _scores_from_rows(rows):
+    return [
+        UserDomainScore(
+            user_id=row['user_id'],
+            domain_id=row['quiz__formation__domain_id'],
+            total_score=row['total_score'],
+            total_max=row['total_max'],
+            pct=_pct(row['total_score'], row['total_max']),
+            pct_sum=row['pct_sum'],
+            quiz_count=row['quiz_count'],
+        )
+        for row in rows
+    ]
+
+
+def refresh_domain_scores(user_ids, domain_ids):
+    """
+    Recalcule les UserDomainScore des couples utilisateurs × domaines donnés
+    depuis UserQuiz : mise à jour ou création des couples ayant au moins un
+    quiz terminé, suppression des autres.
+    """
+    user_ids, domain_ids = set(user_ids), set(domain_ids) - {None}
+    if not user_ids or not domain_ids:
+        return
+    scores = _scores_from_rows(domain_score_rows(
+        UserQuiz.objects.filter(user_id__in=user_ids, quiz__formation__domain_id__in=domain_ids)
+    ))
+    gardes = {(score.user_id, score.domain_id) for score in scores}
+
+    with transaction.atomic():
+        existants = UserDomainScore.objects.filter(user_id__in=user_ids, domain_id__in=domain_ids)
+        obsoletes = [
+            pk for pk, user_id, domain_id in existants.values_list('pk', 'user_id', 'domain_id')
+            if (user_id, domain_id) not in gardes
+        ]
+        UserDomainScore.objects.filter(pk__in=obsoletes).delete()
+        UserDomainScore.objects.bulk_create(
+            scores,
+            batch_size=BATCH_SIZE,
+            update_conflicts=True,
+            unique_fields=['user', 'domain'],
+            update_fields=SCORE_FIELDS,
+        )
+
+
+def rebuild_domain_scores():
+    """Reconstruit entièrement la table UserDomainScore. Retourne le nombre de lignes."""
+    scores = _scores_from_rows(domain_score_rows(UserQuiz.objects.all()))
+    with transaction.atomic():
+        UserDomainScore.objects.all().delete()
+        UserDomainScore.objects.bulk_create(scores, batch_size=BATCH_SIZE)
+    return len(scores)
+
+
+# ----------------------------------------------------------------------
+# Tableau des compétences (utilisateurs × domaines)
+# ----------------------------------------------------------------------
+def _domain_targets(domain):
+    return {
+        'prerequisites': float(domain.prerequisites_level),
+        'consultant_target': float(domain.consultant_target),
+        'leader_target': float(domain.leader_target),
+    }
+
+
+class CompetenceMatrix:
+    """
+    Scores des personnes par domaine, en tableaux denses indexés par
+    (rang de la personne, rang du domaine) : sommes des points obtenus et
+    possibles, pourcentages et moyennes calculés en une passe vectorisée.
+    Les personnes sans aucun quiz terminé sont écartées.
+    """
+
+    def __init__(self, personnes, domains=None):
+        self.domains = list(Domain.objects.all()) if domains is None else list(domains)
+        domain_index = {d.pk: i for i, d in enumerate(self.domains)}
+        candidats = list(personnes)
+        user_index = {p.pk: i for i, p in enumerate(candidats)}
+
+        shape = (len(candidats), len(self.domains))
+        score = np.zeros(shape, dtype=np.int64)
+        total_max = np.zeros(shape, dtype=np.int64)
+        scored = np.zeros(shape, dtype=bool)
+        rows = (
+            UserDomainScore.objects.filter(user__in=personnes)
+            .values_list('user_id', 'domain_id', 'total_score', 'total_max')
+            .order_by('domain_id')
+        )
+        # Ordre des domaines scorés de chaque personne, pour le format historique
+        self._ordre = {}
+        for user_id, domain_id, total_score, maximum in rows:
+            u, d = user_index[user_id], domain_index[domain_id]
+            score[u, d], total_max[u, d], scored[u, d] = total_score, maximum, True
+            self._ordre.setdefault(u, []).append(d)
+
+        # round(score / max * 100), 0 si aucun point possible
+        pct = np.rint(score / np.where(total_max > 0, total_max, 1) * 100).astype(np.int64)
+        pct[total_max == 0] = 0
+        counts = scored.sum(axis=1)
+        sums = np.where(scored, pct, 0).sum(axis=1)
+        average = np.rint(sums / np.maximum(counts, 1)).astype(np.int64)
+
+        gardes = np.flatnonzero(counts)
+        self.personnes = [candidats[u] for u in gardes]
+        self.pct = pct[gardes]
+        self.scored = scored[gardes]
+        self.average = average[gardes]
+        self._ordre = [self._ordre[u] for u in gardes]
+        self.equipes = self._premieres_equipes(self.personnes)
+
+    @staticmethod
+    def _premieres_equipes(personnes):
+        """Nom de l'équipe de plus petit id de chaque personne (en une requête)."""
+        noms = {}
+        liens = (
+            Equipe.assigned_users.through.objects
+            .filter(personne_id__in=[p.pk for p in personnes])
+            .values_list('personne_id', 'equipe__name')
+            .order_by('-equipe_id')
+        )
+        for matricule, name in liens:
+            noms[matricule] = name
+        return [noms.get(p.pk, "__") for p in personnes]
+
+    def _user(self, i):
+        personne = self.personnes[i]
+        return {
+            "user_id": personne.matricule,
+            "user": f"{personne.first_name} {personne.last_name}",
+            "equipe": self.equipes[i],
+        }
+
+    def rows(self):
+        """
+        Format historique : une ligne par personne, avec pour chaque domaine
+        (par nom) son score — None s'il n'y a pas de résultat — et ses cibles.
+        """
+        targets = [_domain_targets(d) for d in self.domains]
+        pct = self.pct.tolist()
+        result = []
+        for i in range(len(self.personnes)):
+            final_scores = {}
+            for d in self._ordre[i]:
+                final_scores[self.domains[d].name] = {'score': pct[i][d], **targets[d]}
+            for d, domain in enumerate(self.domains):
+                if domain.name not in final_scores:
+                    final_scores[domain.name] = {'score': None, **targets[d]}
+            result.append({
+                **self._user(i),
+                "scores": final_scores,
+                "average": int(self.average[i]),
+            })
+        return result
+
+    def score_lists(self):
+        """Pour chaque personne, les scores dans l'ordre des domaines (None sans résultat)."""
+        scores = np.where(self.scored, self.pct, -1).tolist()
+        return [[None if value < 0 else value for value in row] for row in scores]
+
+    def compact(self):
+        """
+        Format compact : les domaines et leurs cibles une seule fois, puis pour
+        chaque personne la liste des scores dans l'ordre des domaines.
+        """
+        return {
+            "domains": [{"id": d.pk, "name": d.name, **_domain_targets(d)} for d in self.domains],
+            "rows": [
+                {
+                    **self._user(i),
+                    "scores": scores,
+                    "average": int(self.average[i]),
+                }
+                for i, scores in enumerate(self.score_lists())
+            ],
+        }
+
+
+def radar_data(personnes):
+    """
+    Radar des personnes données : pour chaque domaine de leurs équipes (par
+    nom), la moyenne des % de chaque quiz terminé, tous utilisateurs
+    confondus — la méthode la plus juste pour une équipe/projet — et ses
+    cibles. Lit les scores précalculés (UserDomainScore).
+    """
+    domaines = list(Domain.objects.filter(
+        equipes__assigned_users__in=personnes
+    ).distinct().order_by('name'))
+
+    moyennes = {
+        row['domain']: row['pct_sum'] / row['quiz_count']
+        for row in UserDomainScore.objects.filter(
+            user__in=personnes,
+            domain__in=[d.pk for d in domaines],
+        )
+        .values('domain')
+        .annotate(pct_sum=Sum('pct_sum'), quiz_count=Sum('quiz_count'))
+        .order_by()
+        if row['quiz_count']
+    }
+
+    data = []
+    for domaine in domaines:
+        avg_score_percent = moyennes.get(domaine.pk)
+        data.append({
+            "domaine": domaine.name,
+            "score": round(avg_score_percent or 0, 2) if avg_score_percent is not None else None,
+            **_domain_targets(domaine),
+        })
+    return data
+
+
+# ----------------------------------------------------------------------
+# Couples (utilisateur, domaine) "sales" de la transaction courante
+# ----------------------------------------------------------------------
+class PendingScores:
+    """
+    Utilisateurs et domaines touchés pendant une transaction, recalculés
+    une seule fois à la validation. Le domaine de chaque quiz n'y est lu
+    qu'une fois.
+    """
+
+    def __init__(self):
+        self.user_ids = set()
+        self.domain_ids = set()
+        self.quiz_domains = {}
+
+    def add(self, user_ids, domain_ids):
+        self.user_ids.update(user_ids)
+        self.domain_ids.update(domain_ids)
+
+    def flush(self):
+        refresh_domain_scores(self.user_ids, self.domain_ids)
+        self.user_ids.clear()
+        self.domain_ids.clear()
+        self.quiz_domains.clear()
+
+
+_pending_scores = PerTransaction('scores', PendingScores)
+
+
+def quiz_domain_ids(quiz_id, using=DEFAULT_DB_ALIAS):
+    """Domaine du quiz (liste vide ou d'un élément), mémorisé pour la transaction."""
+    pending = _pending_scores.get(using)
+    if pending is not None and quiz_id in pending.quiz_domains:
+        return pending.quiz_domains[quiz_id]
+    domain_ids = list(
+        Formation.objects.filter(quiz__pk=quiz_id).values_list('domain_id', flat=True)
+    )
+    if pending is not None:
+        pending.quiz_domains[quiz_id] = domain_ids
+    return domain_ids
+
+
+def forget_quiz_domains(using=DEFAULT_DB_ALIAS):
+    """À appeler quand une formation change de domaine dans la transaction."""
+    for pending in _pending_scores.all(using):
+        pending.quiz_domains.clear()
+
+
+def mark_scores_dirty(user_ids, domain_ids, using=DEFAULT_DB_ALIAS):
+    """
+    Demande le recalcul des scores par domaine des utilisateurs donnés :
+    regroupé et appliqué à la validation dans une transaction, immédiat sinon.
+    """
+    user_ids, domain_ids = set(user_ids), set(domain_ids) - {None}
+    if not user_ids or not domain_ids:
+        return
+    pending = _pending_scores.get(using)
+    if pending is None:
+        refresh_domain_scores(user_ids, domain_ids)
+    else:
+        pending.add(user_ids, domain_ids)
@@ -0,0 +1,128 @@
+import csv
+import tempfile
+
+from django.http import FileResponse, StreamingHttpResponse
+from openpyxl import Workbook
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+from .competences import CompetenceMatrix
+from .models import Domain
+
+CHUNK_SIZE = 500
+CSV_DELIMITER = ';'
+XLSX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+
+class _ExportRenderer(BaseRenderer):
+    """
+    Rend ?format=csv|xlsx acceptable par la négociation de DRF ; la vue
+    renvoie elle-même le fichier (en flux), seules les réponses d'erreur
+    (400, 401, 403, 404...) passent donc par render() : elles sont rendues
+    en JSON.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        response = (renderer_context or {}).get('response')
+        if response is not None:
+            response['Content-Type'] = JSONRenderer.media_type
+        return JSONRenderer().render(data, renderer_context=renderer_context)
+
+
+class CSVRenderer(_ExportRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+    charset = 'utf-8'
+
+
+class XLSXRenderer(_ExportRenderer):
+    media_type = XLSX_CONTENT_TYPE
+    format = 'xlsx'
+    charset = None
+    render_style = 'binary'
+
+
+class _Echo:
+    """Pseudo-fichier pour csv.writer : renvoie la ligne au lieu de l'écrire."""
+
+    def write(self, value):
+        return value
+
+
+def competence_chunks(personnes, domains):
+    """
+    Parcourt les personnes par paquets de CHUNK_SIZE (par matricule) et
+    produit un CompetenceMatrix par paquet : la mémoire ne dépend pas de
+    l'effectif.
+    """
+    personnes = personnes.order_by('pk')
+    dernier = None
+    while True:
+        paquet = personnes if dernier is None else personnes.filter(pk__gt=dernier)
+        paquet = list(paquet[:CHUNK_SIZE])
+        if not paquet:
+            return
+        yield CompetenceMatrix(paquet, domains)
+        dernier = paquet[-1].pk
+
+
+def competence_header(domains):
+    return ['Matricule', 'Collaborateur', 'Équipe', *(d.name for d in domains), 'Moyenne']
+
+
+def competence_lines(personnes, domains):
+    """Lignes du tableau des compétences : une par personne ayant au moins un résultat."""
+    for matrix in competence_chunks(personnes, domains):
+        for i, scores in enumerate(matrix.score_lists()):
+            personne = matrix.personnes[i]
+            yield [
+                personne.matricule,
+                f"{personne.first_name} {personne.last_name}",
+                matrix.equipes[i],
+                *scores,
+                int(matrix.average[i]),
+            ]
+
+
+def competence_csv_response(personnes, filename='competences.csv'):
+    """Tableau des compétences en CSV, envoyé au fil de l'eau."""
+    domains = list(Domain.objects.all())
+    writer = csv.writer(_Echo(), delimiter=CSV_DELIMITER)
+
+    def lignes():
+        # BOM : Excel détecte l'UTF-8 (accents des noms)
+        yield '\ufeff'
+        yield writer.writerow(competence_header(domains))
+        for ligne in competence_lines(personnes, domains):
+            yield writer.writerow(['' if value is None else value for value in ligne])
+
+    response = StreamingHttpResponse(lignes(), content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+def competence_xlsx_response(personnes, radar, filename='competences.xlsx'):
+    """
+    Tableau des compétences en xlsx (openpyxl en écriture seule : les
+    lignes sont écrites au fur et à mesure dans un fichier temporaire),
+    avec une seconde feuille pour les cibles des domaines et le radar.
+    """
+    domains = list(Domain.objects.all())
+    workbook = Workbook(write_only=True)
+
+    sheet = workbook.create_sheet('Compétences')
+    sheet.append(competence_header(domains))
+    for ligne in competence_lines(personnes, domains):
+        sheet.append(ligne)
+
+    sheet = workbook.create_sheet('Domaines')
+    sheet.append(['Domaine', 'Score moyen', 'Prérequis', 'Cible consultant', 'Cible leader'])
+    for row in radar:
+        sheet.append([
+            row['domaine'], row['score'], row['prerequisites'],
+            row['consultant_target'], row['leader_target'],
+        ])
+
+    fichier = tempfile.TemporaryFile()
+    workbook.save(fichier)
+    fichier.seek(0)
+    return FileResponse(fichier, as_attachment=True, filename=filename, content_type=XLSX_CONTENT_TYPE)
@@ -0,0 +1,185 @@
+import re
+import threading
+from collections import OrderedDict
+
+from django.core.cache import cache
+
+from .models import Option, UserAnswer
+
+CHOICE_TYPES = ('single_choice', 'multiple_choice')
+TEXT_TYPES = ('text', 'image_text')
+KEYWORD_THRESHOLD = 0.5
+WORD_SEPARATORS = re.compile(r'\s+|,|\.')
+
+# Corrigés gardés en mémoire (par processus) et dans le cache Django
+MAX_KEYS = 256
+CACHE_PREFIX = 'formation:answer_key'
+CACHE_TIMEOUT = 24 * 60 * 60
+
+
+def normalize_keywords(keywords):
+    """Mots-clés en minuscules, dans l'ordre (les doublons comptent chacun)."""
+    return tuple(keyword.lower() for keyword in keywords or ())
+
+
+def score_answer(question_type, point, correct_option_ids, keywords,
+                 selected_option_ids=None, text_response=None):
+    """
+    Score d'une réponse à partir du corrigé d'une question :
+    - choix : tous les points si les options choisies sont exactement les bonnes ;
+    - texte : tous les points si au moins 50 % des mots-clés (normalisés avec
+      normalize_keywords) sont présents.
+    """
+    if question_type in CHOICE_TYPES:
+        if not selected_option_ids:
+            return 0
+        return point if set(correct_option_ids) == set(selected_option_ids) else 0
+
+    if question_type in TEXT_TYPES:
+        if not text_response or not keywords:
+            return 0
+        user_words = set(WORD_SEPARATORS.split(text_response.lower()))
+        found_count = sum(1 for keyword in keywords if keyword in user_words)
+        return point if found_count / len(keywords) >= KEYWORD_THRESHOLD else 0
+
+    return 0
+
+
+class AnswerKey:
+    """
+    Corrigé compilé d'un quiz : type, points et mots-clés normalisés de
+    chaque question, options et bonnes réponses en frozensets. Chargé en
+    deux requêtes, il note une soumission sans requête supplémentaire par
+    question et peut être mis en cache (objet picklable).
+    """
+
+    def __init__(self, questions, options, version=None):
+        self.version = version
+        self.questions = {
+            q['id']: (q['type'], q['point'], normalize_keywords(q['correct_keywords']))
+            for q in questions
+        }
+        toutes, bonnes = {}, {}
+        for option in options:
+            toutes.setdefault(option['question_id'], set()).add(option['id'])
+            if option['is_correct']:
+                bonnes.setdefault(option['question_id'], set()).add(option['id'])
+        self.options = {qid: frozenset(toutes.get(qid, ())) for qid in self.questions}
+        self.correct = {qid: frozenset(bonnes.get(qid, ())) for qid in self.questions}
+        self.question_ids = frozenset(self.questions)
+        self.total = sum(point for _, point, _ in self.questions.values())
+
+    @classmethod
+    def for_quiz(cls, quiz):
+        questions = list(quiz.questions.values('id', 'type', 'point', 'correct_keywords'))
+        options = list(
+            Option.objects.filter(question__quiz=quiz).values('id', 'question_id', 'is_correct')
+        )
+        return cls(questions, options, version=quiz.version)
+
+    def is_choice(self, question_id):
+        return self.questions[question_id][0] in CHOICE_TYPES
+
+    def score(self, question_id, selected_option_ids=None, text_response=None):
+        question_type, point, keywords = self.questions[question_id]
+        return score_answer(
+            question_type, point, self.correct[question_id], keywords,
+            selected_option_ids, text_response,
+        )
+
+    def grade(self, answers):
+        """Score total des réponses ({question_id, selected_option_ids, text_response})."""
+        return sum(
+            self.score(item['question_id'], item.get('selected_option_ids'), item.get('text_response'))
+            for item in answers
+        )
+
+
+class AnswerKeyCache:
+    """
+    Corrigés compilés, identifiés par (quiz, version) : incrémenter
+    Quiz.version suffit donc à les invalider, dans tous les processus.
+    Un LRU borné garde les plus utilisés en mémoire ; le cache Django
+    les partage entre processus.
+    """
+
+    def __init__(self, max_keys=MAX_KEYS):
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        self._keys = OrderedDict()
+
+    @staticmethod
+    def cache_key(quiz_id, version):
+        return f"{CACHE_PREFIX}:{quiz_id}:{version}"
+
+    def get(self, quiz):
+        key = (quiz.pk, quiz.version)
+        with self._lock:
+            answer_key = self._keys.get(key)
+            if answer_key is not None:
+                self._keys.move_to_end(key)
+                return answer_key
+
+        answer_key = cache.get(self.cache_key(*key))
+        if answer_key is None:
+            answer_key = AnswerKey.for_quiz(quiz)
+            cache.set(self.cache_key(*key), answer_key, CACHE_TIMEOUT)
+
+        with self._lock:
+            # Les versions précédentes du quiz ne serviront plus
+            for old in [k for k in self._keys if k[0] == quiz.pk and k != key]:
+                del self._keys[old]
+            self._keys[key] = answer_key
+            while len(self._keys) > self.max_keys:
+                self._keys.popitem(last=False)
+        return answer_key
+
+    def clear(self):
+        with self._lock:
+            self._keys.clear()
+
+
+answer_key_cache = AnswerKeyCache()
+
+
+def save_answers(user, key, answers):
+    """
+    Enregistre les réponses de l'utilisateur (une UserAnswer par question,
+    la dernière réponse l'emporte) : création des réponses manquantes,
+    mise à jour des textes et remplacement des options choisies, en un
+    nombre fixe de requêtes.
+    """
+    par_question = {item['question_id']: item for item in answers}
+    if not par_question:
+        return
+
+    user_answers = {}
+    for ua in UserAnswer.objects.filter(user=user, question_id__in=par_question).order_by('-pk'):
+        user_answers[ua.question_id] = ua  # la plus ancienne, comme get_or_create
+    nouvelles = [
+        UserAnswer(user=user, question_id=question_id)
+        for question_id in par_question if question_id not in user_answers
+    ]
+    UserAnswer.objects.bulk_create(nouvelles)
+    user_answers.update((ua.question_id, ua) for ua in nouvelles)
+
+    textes, choix = [], []
+    for question_id, item in par_question.items():
+        ua = user_answers[question_id]
+        if key.is_choice(question_id):
+            choix.append(ua)
+        else:
+            ua.text_response = item.get('text_response', '')
+            textes.append(ua)
+    UserAnswer.objects.bulk_update(textes, ['text_response'])
+
+    through = UserAnswer.selected_options.through
+    through.objects.filter(useranswer__in=choix).delete()
+    through.objects.bulk_create([
+        through(useranswer_id=ua.pk, option_id=option_id)
+        for ua in choix
+        for option_id in sorted(
+            set(par_question[ua.question_id].get('selected_option_ids', []))
+            & key.options[ua.question_id]
+        )
+    ])
@@ -0,0 +1,74 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from formation.benchmark import compare, run_benchmark
+from formation.synthetic import SyntheticDataset
+
+
+class Command(BaseCommand):
+    help = (
+        "Mesure les points d'entrée les plus sollicités de l'API (latence p50/p95, "
+        "requêtes SQL) et écrit le résultat en JSON. Par défaut, sur un jeu "
+        "synthétique généré dans une base de test jetable."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', type=int, default=1000, help="Nombre de collaborateurs du jeu synthétique.")
+        parser.add_argument('--seed', type=int, default=0, help="Graine du jeu synthétique.")
+        parser.add_argument('--iterations', type=int, default=10, help="Appels mesurés par point d'entrée.")
+        parser.add_argument('--warmup', type=int, default=2, help="Appels de chauffe non mesurés.")
+        parser.add_argument(
+            '--endpoint', action='append', dest='endpoints',
+            help="Limiter à ce point d'entrée (option répétable).",
+        )
+        parser.add_argument(
+            '--current-db', action='store_true',
+            help="Mesurer sur les données de la base courante, sans jeu synthétique.",
+        )
+        parser.add_argument('--output', help="Fichier JSON de sortie (sortie standard sinon).")
+        parser.add_argument('--compare', help="Résultat JSON d'une exécution précédente à comparer.")
+
+    def handle(self, *args, **options):
+        if options['iterations'] < 1:
+            raise CommandError("--iterations doit être au moins 1.")
+        avant = None
+        if options['compare']:
+            with open(options['compare'], encoding='utf-8') as fichier:
+                avant = json.load(fichier)['endpoints']
+
+        setup_test_environment()
+        old_name = None
+        try:
+            if not options['current_db']:
+                old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+                SyntheticDataset(options['scale'], options['seed']).generate()
+            endpoints = run_benchmark(options['iterations'], options['warmup'], options['endpoints'])
+        finally:
+            if old_name is not None:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        result = {
+            'meta': {
+                'vendor': connection.vendor,
+                'dataset': 'current' if options['current_db'] else {
+                    'scale': options['scale'], 'seed': options['seed'],
+                },
+                'iterations': options['iterations'],
+                'warmup': options['warmup'],
+            },
+            'endpoints': endpoints,
+        }
+        if avant is not None:
+            result['compare'] = compare(avant, endpoints)
+
+        sortie = json.dumps(result, indent=2, ensure_ascii=False)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as fichier:
+                fichier.write(sortie + '\n')
+            self.stdout.write(self.style.SUCCESS(f"Résultats écrits dans {options['output']}."))
+        else:
+            self.stdout.write(sortie)
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from formation.synthetic import PASSWORD, PREFIX, SyntheticDataset
+from personne.models import Personne
+
+
+class Command(BaseCommand):
+    help = (
+        "Génère un jeu de données synthétique réaliste (collaborateurs et ligne "
+        "hiérarchique, projets, équipes, domaines, formations avec modules, "
+        "ressources et quiz, progression des inscrits) dans la base courante."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', type=int, default=1000, help="Nombre de collaborateurs (défaut : 1000).")
+        parser.add_argument('--seed', type=int, default=0, help="Graine du générateur (défaut : 0).")
+
+    def handle(self, *args, **options):
+        if options['scale'] < 1:
+            raise CommandError("--scale doit être au moins 1.")
+        if Personne.objects.filter(matricule__startswith=PREFIX).exists():
+            raise CommandError(
+                f"La base contient déjà des collaborateurs synthétiques (matricules {PREFIX}…)."
+            )
+
+        counts = SyntheticDataset(options['scale'], options['seed']).generate()
+        for label, count in counts.items():
+            self.stdout.write(f"  {label} : {count}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Jeu synthétique généré (mot de passe des comptes : {PASSWORD!r})."
+        ))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from formation.competences import rebuild_domain_scores
+
+
+class Command(BaseCommand):
+    help = (
+        "Reconstruit entièrement la table UserDomainScore (scores des quiz "
+        "terminés cumulés par utilisateur et par domaine) depuis UserQuiz."
+    )
+
+    def handle(self, *args, **options):
+        lignes = rebuild_domain_scores()
+        self.stdout.write(self.style.SUCCESS(f"{lignes} score(s) par domaine reconstruit(s)."))
@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from formation.models import Formation, UserFormation
+from formation.progress import recompute_progress, refresh_total_items
+
+CHUNK_SIZE = 2000
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalcule Formation.total_items et la progression (completed_items, "
+        "progress, status) de chaque UserFormation depuis les tables de suivi, "
+        "pour corriger une éventuelle dérive des compteurs incrémentaux."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--formation', type=int, action='append', dest='formations',
+            help="Limiter à cette formation (option répétable).",
+        )
+
+    def handle(self, *args, **options):
+        formations = Formation.objects.all()
+        if options['formations']:
+            formations = formations.filter(pk__in=options['formations'])
+        formation_ids = list(formations.values_list('pk', flat=True))
+
+        with transaction.atomic():
+            totals = refresh_total_items(formation_ids)
+
+        suivis = UserFormation.objects.filter(formation_id__in=formation_ids).order_by('pk')
+        corriges = 0
+        last_pk = 0
+        while True:
+            chunk = list(suivis.filter(pk__gt=last_pk)[:CHUNK_SIZE])
+            if not chunk:
+                break
+            with transaction.atomic():
+                corriges += recompute_progress(chunk)
+            last_pk = chunk[-1].pk
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(formation_ids)} formation(s) vérifiée(s) : {len(totals)} total(aux) corrigé(s), "
+            f"{corriges} suivi(s) corrigé(s)."
+        ))
@@ -0,0 +1,65 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:20
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def remplir_compteurs(apps, schema_editor):
+    Formation = apps.get_model('formation', 'Formation')
+    Quiz = apps.get_model('formation', 'Quiz')
+    UserFormation = apps.get_model('formation', 'UserFormation')
+    UserModule = apps.get_model('formation', 'UserModule')
+    UserResource = apps.get_model('formation', 'UserResource')
+    UserQuiz = apps.get_model('formation', 'UserQuiz')
+
+    # Vue d'ensemble + modules + ressources + quiz
+    formations = list(Formation.objects.annotate(
+        nb_modules=Count('modules', distinct=True),
+        nb_ressources=Count('ressources', distinct=True),
+    ))
+    avec_quiz = set(Quiz.objects.values_list('formation_id', flat=True))
+    for formation in formations:
+        formation.total_items = 1 + formation.nb_modules + formation.nb_ressources + (formation.id in avec_quiz)
+    Formation.objects.bulk_update(formations, ['total_items'], batch_size=500)
+
+    def compter(queryset, formation_field):
+        rows = queryset.values('user_id', formation_field).annotate(n=Count('id')).order_by()
+        return {(row['user_id'], row[formation_field]): row['n'] for row in rows}
+
+    modules = compter(UserModule.objects.filter(completed=True), 'module__formations')
+    ressources = compter(UserResource.objects.filter(read=True), 'resource__formations')
+    quiz = compter(UserQuiz.objects.filter(completed=True), 'quiz__formation_id')
+
+    # Progression et statut recalculés avec la formule entière des compteurs
+    # (mêmes règles que progress.recompute_progress), sur laquelle s'appliquent
+    # ensuite les deltas
+    totaux = {formation.id: formation.total_items for formation in formations}
+    suivis = list(UserFormation.objects.all())
+    for uf in suivis:
+        key = (uf.user_id, uf.formation_id)
+        overview = 1 if (uf.completed_steps or {}).get('overview', False) else 0
+        uf.completed_items = overview + modules.get(key, 0) + ressources.get(key, 0) + quiz.get(key, 0)
+        uf.progress = min(uf.completed_items * 100 // max(totaux.get(uf.formation_id, 1), 1), 100)
+        uf.status = 'terminee' if uf.progress >= 100 else 'en_cours' if uf.progress > 0 else 'nouvelle'
+    UserFormation.objects.bulk_update(suivis, ['completed_items', 'progress', 'status'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('formation', '0015_remove_useranswer_image_response'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='formation',
+            name='total_items',
+            field=models.PositiveIntegerField(default=1, editable=False),
+        ),
+        migrations.AddField(
+            model_name='userformation',
+            name='completed_items',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(remplir_compteurs, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:29
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def remplir_scores(apps, schema_editor):
+    Question = apps.get_model('formation', 'Question')
+    UserQuiz = apps.get_model('formation', 'UserQuiz')
+    UserDomainScore = apps.get_model('formation', 'UserDomainScore')
+
+    max_par_quiz = dict(
+        Question.objects.values('quiz_id').annotate(total=Sum('point')).order_by()
+        .values_list('quiz_id', 'total')
+    )
+    cumuls = {}
+    resultats = (
+        UserQuiz.objects.filter(completed=True, quiz__formation__domain__isnull=False)
+        .values_list('user_id', 'quiz__formation__domain_id', 'quiz_id', 'score')
+    )
+    for user_id, domain_id, quiz_id, score in resultats:
+        max_points = max_par_quiz.get(quiz_id) or 0
+        cumul = cumuls.setdefault((user_id, domain_id), [0, 0, 0.0, 0])
+        cumul[0] += score
+        cumul[1] += max_points
+        cumul[2] += score * 100.0 / max_points if max_points > 0 else 0.0
+        cumul[3] += 1
+
+    UserDomainScore.objects.bulk_create([
+        UserDomainScore(
+            user_id=user_id, domain_id=domain_id,
+            total_score=total_score, total_max=total_max,
+            pct=round(float(total_score) / total_max * 100) if total_max else 0,
+            pct_sum=pct_sum, quiz_count=quiz_count,
+        )
+        for (user_id, domain_id), (total_score, total_max, pct_sum, quiz_count) in cumuls.items()
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('formation', '0017_quiz_version'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserDomainScore',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_score', models.PositiveIntegerField(default=0)),
+                ('total_max', models.PositiveIntegerField(default=0)),
+                ('pct', models.PositiveIntegerField(default=0)),
+                ('pct_sum', models.FloatField(default=0.0)),
+                ('quiz_count', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('domain', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='user_scores', to='formation.domain')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='domain_scores', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['domain', 'user'], name='formation_u_domain__9c62f8_idx')],
+                'constraints': [models.UniqueConstraint(fields=('user', 'domain'), name='unique_user_domain_score')],
+            },
+        ),
+        migrations.RunPython(remplir_scores, migrations.RunPython.noop),
+    ]
@@ -1,10 +1,9 @@
 from django.db import models
 from django.conf import settings
-from django.db.models import Sum
+from django.db.models import Sum, Exists, F, Func, OuterRef, Prefetch, Subquery
 from django.core.validators import MinValueValidator, MaxValueValidator
 from datetime import timedelta
 from decimal import Decimal
-import re
 from django.utils import timezone
 
 from personne.models import Personne
@@ -86,13 +85,55 @@ class Resource(TimedContent):
             return True
         if getattr(user, "role", None) in ALLOWED_MANAGER_ROLES:
             return True
-        print('----------------')
-        print("Equipes autorisées :", list(self.allowed_equipes.values_list('id', 'name')))
-        print(self.allowed_equipes.values_list('id', 'name','assigned_users'))
-        print(user)
-        print('----------------')
+        if not getattr(user, "is_authenticated", False):
+            return False
+        # Équipes de l'utilisateur lues une fois par requête ; allowed_equipes
+        # est lu depuis le préchargement quand il existe
+        equipe_ids = getattr(user, '_equipe_ids', None)
+        if equipe_ids is None:
+            equipe_ids = user._equipe_ids = set(user.equipes.values_list('pk', flat=True))
+        return any(equipe.pk in equipe_ids for equipe in self.allowed_equipes.all())
+
+def _subquery_aggregate(queryset, column, function, distinct=False):
+    """
+    Sous-requête scalaire "SELECT <function>(<column>) FROM ... WHERE ...",
+    sans GROUP BY, utilisable dans annotate() pour éviter une requête par ligne.
+    """
+    template = '%(function)s(DISTINCT %(expressions)s)' if distinct else '%(function)s(%(expressions)s)'
+    aggregate = Func(F(column), function=function, template=template)
+    return Subquery(queryset.order_by().annotate(_agg=aggregate).values('_agg')[:1])
+
+
+class FormationQuerySet(models.QuerySet):
+    def with_list_stats(self):
+        """
+        Annote chaque formation avec les compteurs et durées affichés par
+        FormationReadSerializer, et précharge les relations sérialisées :
+        la liste coûte alors un nombre constant de requêtes.
+        """
+        formation = OuterRef('pk')
+        modules = Formation.modules.through.objects.filter(formation=formation)
+        ressources = Formation.ressources.through.objects.filter(formation=formation)
+        equipes_du_domaine = Domain.equipes.through.objects.filter(domain=OuterRef('domain_id'))
+        membres_du_domaine = Equipe.assigned_users.through.objects.filter(equipe__domains=OuterRef('domain_id'))
+
+        return self.annotate(
+            nb_modules=_subquery_aggregate(modules, 'id', 'COUNT'),
+            nb_ressources=_subquery_aggregate(ressources, 'id', 'COUNT'),
+            quiz_exists=Exists(Quiz.objects.filter(formation=formation)),
+            nb_terminees=_subquery_aggregate(
+                UserFormation.objects.filter(formation=formation, status='terminee'), 'id', 'COUNT'),
+            modules_time=_subquery_aggregate(modules, 'module__estimated_time', 'SUM'),
+            ressources_time=_subquery_aggregate(ressources, 'resource__estimated_time', 'SUM'),
+            nb_equipes=_subquery_aggregate(equipes_du_domaine, 'id', 'COUNT'),
+            nb_personnes=_subquery_aggregate(membres_du_domaine, 'personne_id', 'COUNT', distinct=True),
+        ).select_related('created_by', 'quiz').prefetch_related(
+            Prefetch('domain', queryset=Domain.objects.annotate(nb_formations=models.Count('formations'))),
+            'modules',
+            'ressources__allowed_equipes',
+            'quiz__questions__options',
+        )
 
-        return self.allowed_equipes.filter(assigned_users=user).exists()
 
 class Formation(models.Model):
     STATUS_CHOICES = [
@@ -112,6 +153,12 @@ class Formation(models.Model):
     formateur = models.CharField(max_length=100, blank=True, null=True)
     deadline = models.DateField(blank=True, null=True)
 
+    # Nombre d'étapes comptées dans la progression : vue d'ensemble + modules
+    # + ressources + quiz. Tenu à jour par formation/signals.py.
+    total_items = models.PositiveIntegerField(default=1, editable=False)
+
+    objects = FormationQuerySet.as_manager()
+
     @property
     def total_estimated_time(self):
         """
@@ -120,6 +167,13 @@ class Formation(models.Model):
         """
         total_duration = timedelta() # Initialiser une durée de zéro
 
+        # Durées déjà calculées par FormationQuerySet.with_list_stats()
+        if hasattr(self, 'modules_time'):
+            total_duration += (self.modules_time or timedelta()) + (self.ressources_time or timedelta())
+            if hasattr(self, 'quiz') and self.quiz and self.quiz.estimated_time:
+                total_duration += self.quiz.estimated_time
+            return total_duration
+
         # 1. Ajouter la durée totale des modules
         # aggregate retourne un dictionnaire, ex: {'total_time': timedelta(...)}
         module_time = self.modules.aggregate(total_time=Sum('estimated_time'))['total_time']
@@ -164,10 +218,24 @@ class Quiz(TimedContent):
         help_text="Nombre maximal de tentatives autorisées. Laissez vide pour illimité."
     )
 
+    # Incrémentée à chaque modification des questions ou des options :
+    # invalide les corrigés compilés mis en cache (voir grading.py)
+    version = models.PositiveIntegerField(default=1, editable=False)
 
     def __str__(self):
         return f"Quiz: {self.formation.titre}"
 
+    def bump_version(self):
+        from .competences import mark_scores_dirty
+
+        Quiz.objects.filter(pk=self.pk).update(version=F('version') + 1)
+        self.refresh_from_db(fields=['version'])
+        # Les points des questions ont pu changer : le maximum par domaine aussi
+        mark_scores_dirty(
+            self.userquiz_set.values_list('user_id', flat=True),
+            Formation.objects.filter(pk=self.formation_id).values_list('domain_id', flat=True),
+        )
+
 class Question(models.Model):
     TYPE_CHOICES = [
         ('single_choice', 'Un choix'),
@@ -190,41 +258,15 @@ class Question(models.Model):
         """
         Calcule et retourne le score pour une réponse donnée, en fonction du type de question.
         """
-        if self.type == 'single_choice' or self.type == 'multiple_choice':
-            if not selected_option_ids:
-                return 0
-            
-            # Récupérer les IDs de toutes les options correctes pour cette question
-            correct_option_ids = set(self.options.filter(is_correct=True).values_list('id', flat=True))
-            
-            # Vérifier si l'ensemble des réponses de l'utilisateur est identique à l'ensemble des réponses correctes
-            if correct_option_ids == set(selected_option_ids):
-                return self.point
-            return 0
+        from .grading import normalize_keywords, score_answer
 
-        elif self.type == 'text' or self.type == 'image_text':
-            # Logique pour la correspondance à 50% des mots-clés
-            if not text_response or not self.correct_keywords:
-                return 0
+        correct_option_ids = []
+        if self.type in ('single_choice', 'multiple_choice') and selected_option_ids:
+            # Récupérer les IDs de toutes les options correctes pour cette question
+            correct_option_ids = self.options.filter(is_correct=True).values_list('id', flat=True)
+        return score_answer(self.type, self.point, correct_option_ids,
+                            normalize_keywords(self.correct_keywords), selected_option_ids, text_response)
 
-            # Normaliser le texte de l'utilisateur et les mots-clés (insensible à la casse)
-            user_words = set(re.split(r'\s+|,|\.', text_response.lower()))
-            keywords_to_find = [kw.lower() for kw in self.correct_keywords]
-            
-            # Compter combien de mots-clés sont trouvés
-            found_count = 0
-            for keyword in keywords_to_find:
-                if keyword in user_words:
-                    found_count += 1
-            
-            total_keywords = len(keywords_to_find)
-            
-            # Vérifier si le ratio atteint le seuil de 50%
-            if (found_count / total_keywords) >= 0.5:
-                return self.point
-            return 0
-            
-        return 0
 class Option(models.Model):
     question = models.ForeignKey(Question, on_delete=models.CASCADE, related_name='options')
     texte = models.CharField(max_length=255)
@@ -233,6 +275,12 @@ class Option(models.Model):
     def __str__(self):
         return self.texte
 
+
+def quiz_max_points(quiz_ref='pk'):
+    """Sous-requête : total des points des questions du quiz référencé par `quiz_ref`."""
+    return _subquery_aggregate(Question.objects.filter(quiz=OuterRef(quiz_ref)), 'point', 'SUM')
+
+
 class UserFormation(models.Model):
     STATUS_CHOICES = [
         ('nouvelle', 'Nouvelle'),
@@ -245,6 +293,9 @@ class UserFormation(models.Model):
     progress = models.PositiveIntegerField(default=0)
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='nouvelle')
     completed_steps = models.JSONField(default=dict, blank=True)
+    # Étapes terminées (vue d'ensemble, modules, ressources, quiz) ;
+    # progress = completed_items * 100 // formation.total_items
+    completed_items = models.PositiveIntegerField(default=0, editable=False)
 
     time_spent = models.DurationField(default=timedelta(0))
     last_accessed = models.DateTimeField(null=True, blank=True)
@@ -257,70 +308,62 @@ class UserFormation(models.Model):
         self.last_accessed = timezone.now()
         self.save(update_fields=['last_accessed'])
     
+    def mark_overview_done(self):
+        """
+        Coche l'onglet "vue d'ensemble" (sans enregistrer). Retourne 1 s'il
+        vient d'être terminé, 0 sinon : c'est le delta de completed_items.
+        """
+        if self.completed_steps is None:
+            self.completed_steps = {}
+        if self.completed_steps.get('overview', False):
+            return 0
+        self.completed_steps['overview'] = True
+        return 1
+
     def update_progress(self):
-        print("✅ CHECK 5: DANS la méthode 'update_progress'.")
         """
-        Calculates and updates the user's progress for this formation.
-        Also updates the status based on the progress.
+        Recalcule entièrement la progression depuis les UserModule / UserResource /
+        UserQuiz. Les complétions courantes passent par des deltas atomiques
+        (formation.progress.apply_progress_delta) ; ce recalcul sert à la
+        création du suivi et à la réconciliation.
+        """
+        from .progress import recompute_progress
+
+        recompute_progress([self])
+
+
+class CompletionTrackedModel(models.Model):
+    """
+    Mémorise l'état "terminé" lu en base, pour que les signaux ne comptent
+    que les transitions (non terminé → terminé) dans la progression.
+    """
+    completion_field = None
+
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._was_completed = instance.__dict__.get(cls.completion_field)
+        return instance
+
+    def completion_delta(self, created):
+        """
+        +1 / -1 / 0 selon la transition depuis le dernier chargement ou
+        enregistrement ; None si l'état précédent est inconnu.
         """
-        # Count total items in the formation
-        total_modules = self.formation.modules.count()
-        total_resources = self.formation.ressources.count()
-        has_quiz = 1 if hasattr(self.formation, 'quiz') else 0
-
-        overview_item = 1 
-        total_items = overview_item + total_modules + total_resources + has_quiz
-
-        if total_items == 0:
-            self.progress = 100
-            self.status = 'terminee'
-            self.save()
-            return
-
-        # Count completed items for the user
-        # We need to filter by the modules/resources that belong to THIS formation
-
-        completed_overview = 1 if self.completed_steps.get('overview', False) else 0
-
-        completed_modules = UserModule.objects.filter(
-            user=self.user, 
-            module__in=self.formation.modules.all(), 
-            completed=True
-        ).count()
-        
-        completed_resources = UserResource.objects.filter(
-            user=self.user, 
-            resource__in=self.formation.ressources.all(), 
-            read=True
-        ).count()
-
-        quiz_completed = 0
-        if has_quiz:
-            quiz_completed = UserQuiz.objects.filter(
-                user=self.user, 
-                quiz=self.formation.quiz, 
-                completed=True
-            ).count()
-
-        completed_items = completed_overview + completed_modules + completed_resources + quiz_completed
-        
-        # Calculate progress percentage
-        self.progress = int((completed_items / total_items) * 100)
-
-
-        # Update status
-        if self.progress == 100:
-
-            self.status = 'terminee'
-        elif self.progress > 0:
-            self.status = 'en_cours'
-        else:
-            self.status = 'nouvelle'
-
-        
-        self.save()
-
-class UserModule(models.Model):
+        now = bool(getattr(self, self.completion_field))
+        before = False if created else getattr(self, '_was_completed', None)
+        self._was_completed = now
+        if before is None:
+            return None
+        return int(now) - int(before)
+
+
+class UserModule(CompletionTrackedModel):
+    completion_field = 'completed'
+
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     module = models.ForeignKey(Module, on_delete=models.CASCADE)
     completed = models.BooleanField(default=False)
@@ -328,7 +371,9 @@ class UserModule(models.Model):
     def __str__(self):
         return f"{self.user} - {self.module.titre}"
 
-class UserResource(models.Model):
+class UserResource(CompletionTrackedModel):
+    completion_field = 'read'
+
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     resource = models.ForeignKey(Resource, on_delete=models.CASCADE)
     read = models.BooleanField(default=False)
@@ -336,7 +381,9 @@ class UserResource(models.Model):
     def __str__(self):
         return f"{self.user} - {self.resource.name}"
 
-class UserQuiz(models.Model):
+class UserQuiz(CompletionTrackedModel):
+    completion_field = 'completed'
+
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     quiz = models.ForeignKey(Quiz, on_delete=models.CASCADE)
     completed = models.BooleanField(default=False)
@@ -381,3 +428,29 @@ class UserQuizHistory(models.Model):
         formatted_date = self.completed_at.strftime('%d/%m/%Y %H:%M') if self.completed_at else 'N/A'
         return f"Archive : {self.user} - {self.formation.titre} (Passé le {formatted_date})"
 
+
+class UserDomainScore(models.Model):
+    """
+    Résultats des quiz terminés d'un utilisateur, cumulés par domaine.
+    Tenus à jour à chaque quiz terminé ou réinitialisé (voir competences.py),
+    ils alimentent competence_table et radar_scores sans relire UserQuiz.
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='domain_scores')
+    domain = models.ForeignKey(Domain, on_delete=models.CASCADE, related_name='user_scores')
+    total_score = models.PositiveIntegerField(default=0)
+    total_max = models.PositiveIntegerField(default=0)
+    # round(total_score * 100 / total_max), 0 si aucun point possible
+    pct = models.PositiveIntegerField(default=0)
+    # Somme des % de chaque quiz et nombre de quiz : moyenne par quiz du radar
+    pct_sum = models.FloatField(default=0.0)
+    quiz_count = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['domain', 'user'])]
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'domain'], name='unique_user_domain_score'),
+        ]
+
+    def __str__(self):
+        return f"{self.user} - {self.domain} : {self.pct}%"
@@ -0,0 +1,71 @@
+"""
+Changements accumulés pendant une transaction et appliqués une seule fois,
+à sa validation (progression des suivis, scores par domaine).
+"""
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+
+class _Scheduled:
+    """Objet en attente et le callback on_commit qui l'applique."""
+
+    def __init__(self, pending):
+        self.pending = pending
+        self.scheduled = True
+        # Méthode liée créée une fois : son identité sert à retrouver le callback
+        self.callback = self.flush
+
+    def flush(self):
+        self.scheduled = False
+        self.pending.flush()
+
+    def is_live(self, connection):
+        """
+        Vrai tant que le callback n'a pas été appelé et que Django le garde :
+        un rollback (de la transaction ou du point de sauvegarde où il a été
+        enregistré) retire le callback de connection.run_on_commit.
+        """
+        return self.scheduled and any(func is self.callback for _, func, _ in connection.run_on_commit)
+
+
+class PerTransaction:
+    """
+    Un objet `factory()` par point de sauvegarde actif (bloc atomic()) et par
+    connexion : créé au premier appel de get() dans ce bloc, sa méthode
+    flush() est appelée une fois à la validation de la transaction. Les
+    changements d'un bloc imbriqué annulé disparaissent avec lui, Django
+    abandonnant les callbacks enregistrés depuis son point de sauvegarde.
+    """
+
+    def __init__(self, name, factory):
+        self.attr = f'_formation_pending_{name}'
+        self.factory = factory
+
+    def _entries(self, connection):
+        """Objets encore programmés, par identifiants de points de sauvegarde."""
+        entries = {
+            sids: entry for sids, entry in getattr(connection, self.attr, {}).items()
+            if entry.is_live(connection)
+        }
+        setattr(connection, self.attr, entries)
+        return entries
+
+    def get(self, using=DEFAULT_DB_ALIAS):
+        """Objet du bloc atomic() en cours, None hors transaction."""
+        connection = transaction.get_connection(using)
+        if not connection.in_atomic_block:
+            return None
+        # Mêmes identifiants que ceux associés par Django au callback
+        sids = tuple(sid for sid in connection.savepoint_ids if sid)
+        entries = self._entries(connection)
+        entry = entries.get(sids)
+        if entry is None:
+            entry = entries[sids] = _Scheduled(self.factory())
+            transaction.on_commit(entry.callback, using=using)
+        return entry.pending
+
+    def all(self, using=DEFAULT_DB_ALIAS):
+        """Objets encore programmés dans la transaction en cours (blocs englobants compris)."""
+        connection = transaction.get_connection(using)
+        if not connection.in_atomic_block:
+            return []
+        return [entry.pending for entry in self._entries(connection).values()]
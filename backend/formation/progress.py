@@ -0,0 +1,372 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import Case, Count, F, OuterRef, Q, Subquery, Value, When, Window
+from django.db.models.functions import Greatest, Least, RowNumber
+from django.db.models.lookups import GreaterThan, GreaterThanOrEqual
+
+from .models import (
+    Domain, Equipe, Formation, Quiz, UserAnswer, UserFormation, UserModule, UserQuiz,
+    UserQuizHistory, UserResource,
+)
+from .pending import PerTransaction
+
+BATCH_SIZE = 500
+# Nombre de tentatives de quiz archivées par utilisateur lors d'une réinitialisation
+HISTORY_DEPTH = 3
+
+
+class CompletionMatrix:
+    """
+    Matrice équipe × formation : nombre de membres de chaque équipe et
+    nombre de membres distincts ayant terminé (progress >= 100) chaque
+    formation. Calculée en deux requêtes groupées, quel que soit le nombre
+    d'équipes et de formations.
+    """
+
+    def __init__(self, formation_ids, equipe_ids):
+        formation_ids = list(formation_ids)
+        equipe_ids = list(equipe_ids)
+
+        membres = (
+            Equipe.assigned_users.through.objects
+            .filter(equipe_id__in=equipe_ids)
+            .values('equipe_id')
+            .annotate(n=Count('personne_id'))
+            .order_by()
+        )
+        self.totals = {row['equipe_id']: row['n'] for row in membres}
+
+        terminees = (
+            UserFormation.objects
+            .filter(formation_id__in=formation_ids, progress__gte=100, user__equipes__in=equipe_ids)
+            .values('user__equipes', 'formation_id')
+            .annotate(n=Count('user_id', distinct=True))
+            .order_by()
+        )
+        self.completed = {(row['user__equipes'], row['formation_id']): row['n'] for row in terminees}
+
+    def total(self, equipe_id):
+        return self.totals.get(equipe_id, 0)
+
+    def completed_count(self, equipe_id, formation_id):
+        return self.completed.get((equipe_id, formation_id), 0)
+
+
+def teams_progress_by_formation(formations):
+    """
+    Retourne {formation_id: [{'name', 'completed', 'total'}, ...]} pour les
+    équipes du domaine de chaque formation ; les équipes vides sont omises.
+    """
+    formations = list(formations)
+    domain_ids = {f.domain_id for f in formations if f.domain_id}
+
+    equipes_par_domaine = {}
+    liens = (
+        Domain.equipes.through.objects
+        .filter(domain_id__in=domain_ids)
+        .values_list('domain_id', 'equipe_id', 'equipe__name')
+        .order_by('equipe_id')
+    )
+    for domain_id, equipe_id, name in liens:
+        equipes_par_domaine.setdefault(domain_id, []).append((equipe_id, name))
+
+    equipe_ids = {equipe_id for equipes in equipes_par_domaine.values() for equipe_id, _ in equipes}
+    matrix = CompletionMatrix([f.pk for f in formations], equipe_ids)
+
+    result = {}
+    for formation in formations:
+        teams = []
+        for equipe_id, name in equipes_par_domaine.get(formation.domain_id, []):
+            total = matrix.total(equipe_id)
+            if total == 0:
+                continue
+            teams.append({
+                'name': name,
+                'completed': matrix.completed_count(equipe_id, formation.pk),
+                'total': total,
+            })
+        result[formation.pk] = teams
+    return result
+
+
+# ----------------------------------------------------------------------
+# Progression individuelle (UserFormation.completed_items / progress)
+# ----------------------------------------------------------------------
+def _status_for(progress):
+    if progress >= 100:
+        return 'terminee'
+    if progress > 0:
+        return 'en_cours'
+    return 'nouvelle'
+
+
+def refresh_total_items(formation_ids):
+    """
+    Recalcule Formation.total_items (vue d'ensemble + modules + ressources
+    + quiz) pour les formations données. Retourne les ids modifiés.
+    """
+    formation_ids = set(formation_ids)
+    totals = dict.fromkeys(formation_ids, 1)
+    for through in (Formation.modules.through, Formation.ressources.through):
+        counts = (
+            through.objects.filter(formation_id__in=formation_ids)
+            .values('formation_id').annotate(n=Count('id')).order_by()
+        )
+        for row in counts:
+            totals[row['formation_id']] += row['n']
+    for formation_id in Quiz.objects.filter(formation_id__in=formation_ids).values_list('formation_id', flat=True):
+        totals[formation_id] += 1
+
+    modifiees = [
+        Formation(pk=pk, total_items=totals[pk])
+        for pk, total in Formation.objects.filter(pk__in=formation_ids).values_list('pk', 'total_items')
+        if total != totals[pk]
+    ]
+    Formation.objects.bulk_update(modifiees, ['total_items'], batch_size=BATCH_SIZE)
+    return {f.pk for f in modifiees}
+
+
+def apply_progress_delta(user_id, formation_ids, delta):
+    """
+    Ajoute `delta` étapes terminées aux suivis (user, formations) et recalcule
+    progress / status dans le même UPDATE, sans lire les lignes.
+    """
+    if not delta or not formation_ids:
+        return 0
+    completed = Greatest(F('completed_items') + delta, Value(0))
+    total = Subquery(Formation.objects.filter(pk=OuterRef('formation_id')).values('total_items')[:1])
+    progress = Least(completed * 100 / total, Value(100))
+    return UserFormation.objects.filter(user_id=user_id, formation_id__in=formation_ids).update(
+        completed_items=completed,
+        progress=progress,
+        status=Case(
+            When(GreaterThanOrEqual(progress, 100), then=Value('terminee')),
+            When(GreaterThan(progress, 0), then=Value('en_cours')),
+            default=Value('nouvelle'),
+        ),
+    )
+
+
+def _grouped_counts(queryset, formation_field):
+    counts = queryset.values('user_id', formation_field).annotate(n=Count('id')).order_by()
+    return {(row['user_id'], row[formation_field]): row['n'] for row in counts}
+
+
+def recompute_progress(user_formations):
+    """
+    Recalcule completed_items / progress / status depuis les tables de suivi,
+    en quelques requêtes groupées quel que soit le nombre de suivis.
+    `user_formations` : queryset ou liste de UserFormation (le completed_steps
+    en mémoire est pris en compte). Retourne le nombre de suivis corrigés.
+    """
+    user_formations = list(user_formations)
+    if not user_formations:
+        return 0
+    user_ids = {uf.user_id for uf in user_formations}
+    formation_ids = {uf.formation_id for uf in user_formations}
+
+    totals = dict(Formation.objects.filter(pk__in=formation_ids).values_list('pk', 'total_items'))
+    modules = _grouped_counts(
+        UserModule.objects.filter(user_id__in=user_ids, completed=True, module__formations__in=formation_ids),
+        'module__formations')
+    ressources = _grouped_counts(
+        UserResource.objects.filter(user_id__in=user_ids, read=True, resource__formations__in=formation_ids),
+        'resource__formations')
+    quiz = _grouped_counts(
+        UserQuiz.objects.filter(user_id__in=user_ids, completed=True, quiz__formation_id__in=formation_ids),
+        'quiz__formation_id')
+
+    corriges = []
+    for uf in user_formations:
+        key = (uf.user_id, uf.formation_id)
+        overview = 1 if (uf.completed_steps or {}).get('overview', False) else 0
+        completed = overview + modules.get(key, 0) + ressources.get(key, 0) + quiz.get(key, 0)
+        progress = min(completed * 100 // max(totals.get(uf.formation_id, 1), 1), 100)
+        status = _status_for(progress)
+        if (uf.completed_items, uf.progress, uf.status) != (completed, progress, status):
+            uf.completed_items, uf.progress, uf.status = completed, progress, status
+            corriges.append(uf)
+
+    UserFormation.objects.bulk_update(corriges, ['completed_items', 'progress', 'status'], batch_size=BATCH_SIZE)
+    return len(corriges)
+
+
+def reset_progress(formation, user_ids):
+    """
+    Réinitialise `formation` pour les utilisateurs donnés (liste ou
+    sous-requête d'ids), en un nombre de requêtes indépendant du nombre de
+    suivis : archivage des HISTORY_DEPTH dernières tentatives de quiz de
+    chacun (bulk_create), une suppression par table de suivi, une mise à jour
+    des suivis, puis recalcul des formations qui partagent des étapes avec
+    celle-ci. Retourne le nombre de suivis réinitialisés.
+    """
+    tentatives = UserQuiz.objects.filter(user_id__in=user_ids, quiz__in=Quiz.objects.filter(formation=formation))
+    with transaction.atomic():
+        derniers = (
+            tentatives
+            .annotate(rang=Window(RowNumber(), partition_by=[F('user_id')], order_by=F('completed_at').desc()))
+            .filter(rang__lte=HISTORY_DEPTH)
+            .values('user_id', 'score', 'completed_at', 'time_spent')
+        )
+        UserQuizHistory.objects.bulk_create(
+            (UserQuizHistory(formation=formation, **tentative) for tentative in derniers.iterator(chunk_size=BATCH_SIZE)),
+            batch_size=BATCH_SIZE,
+        )
+
+        UserModule.objects.filter(user_id__in=user_ids, module__in=formation.modules.all()).delete()
+        UserResource.objects.filter(user_id__in=user_ids, resource__in=formation.ressources.all()).delete()
+        # post_delete marque les scores par domaine des utilisateurs touchés :
+        # ils sont recalculés une seule fois, à la validation
+        tentatives.delete()
+        UserAnswer.objects.filter(user_id__in=user_ids, question__quiz__formation=formation).delete()
+
+        reinitialises = UserFormation.objects.filter(user_id__in=user_ids, formation=formation).update(
+            progress=0,
+            completed_items=0,
+            status='nouvelle',
+            completed_steps={},
+            last_accessed=None,
+            time_spent=timedelta(0),
+        )
+
+        # Les modules/ressources supprimés peuvent compter dans d'autres formations
+        recompute_shared_progress(user_ids, formation)
+    return reinitialises
+
+
+def recompute_shared_progress(user_ids, formation):
+    """
+    Après la réinitialisation de `formation`, recalcule les suivis des autres
+    formations qui partagent des modules ou des ressources avec elle.
+    """
+    partagees = Formation.objects.filter(
+        Q(modules__formations=formation) | Q(ressources__formations=formation)
+    ).exclude(pk=formation.pk).values('pk')
+    return recompute_progress(
+        UserFormation.objects.filter(user_id__in=user_ids, formation_id__in=partagees)
+    )
+
+
+# ----------------------------------------------------------------------
+# Suivis "sales" de la transaction courante
+# ----------------------------------------------------------------------
+class PendingProgress:
+    """
+    Suivis (user, formation) touchés pendant une transaction : deltas cumulés
+    et suivis à recalculer entièrement. Appliqués une seule fois à la
+    validation, quel que soit le nombre d'étapes enregistrées entre-temps.
+    """
+
+    def __init__(self):
+        self.deltas = defaultdict(int)
+        self.recompute = set()
+
+    def add(self, user_id, formation_ids, delta):
+        for formation_id in formation_ids:
+            if delta is None:
+                self.recompute.add((user_id, formation_id))
+            else:
+                self.deltas[(user_id, formation_id)] += delta
+
+    def flush(self):
+        keys = set(self.deltas) | self.recompute
+        if not keys:
+            return
+        user_ids = {user_id for user_id, _ in keys}
+        formation_ids = {formation_id for _, formation_id in keys}
+
+        with transaction.atomic():
+            existants = set(
+                UserFormation.objects
+                .filter(user_id__in=user_ids, formation_id__in=formation_ids)
+                .values_list('user_id', 'formation_id')
+            )
+            # Chaque étape terminée crée le suivi des formations qui la contiennent
+            nouveaux = sorted(keys - existants)
+            UserFormation.objects.bulk_create(
+                [UserFormation(user_id=user_id, formation_id=formation_id) for user_id, formation_id in nouveaux],
+                batch_size=BATCH_SIZE,
+            )
+            a_recalculer = self.recompute | set(nouveaux)
+
+            groupes = defaultdict(list)
+            for (user_id, formation_id), delta in self.deltas.items():
+                if delta and (user_id, formation_id) not in a_recalculer:
+                    groupes[(user_id, delta)].append(formation_id)
+            for (user_id, delta), ids in groupes.items():
+                apply_progress_delta(user_id, ids, delta)
+
+            if a_recalculer:
+                candidats = UserFormation.objects.filter(
+                    user_id__in={user_id for user_id, _ in a_recalculer},
+                    formation_id__in={formation_id for _, formation_id in a_recalculer},
+                )
+                recompute_progress(uf for uf in candidats if (uf.user_id, uf.formation_id) in a_recalculer)
+
+        self.deltas.clear()
+        self.recompute.clear()
+
+
+_pending_progress = PerTransaction('progress', PendingProgress)
+
+
+def mark_progress_dirty(user_id, formation_ids, delta, using=DEFAULT_DB_ALIAS):
+    """
+    Enregistre un changement de progression pour (user, formations) : `delta`
+    étapes terminées, ou None pour un recalcul complet. Dans une transaction,
+    les changements sont regroupés et appliqués une fois à la validation ;
+    hors transaction, ils sont appliqués immédiatement.
+    """
+    formation_ids = list(formation_ids)
+    if not formation_ids:
+        return
+    pending = _pending_progress.get(using)
+    if pending is None:
+        pending = PendingProgress()
+        pending.add(user_id, formation_ids, delta)
+        pending.flush()
+        return
+    pending.add(user_id, formation_ids, delta)
+
+
+def mark_resources_read(user_id, formation):
+    """
+    Marque comme lues toutes les ressources de `formation` pour l'utilisateur :
+    un UPDATE pour les suivis existants non lus, un bulk_create pour les
+    manquants, puis un seul changement de progression par formation touchée.
+    """
+    through = Formation.ressources.through
+    resource_ids = set(through.objects.filter(formation_id=formation.pk).values_list('resource_id', flat=True))
+    if not resource_ids:
+        return 0
+
+    with transaction.atomic():
+        existants = UserResource.objects.filter(user_id=user_id, resource_id__in=resource_ids)
+        deja_lues = set(existants.filter(read=True).values_list('resource_id', flat=True))
+        connues = set(existants.values_list('resource_id', flat=True))
+        nouvelles = resource_ids - deja_lues
+
+        existants.filter(read=False).update(read=True)
+        UserResource.objects.bulk_create(
+            [UserResource(user_id=user_id, resource_id=resource_id, read=True)
+             for resource_id in sorted(resource_ids - connues)],
+            batch_size=BATCH_SIZE,
+        )
+
+        # Chaque formation contenant une de ces ressources a un suivi, comme
+        # lors d'un enregistrement unitaire ; le delta compte les nouvelles lectures.
+        par_formation = (
+            through.objects.filter(resource_id__in=resource_ids)
+            .values('formation_id')
+            .annotate(n=Count('id', filter=Q(resource_id__in=nouvelles)))
+            .order_by()
+        )
+        groupes = defaultdict(list)
+        for row in par_formation:
+            groupes[row['n']].append(row['formation_id'])
+        for delta, formation_ids in groupes.items():
+            mark_progress_dirty(user_id, formation_ids, delta)
+
+    return len(nouvelles)
@@ -1,5 +1,7 @@
 from rest_framework import serializers
 from .models import *
+from .grading import answer_key_cache
+from .progress import teams_progress_by_formation
 from personne.models import Personne
 from django.core.exceptions import ObjectDoesNotExist
 from django.db import transaction
@@ -47,6 +49,9 @@ class DomainSerializer(serializers.ModelSerializer):
         ]
 
     def get_formation_count(self, obj):
+        # Annotation fournie par les requêtes qui sérialisent beaucoup de domaines
+        if hasattr(obj, 'nb_formations'):
+            return obj.nb_formations
         return obj.formations.count()
 
 class EquipeSerializer(serializers.ModelSerializer):
@@ -218,16 +223,26 @@ class FormationReadSerializer(serializers.ModelSerializer):
         except ObjectDoesNotExist:
             return None
     
+    # Les annotations viennent de Formation.objects.with_list_stats() ;
+    # sans elles (écriture, appel direct), on retombe sur les requêtes unitaires.
     def get_has_quiz(self, obj):
         """Renvoie True si un quiz existe pour cette formation."""
+        if hasattr(obj, 'quiz_exists'):
+            return obj.quiz_exists
         return Quiz.objects.filter(formation=obj).exists()
     
     def get_module_count(self, obj):
+        if hasattr(obj, 'nb_modules'):
+            return obj.nb_modules
         return obj.modules.count()
     def get_resource_count(self, obj):  
+        if hasattr(obj, 'nb_ressources'):
+            return obj.nb_ressources
         return obj.ressources.count()
 
     def get_passed_count(self, obj):
+        if hasattr(obj, 'nb_terminees'):
+            return obj.nb_terminees
         return obj.userformation_set.filter(status='terminee').count()
     
     def get_total_estimated_time(self, obj):
@@ -250,34 +265,22 @@ class FormationReadSerializer(serializers.ModelSerializer):
     
     def get_assigned_team_count(self, obj):
         """Retourne le nombre d'équipes assignées à la formation via son domaine."""
+        if hasattr(obj, 'nb_equipes'):
+            return obj.nb_equipes
         return obj.assigned_teams.count()
 
     def get_assigned_person_count(self, obj):
         """Retourne le nombre de personnes uniques dans les équipes assignées."""
+        if hasattr(obj, 'nb_personnes'):
+            return obj.nb_personnes
         return obj.assigned_persons.count()
     
     def get_teams_progress(self, obj):
-        assigned_teams = obj.assigned_teams.all()
-        result = []
-
-        for team in assigned_teams:
-            total_members = team.assigned_users.count()
-            if total_members == 0:
-                continue
-
-            completed_members = Personne.objects.filter(
-                equipes=team,
-                userformation__formation=obj,
-                userformation__progress__gte=100
-            ).distinct().count()
-
-            result.append({
-                'name': team.name,
-                'completed': completed_members,
-                'total': total_members,
-            })
-
-        return result
+        # Les listes passent la progression de toutes leurs formations dans le contexte
+        progress = self.context.get('teams_progress')
+        if progress is None:
+            progress = teams_progress_by_formation([obj])
+        return progress.get(obj.pk, [])
 
 class FormationWriteSerializer(serializers.ModelSerializer):
     module_count = serializers.SerializerMethodField()
@@ -598,6 +601,9 @@ class FormationWriteSerializer(serializers.ModelSerializer):
                             Option(question=new_question, **opt) for opt in options_data
                         ])
 
+            # Les corrigés compilés de l'ancienne version ne sont plus valables
+            existing_quiz.bump_version()
+
         elif existing_quiz:
             # Le frontend n'a envoyé aucune donnée de quiz, cela signifie qu'il faut le supprimer
             existing_quiz.delete()
@@ -797,8 +803,11 @@ class QuizSubmitSerializer(serializers.Serializer):
 
     # ex. de validation supplémentaire
     def validate_answers(self, answers):
-        quiz = self.context['quiz']
-        valid_ids = {q.id for q in quiz.questions.all()}
+        key = self.context.get('answer_key')
+        if key is not None:
+            valid_ids = key.question_ids
+        else:
+            valid_ids = {q.id for q in self.context['quiz'].questions.all()}
         for ans in answers:
             if ans['question_id'] not in valid_ids:
                 raise serializers.ValidationError(
@@ -838,6 +847,9 @@ class QuizAnswerDetailSerializer(serializers.ModelSerializer):
             return 0
             
         selected_ids = list(user_answer.selected_options.values_list('id', flat=True))
+        key = self.context.get('answer_key')
+        if key is not None and obj.id in key.question_ids:
+            return key.score(obj.id, selected_option_ids=selected_ids, text_response=user_answer.text_response)
         return obj.get_score_for_answer(selected_option_ids=selected_ids, text_response=user_answer.text_response)
 
 
@@ -860,7 +872,8 @@ class QuizResultSerializer(serializers.ModelSerializer):
 
     def get_detail_des_reponses(self, obj):
         questions = obj.quiz.questions.all()
-        return QuizAnswerDetailSerializer(questions, many=True, context=self.context).data
+        context = {**self.context, 'answer_key': answer_key_cache.get(obj.quiz)}
+        return QuizAnswerDetailSerializer(questions, many=True, context=context).data
 
 class ChapterProgressSerializer(serializers.ModelSerializer):
     status = serializers.SerializerMethodField()
@@ -871,8 +884,12 @@ class ChapterProgressSerializer(serializers.ModelSerializer):
         fields = ('id', 'titre', 'description', 'status', 'estimated_time_min')
 
     def get_status(self, obj):
-        user = self.context.get('user')
-        completed = UserModule.objects.filter(user=user, module=obj, completed=True).exists()
+        completed_ids = self.context.get('completed_module_ids')
+        if completed_ids is not None:
+            completed = obj.pk in completed_ids
+        else:
+            user = self.context.get('user')
+            completed = UserModule.objects.filter(user=user, module=obj, completed=True).exists()
         return "Terminé" if completed else "À faire"
         
     def get_estimated_time_min(self, obj):
@@ -958,7 +975,12 @@ class FormationProgressSerializer(serializers.ModelSerializer):
 
     def get_progression_par_chapitre(self, obj):
         modules = obj.modules.all().order_by('id') # ou un autre champ d'ordre
-        return ChapterProgressSerializer(modules, many=True, context=self.context).data
+        # Modules terminés lus en une requête pour tous les chapitres
+        completed_ids = set(UserModule.objects.filter(
+            user=self.context.get('user'), module__in=modules, completed=True
+        ).values_list('module_id', flat=True))
+        context = {**self.context, 'completed_module_ids': completed_ids}
+        return ChapterProgressSerializer(modules, many=True, context=context).data
 
     def get_resultats_du_quiz(self, obj):
         user = self.context.get('user')
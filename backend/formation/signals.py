@@ -1,35 +1,108 @@
 # formation/signals.py
 
-from django.db import transaction # <--- AJOUTEZ CET IMPORT
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
 from django.dispatch import receiver
-from .models import UserModule, UserResource, UserQuiz, UserFormation
+from .competences import forget_quiz_domains, mark_scores_dirty, quiz_domain_ids
+from .models import Formation, Module, Quiz, Resource, UserModule, UserResource, UserQuiz, UserFormation
+from .progress import mark_progress_dirty, recompute_progress, refresh_total_items
+
+
+def _on_step_saved(instance, created, formation_ids):
+    """
+    Répercute l'enregistrement d'une étape sur les suivis des formations qui la
+    contiennent. Les suivis touchés sont regroupés par transaction et mis à
+    jour une seule fois à la validation (delta atomique, ou recalcul complet
+    si l'état précédent de l'étape est inconnu).
+    """
+    mark_progress_dirty(instance.user_id, formation_ids, instance.completion_delta(created))
+
 
 @receiver(post_save, sender=UserModule)
-def on_user_module_complete(sender, instance, **kwargs):
-    for formation in instance.module.formations.all():
-        user_formation, created = UserFormation.objects.get_or_create(
-            user=instance.user,
-            formation=formation
-        )
-        # On attend que la transaction soit validée avant de lancer le calcul
-        transaction.on_commit(lambda: user_formation.update_progress())
+def on_user_module_complete(sender, instance, created, **kwargs):
+    formation_ids = instance.module.formations.values_list('id', flat=True)
+    _on_step_saved(instance, created, formation_ids)
 
 @receiver(post_save, sender=UserResource)
-def on_user_resource_read(sender, instance, **kwargs):
-    for formation in instance.resource.formations.all():
-        user_formation, created = UserFormation.objects.get_or_create(
-            user=instance.user,
-            formation=formation
-        )
-        # On attend que la transaction soit validée avant de lancer le calcul
-        transaction.on_commit(lambda: user_formation.update_progress())
+def on_user_resource_read(sender, instance, created, **kwargs):
+    formation_ids = instance.resource.formations.values_list('id', flat=True)
+    _on_step_saved(instance, created, formation_ids)
 
 @receiver(post_save, sender=UserQuiz)
-def on_user_quiz_complete(sender, instance, **kwargs):
-    user_formation, created = UserFormation.objects.get_or_create(
-        user=instance.user,
-        formation=instance.quiz.formation
-    )
-    # On attend que la transaction soit validée avant de lancer le calcul
-    transaction.on_commit(lambda: user_formation.update_progress())
\ No newline at end of file
+def on_user_quiz_complete(sender, instance, created, **kwargs):
+    _on_step_saved(instance, created, [instance.quiz.formation_id])
+
+@receiver(post_save, sender=UserFormation)
+def on_user_formation_created(sender, instance, created, **kwargs):
+    # L'utilisateur a pu terminer des étapes partagées avec d'autres formations
+    if created:
+        mark_progress_dirty(instance.user_id, [instance.formation_id], None)
+
+
+# --- Nombre total d'étapes des formations ---------------------------------
+def _refresh_formations(formation_ids):
+    """Recalcule total_items puis la progression de tous les inscrits, après validation."""
+    formation_ids = set(formation_ids)
+    if not formation_ids:
+        return
+
+    def refresh():
+        refresh_total_items(formation_ids)
+        recompute_progress(UserFormation.objects.filter(formation_id__in=formation_ids))
+
+    transaction.on_commit(refresh)
+
+
+@receiver(m2m_changed, sender=Formation.modules.through)
+@receiver(m2m_changed, sender=Formation.ressources.through)
+def on_formation_content_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse:
+        # module.formations / resource.formations : pk_set contient des formations
+        if action == 'pre_clear':
+            instance._formations_avant_clear = list(instance.formations.values_list('id', flat=True))
+        elif action == 'post_clear':
+            _refresh_formations(getattr(instance, '_formations_avant_clear', []))
+        elif action in ('post_add', 'post_remove'):
+            _refresh_formations(pk_set)
+    elif action in ('post_add', 'post_remove', 'post_clear'):
+        _refresh_formations([instance.pk])
+
+@receiver(pre_delete, sender=Module)
+@receiver(pre_delete, sender=Resource)
+def on_content_deleted(sender, instance, **kwargs):
+    # Les liens vers les formations disparaissent avec l'objet, sans m2m_changed
+    _refresh_formations(instance.formations.values_list('id', flat=True))
+
+@receiver(post_save, sender=Quiz)
+def on_quiz_created(sender, instance, created, **kwargs):
+    if created:
+        _refresh_formations([instance.formation_id])
+
+@receiver(post_delete, sender=Quiz)
+def on_quiz_deleted(sender, instance, **kwargs):
+    _refresh_formations([instance.formation_id])
+
+
+# --- Scores par domaine (UserDomainScore) ----------------------------------
+@receiver(post_save, sender=UserQuiz)
+@receiver(post_delete, sender=UserQuiz)
+def on_user_quiz_scored(sender, instance, **kwargs):
+    # Quiz terminé, re-noté ou réinitialisé : le domaine est lu tout de suite,
+    # la formation pouvant disparaître dans la même transaction
+    mark_scores_dirty([instance.user_id], quiz_domain_ids(instance.quiz_id))
+
+@receiver(pre_save, sender=Formation)
+def on_formation_saving(sender, instance, **kwargs):
+    if instance.pk:
+        instance._domain_avant = (
+            Formation.objects.filter(pk=instance.pk).values_list('domain_id', flat=True).first()
+        )
+
+@receiver(post_save, sender=Formation)
+def on_formation_domain_changed(sender, instance, created, **kwargs):
+    domain_avant = getattr(instance, '_domain_avant', None)
+    if created or domain_avant == instance.domain_id:
+        return
+    forget_quiz_domains()
+    user_ids = UserQuiz.objects.filter(quiz__formation=instance).values_list('user_id', flat=True)
+    mark_scores_dirty(user_ids, [domain_avant, instance.domain_id])
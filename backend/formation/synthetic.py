@@ -0,0 +1,278 @@
+"""
+Jeu de données synthétique pour les mesures de performance : collaborateurs
+avec leur ligne hiérarchique, projets, équipes, domaines, formations
+(modules, ressources, quiz) et progression des inscrits. Tout est créé en
+masse, sans passer par les signaux ; les compteurs dérivés (org_path,
+total_items, progression, UserDomainScore) sont recalculés à la fin.
+"""
+import random
+from datetime import date, timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.utils import timezone
+
+from personne.models import Personne
+from projet.models import Projet
+
+from .competences import rebuild_domain_scores
+from .models import (
+    Domain, Equipe, Formation, Module, Option, Question, Quiz, Resource,
+    UserFormation, UserModule, UserQuiz, UserResource,
+)
+from .progress import recompute_progress, refresh_total_items
+
+BATCH_SIZE = 1000
+PREFIX = 'SYN'
+PASSWORD = 'synthetic'
+
+CLIENTS = ['Stellantis', 'Renault', 'Airbus', 'Safran', 'Valeo', 'Forvia', 'Alstom']
+PROFILES = ['RFOE', 'Calcul', 'Méthodes', 'Simulation', 'Qualité', 'Électronique']
+DOMAINES = ['Mécanique', 'Électrique', 'Logiciel', 'Qualité', 'Méthodes', 'Simulation',
+            'Thermique', 'Matériaux', 'Gestion de projet', 'Réseaux', 'Sécurité', 'Données']
+
+
+def _ratio(n, divisor, minimum=1):
+    return max(minimum, n // divisor)
+
+
+class SyntheticDataset:
+    """
+    Génère `scale` collaborateurs et un volume proportionnel du reste ;
+    à graine égale, le jeu est identique d'une exécution à l'autre
+    (hors dates, relatives au jour courant).
+    """
+
+    def __init__(self, scale, seed=0):
+        self.scale = scale
+        self.rnd = random.Random(seed)
+        self.today = date.today()
+        self.counts = {}
+
+    def generate(self):
+        with transaction.atomic():
+            personnes = self._personnes()
+            equipes = self._equipes(personnes)
+            domains = self._domains(equipes)
+            formations = self._formations(personnes, equipes, domains)
+            self._progression(personnes, formations)
+
+            Personne.objects.rebuild_org_paths()
+            refresh_total_items([f.pk for f in formations])
+            recompute_progress(UserFormation.objects.filter(formation__in=formations))
+        rebuild_domain_scores()
+        return self.counts
+
+    def _bulk(self, model, objects):
+        created = model.objects.bulk_create(objects, batch_size=BATCH_SIZE)
+        key = model._meta.label
+        self.counts[key] = self.counts.get(key, 0) + len(created)
+        return created
+
+    # --- Collaborateurs, hiérarchie et projets ------------------------------
+    def _personnes(self):
+        rnd = self.rnd
+        password = make_password(PASSWORD)
+        niveaux = [
+            ('CL', _ratio(self.scale, 500)),
+            ('UDL', _ratio(self.scale, 200)),
+            ('TL2', _ratio(self.scale, 80)),
+            ('TL1', _ratio(self.scale, 15)),
+        ]
+        nb_collaborateurs = max(1, self.scale - sum(n for _, n in niveaux))
+        niveaux.append(('COLLABORATEUR', nb_collaborateurs))
+
+        personnes, managers = [], []
+        for role, nombre in niveaux:
+            niveau = []
+            for _ in range(nombre):
+                debut = self.today - timedelta(days=rnd.randint(365, 365 * 20))
+                personne = Personne(
+                    matricule=f"{PREFIX}{len(personnes) + 1:06d}",
+                    first_name=f"Prénom{len(personnes) + 1}",
+                    last_name=f"Nom{len(personnes) + 1}",
+                    sexe=rnd.choice(['Homme', 'Femme']),
+                    email=f"{PREFIX.lower()}{len(personnes) + 1}@example.com",
+                    role=role,
+                    dt_Debut_Carriere=debut,
+                    dt_Embauche=debut + timedelta(days=rnd.randint(0, 365 * 5)),
+                    position=rnd.choice(Personne.POSITION_CHOICES)[0],
+                    diplome=rnd.choice(Personne.DIPLOME_CHOICES)[0],
+                    profile=rnd.choice(PROFILES),
+                    status=rnd.choice(Personne.STATUS_CHOICES)[0],
+                    manager=rnd.choice(managers) if managers else None,
+                    password=password,
+                    is_staff=role == 'CL',
+                    is_superuser=role == 'CL',
+                )
+                personne.experience_total = personne.calcul_experience_total()
+                personne.experience_expleo = personne.calcul_experience_expleo()
+                niveau.append(personne)
+                personnes.append(personne)
+            managers = niveau
+        self._bulk(Personne, personnes)
+
+        team_leaders = [p for p in personnes if p.role == 'TL1']
+        projets = self._bulk(Projet, [
+            Projet(
+                nom=f"Projet {i + 1}",
+                code=f"{PREFIX}-{i + 1:05d}",
+                final_client=rnd.choice(CLIENTS),
+                sop=rnd.choice(Projet.SOP_CHOICES)[0],
+                tl=rnd.choice(team_leaders),
+                date_demarrage=self.today - timedelta(days=rnd.randint(0, 1000)),
+                statut=rnd.choice(Projet.STATUT_CHOICES)[0],
+            )
+            for i in range(_ratio(self.scale, 15))
+        ])
+        for personne in personnes:
+            if personne.role == 'COLLABORATEUR' and rnd.random() < 0.8:
+                personne.projet = rnd.choice(projets)
+        Personne.objects.bulk_update(
+            [p for p in personnes if p.projet_id], ['projet'], batch_size=BATCH_SIZE
+        )
+        return personnes
+
+    def _equipes(self, personnes):
+        rnd = self.rnd
+        equipes = self._bulk(Equipe, [
+            Equipe(name=f"Équipe {i + 1}") for i in range(_ratio(self.scale, 25, 3))
+        ])
+        self._bulk(Equipe.assigned_users.through, [
+            Equipe.assigned_users.through(equipe_id=equipe.pk, personne_id=personne.pk)
+            for personne in personnes
+            for equipe in rnd.sample(equipes, rnd.randint(1, min(2, len(equipes))))
+        ])
+        return equipes
+
+    def _domains(self, equipes):
+        rnd = self.rnd
+        domains = self._bulk(Domain, [
+            Domain(
+                name=name,
+                prerequisites_level=rnd.randint(0, 2),
+                consultant_target=rnd.randint(2, 3),
+                leader_target=rnd.randint(3, 4),
+            )
+            for name in DOMAINES[:min(len(DOMAINES), _ratio(self.scale, 100, 4))]
+        ])
+        self._bulk(Domain.equipes.through, [
+            Domain.equipes.through(domain_id=domain.pk, equipe_id=equipe.pk)
+            for domain in domains
+            for equipe in rnd.sample(equipes, rnd.randint(1, min(3, len(equipes))))
+        ])
+        return domains
+
+    # --- Formations ----------------------------------------------------------
+    def _formations(self, personnes, equipes, domains):
+        rnd = self.rnd
+        auteurs = [p for p in personnes if p.role in ('TL1', 'TL2')]
+        nb_formations = _ratio(self.scale, 20, 5)
+
+        modules = self._bulk(Module, [
+            Module(
+                titre=f"Module {i + 1}", video=f"modules/videos/module_{i + 1}.mp4",
+                description="Module synthétique", estimated_time=timedelta(minutes=rnd.randint(5, 60)),
+            )
+            for i in range(nb_formations * 3)
+        ])
+        resources = self._bulk(Resource, [
+            Resource(
+                name=f"Ressource {i + 1}", file=f"resources/ressource_{i + 1}.pdf",
+                confidentiel=rnd.random() < 0.2, estimated_time=timedelta(minutes=rnd.randint(5, 30)),
+            )
+            for i in range(nb_formations * 2)
+        ])
+        self._bulk(Resource.allowed_equipes.through, [
+            Resource.allowed_equipes.through(resource_id=resource.pk, equipe_id=equipe.pk)
+            for resource in resources if resource.confidentiel
+            for equipe in rnd.sample(equipes, 1)
+        ])
+
+        formations = self._bulk(Formation, [
+            Formation(
+                titre=f"Formation {i + 1}",
+                description="Formation synthétique",
+                created_by=rnd.choice(auteurs) if auteurs else None,
+                domain=rnd.choice(domains),
+                statut='actif' if rnd.random() < 0.9 else 'inactif',
+                deadline=self.today + timedelta(days=rnd.randint(-30, 90)),
+            )
+            for i in range(nb_formations)
+        ])
+        self._bulk(Formation.modules.through, [
+            Formation.modules.through(formation_id=formation.pk, module_id=module.pk)
+            for formation in formations
+            for module in rnd.sample(modules, rnd.randint(2, 5))
+        ])
+        self._bulk(Formation.ressources.through, [
+            Formation.ressources.through(formation_id=formation.pk, resource_id=resource.pk)
+            for formation in formations
+            for resource in rnd.sample(resources, rnd.randint(1, 4))
+        ])
+
+        quizzes = self._bulk(Quiz, [
+            Quiz(formation=formation, estimated_time=timedelta(minutes=rnd.randint(5, 20)))
+            for formation in formations
+        ])
+        questions = self._bulk(Question, [
+            Question(
+                quiz=quiz,
+                texte=f"Question {i + 1}",
+                type=rnd.choice(['single_choice', 'multiple_choice', 'text']),
+                point=rnd.randint(1, 3),
+            )
+            for quiz in quizzes
+            for i in range(rnd.randint(3, 8))
+        ])
+        for question in questions:
+            if question.type == 'text':
+                question.correct_keywords = rnd.sample(['pièce', 'norme', 'essai', 'plan', 'coût'], 2)
+        Question.objects.bulk_update(
+            [q for q in questions if q.type == 'text'], ['correct_keywords'], batch_size=BATCH_SIZE
+        )
+        self._bulk(Option, [
+            Option(question=question, texte=f"Option {j + 1}", is_correct=j == 0 or (
+                question.type == 'multiple_choice' and j == 1))
+            for question in questions if question.type != 'text'
+            for j in range(4)
+        ])
+        return formations
+
+    # --- Progression des inscrits -------------------------------------------
+    def _progression(self, personnes, formations):
+        rnd = self.rnd
+        contenu = {
+            formation.pk: (
+                list(formation.modules.values_list('pk', flat=True)),
+                list(formation.ressources.values_list('pk', flat=True)),
+            )
+            for formation in formations
+        }
+        now = timezone.now()
+        suivis, modules, ressources, quiz = [], {}, {}, {}
+        for personne in personnes:
+            for formation in rnd.sample(formations, rnd.randint(0, min(4, len(formations)))):
+                suivis.append(UserFormation(
+                    user_id=personne.pk, formation=formation,
+                    last_accessed=now - timedelta(days=rnd.randint(0, 60)),
+                ))
+                avancement = rnd.random()
+                module_ids, resource_ids = contenu[formation.pk]
+                # Les étapes partagées entre formations ne sont suivies qu'une fois
+                for module_id in module_ids[:round(len(module_ids) * avancement)]:
+                    modules[personne.pk, module_id] = UserModule(
+                        user_id=personne.pk, module_id=module_id, completed=True)
+                for resource_id in resource_ids[:round(len(resource_ids) * avancement)]:
+                    ressources[personne.pk, resource_id] = UserResource(
+                        user_id=personne.pk, resource_id=resource_id, read=True)
+                if avancement > 0.6:
+                    quiz[personne.pk, formation.pk] = UserQuiz(
+                        user_id=personne.pk, quiz_id=formation.quiz.pk, completed=True,
+                        score=rnd.randint(0, 15), completed_at=now - timedelta(days=rnd.randint(0, 60)),
+                        time_spent=timedelta(minutes=rnd.randint(2, 20)),
+                    )
+        self._bulk(UserFormation, suivis)
+        self._bulk(UserModule, list(modules.values()))
+        self._bulk(UserResource, list(ressources.values()))
+        self._bulk(UserQuiz, list(quiz.values()))
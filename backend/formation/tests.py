@@ -1,3 +1,601 @@
+import csv
+import io
+import json
+from datetime import date, timedelta
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import transaction
 from django.test import TestCase
+from django.utils import timezone
+from openpyxl import load_workbook
+from rest_framework.test import APIClient
+
+from backend.perf import budget_for
+from personne.models import Personne
+
+from .benchmark import hot_endpoints
+from .competences import rebuild_domain_scores
+from .grading import AnswerKey, answer_key_cache, save_answers
+from .models import (
+    Domain, Equipe, Formation, Module, Option, Question, Quiz, Resource, UserAnswer, UserDomainScore, UserFormation,
+    UserModule, UserQuiz, UserQuizHistory, UserResource,
+)
+from .pending import PerTransaction
+from .progress import mark_resources_read, recompute_progress, reset_progress
+from .synthetic import SyntheticDataset
+
+SEED = 0
+
+
+def personne(matricule, **extra):
+    return Personne.objects.create_user(
+        matricule=matricule, first_name=matricule, last_name=matricule, dt_Embauche=date(2015, 1, 1), **extra)
+
+
+def module(titre):
+    return Module.objects.create(
+        titre=titre, video="modules/videos/test.mp4", description="", estimated_time=timedelta(minutes=10))
+
+
+class SyntheticQueryCountMixin:
+    """
+    Nombre exact de requêtes SQL des points d'entrée de `query_counts`, sur
+    le jeu synthétique à l'échelle `scale`. Les mêmes nombres sont attendus
+    à chaque échelle : une régression en N+1 fait échouer le test.
+    """
+    scale = None
+    query_counts = {}
+
+    @classmethod
+    def setUpTestData(cls):
+        SyntheticDataset(cls.scale, seed=SEED).generate()
+
+    def setUp(self):
+        self.client = APIClient()
+        self.endpoints = {name: (user, url) for name, user, url in hot_endpoints()}
+
+    def assertEndpointQueries(self, name, user=None, url=None):
+        default_user, default_url = self.endpoints.get(name, (None, None))
+        self.client.force_authenticate(user or default_user)
+        with self.assertNumQueries(self.query_counts[name]):
+            response = self.client.get(url or default_url)
+        self.assertEqual(response.status_code, 200)
+        # Le budget de settings.PERF_BUDGETS couvre ce nombre (+ l'authentification)
+        budget = budget_for(response.resolver_match.view_name)
+        self.assertLessEqual(self.query_counts[name] + settings.PERF_AUTH_QUERIES, budget['queries'])
+
+
+class FormationQueryCountMixin(SyntheticQueryCountMixin):
+    query_counts = {
+        'formation-list': 11,
+        'userformation-list': 12,
+        'quiz-competence-table': 4,
+        'quiz-competence-table-compact': 4,
+        'quiz-radar-scores': 2,
+        'quiz-radar-scores-manager': 3,
+        'formation-progress': 29,
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        # Formation de contenu fixe, suivie par un collaborateur : le coût de
+        # sa progression ne dépend que de l'échelle du jeu
+        cls.collaborateur = UserFormation.objects.order_by('user_id').first().user
+        cls.formation = Formation.objects.create(titre="Formation de référence")
+        modules = [module(f"Module {i}") for i in range(3)]
+        cls.formation.modules.add(*modules)
+        cls.formation.ressources.add(Resource.objects.create(
+            name="Ressource", file="resources/ref.pdf", estimated_time=timedelta(minutes=5)))
+        quiz = Quiz.objects.create(formation=cls.formation, estimated_time=timedelta(minutes=5))
+        Question.objects.create(quiz=quiz, texte="Question", type='text', point=1)
+        UserFormation.objects.create(user=cls.collaborateur, formation=cls.formation)
+        UserModule.objects.create(user=cls.collaborateur, module=modules[0], completed=True)
+        UserQuiz.objects.create(user=cls.collaborateur, quiz=quiz, completed=True, score=1)
+
+    def test_formation_list(self):
+        self.assertEndpointQueries('formation-list')
+
+    def test_user_formation_list(self):
+        self.assertEndpointQueries('userformation-list')
+
+    def test_competence_table(self):
+        self.assertEndpointQueries('quiz-competence-table')
+        self.assertEndpointQueries('quiz-competence-table-compact')
+
+    def test_radar_scores(self):
+        self.assertEndpointQueries('quiz-radar-scores')
+        self.assertEndpointQueries('quiz-radar-scores-manager')
+
+    def test_formation_progress(self):
+        self.assertEndpointQueries(
+            'formation-progress', self.collaborateur, f'/api/formations/{self.formation.pk}/progress/')
+
+
+class FormationQueryCountSmallTests(FormationQueryCountMixin, TestCase):
+    scale = 10
+
+
+class FormationQueryCountLargeTests(FormationQueryCountMixin, TestCase):
+    scale = 200
+
+
+class _Compteur:
+    def __init__(self):
+        self.valeurs = []
+        self.appliquees = []
+
+    def flush(self):
+        self.appliquees.extend(self.valeurs)
+
+
+class PerTransactionTests(TestCase):
+    def setUp(self):
+        self.pending = PerTransaction('test', _Compteur)
+
+    def test_un_seul_objet_applique_a_la_validation(self):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            compteur = self.pending.get()
+            compteur.valeurs.append(1)
+            self.assertIs(self.pending.get(), compteur)
+            self.pending.get().valeurs.append(2)
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(compteur.appliquees, [1, 2])
+        # Appliqué : la suite de la transaction repart d'un nouvel objet
+        self.assertIsNot(self.pending.get(), compteur)
+
+    def test_oublie_apres_rollback(self):
+        try:
+            with transaction.atomic():
+                abandonne = self.pending.get()
+                abandonne.valeurs.append(1)
+                raise RuntimeError
+        except RuntimeError:
+            pass
+        with self.captureOnCommitCallbacks(execute=True):
+            compteur = self.pending.get()
+            compteur.valeurs.append(2)
+        self.assertIsNot(compteur, abandonne)
+        self.assertEqual(compteur.appliquees, [2])
+        self.assertEqual(abandonne.appliquees, [])
+
+    def test_bloc_imbrique_annule(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            compteur = self.pending.get()
+            compteur.valeurs.append(1)
+            try:
+                with transaction.atomic():
+                    abandonne = self.pending.get()
+                    abandonne.valeurs.append(2)
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+            with transaction.atomic():
+                valide = self.pending.get()
+                valide.valeurs.append(3)
+            self.assertIs(self.pending.get(), compteur)
+            compteur.valeurs.append(4)
+        self.assertEqual(compteur.appliquees, [1, 4])
+        self.assertEqual(valide.appliquees, [3])
+        self.assertEqual(abandonne.appliquees, [])
+
+
+class ResetProgressTests(TestCase):
+    def setUp(self):
+        self.domain = Domain.objects.create(name="Domaine")
+        self.formation = Formation.objects.create(titre="Formation", domain=self.domain)
+        self.module = module("Module")
+        self.formation.modules.add(self.module)
+        self.quiz = Quiz.objects.create(formation=self.formation, estimated_time=timedelta(minutes=5))
+        Question.objects.create(quiz=self.quiz, texte="Question", type='text', point=10)
+        self.users = [personne(f"U{i}") for i in range(3)]
+        now = timezone.now()
+        with self.captureOnCommitCallbacks(execute=True):
+            for i, user in enumerate(self.users):
+                UserFormation.objects.create(user=user, formation=self.formation)
+                UserModule.objects.create(user=user, module=self.module, completed=True)
+                UserQuiz.objects.create(user=user, quiz=self.quiz, completed=True, score=5 + i,
+                                        completed_at=now, time_spent=timedelta(minutes=i))
+
+    def test_reinitialisation(self):
+        reset, garde = self.users[:2], self.users[2]
+        self.assertEqual(UserDomainScore.objects.count(), 3)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(reset_progress(self.formation, [u.pk for u in reset]), 2)
+
+        historique = UserQuizHistory.objects.order_by('user_id')
+        self.assertEqual(
+            [(h.user_id, h.formation_id, h.score, h.time_spent) for h in historique],
+            [(u.pk, self.formation.pk, 5 + i, timedelta(minutes=i)) for i, u in enumerate(reset)],
+        )
+        self.assertEqual(list(UserQuiz.objects.values_list('user_id', flat=True)), [garde.pk])
+        self.assertEqual(list(UserDomainScore.objects.values_list('user_id', flat=True)), [garde.pk])
+        self.assertEqual(
+            dict(UserFormation.objects.values_list('user_id', 'progress')),
+            {reset[0].pk: 0, reset[1].pk: 0, garde.pk: 100},
+        )
+
+
+class ProgressCountersTests(TestCase):
+    """Les compteurs tenus par deltas donnent le même résultat qu'un recalcul complet."""
+
+    def setUp(self):
+        self.user = personne("C001")
+        self.formation = Formation.objects.create(titre="Formation")
+        self.modules = [module(f"Module {i}") for i in range(2)]
+        self.resource = Resource.objects.create(
+            name="Ressource", file="resources/test.pdf", estimated_time=timedelta(minutes=5))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.formation.modules.add(*self.modules)
+            self.formation.ressources.add(self.resource)
+            self.quiz = Quiz.objects.create(formation=self.formation, estimated_time=timedelta(minutes=5))
+            UserFormation.objects.create(user=self.user, formation=self.formation)
+
+    def etape(self, action):
+        """Exécute `action` comme une requête (signaux appliqués à la validation)."""
+        with self.captureOnCommitCallbacks(execute=True):
+            action()
+
+    def basculer(self, module, completed):
+        suivi = UserModule.objects.get(user=self.user, module=module)
+        suivi.completed = completed
+        suivi.save()
+
+    def assertProgress(self, completed_items, progress, status):
+        suivi = UserFormation.objects.get(user=self.user, formation=self.formation)
+        self.assertEqual((suivi.completed_items, suivi.progress, suivi.status), (completed_items, progress, status))
+        # Un recalcul complet ne trouve rien à corriger
+        self.assertEqual(recompute_progress([suivi]), 0)
+
+    def test_deltas_et_recalcul(self):
+        self.formation.refresh_from_db()
+        self.assertEqual(self.formation.total_items, 5)
+        self.assertProgress(0, 0, 'nouvelle')
+
+        self.etape(lambda: UserModule.objects.create(user=self.user, module=self.modules[0], completed=True))
+        self.assertProgress(1, 20, 'en_cours')
+        self.etape(lambda: UserResource.objects.create(user=self.user, resource=self.resource, read=True))
+        self.etape(lambda: UserQuiz.objects.create(user=self.user, quiz=self.quiz, completed=True, score=1))
+        self.assertProgress(3, 60, 'en_cours')
+
+        self.etape(lambda: self.basculer(self.modules[0], False))
+        self.assertProgress(2, 40, 'en_cours')
+        # Réenregistrer sans changement ne compte rien
+        self.etape(lambda: self.basculer(self.modules[0], False))
+        self.assertProgress(2, 40, 'en_cours')
+        self.etape(lambda: self.basculer(self.modules[0], True))
+        self.etape(lambda: UserModule.objects.create(user=self.user, module=self.modules[1], completed=True))
+        self.assertProgress(4, 80, 'en_cours')
+
+    def test_bloc_imbrique_annule(self):
+        def etapes():
+            UserModule.objects.create(user=self.user, module=self.modules[0], completed=True)
+            try:
+                with transaction.atomic():
+                    UserModule.objects.create(user=self.user, module=self.modules[1], completed=True)
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+
+        # Le delta du module annulé n'est pas appliqué à la validation
+        self.etape(etapes)
+        self.assertProgress(1, 20, 'en_cours')
+
+    def test_reconcile_progress_apres_sequence_mixte(self):
+        self.etape(lambda: UserModule.objects.create(user=self.user, module=self.modules[0], completed=True))
+        self.etape(lambda: UserModule.objects.create(user=self.user, module=self.modules[1], completed=True))
+        self.etape(lambda: UserResource.objects.create(user=self.user, resource=self.resource, read=True))
+        self.etape(lambda: self.basculer(self.modules[0], False))
+        self.etape(lambda: UserQuiz.objects.create(user=self.user, quiz=self.quiz, completed=True, score=1))
+        self.assertProgress(3, 60, 'en_cours')
+        self.etape(self.modules[1].delete)
+        self.etape(self.resource.delete)
+        # Reste : vue d'ensemble + un module + quiz, dont le quiz terminé
+        self.formation.refresh_from_db()
+        self.assertEqual(self.formation.total_items, 3)
+        self.assertProgress(1, 33, 'en_cours')
+
+        sortie = io.StringIO()
+        call_command('reconcile_progress', stdout=sortie)
+        self.assertIn("0 total(aux) corrigé(s), 0 suivi(s) corrigé(s)", sortie.getvalue())
+
+        # Une dérive (écriture hors signaux) est corrigée par la commande
+        UserFormation.objects.update(completed_items=3, progress=100, status='terminee')
+        sortie = io.StringIO()
+        call_command('reconcile_progress', '--formation', str(self.formation.pk), stdout=sortie)
+        self.assertIn("1 suivi(s) corrigé(s)", sortie.getvalue())
+        self.assertProgress(1, 33, 'en_cours')
+
+
+class DeferredProgressTests(TestCase):
+    """Les changements de progression d'une transaction sont appliqués une fois, à la validation."""
+
+    def setUp(self):
+        self.user = personne("D001")
+        self.modules = [module(f"Module {i}") for i in range(3)]
+        self.formations = [Formation.objects.create(titre=f"Formation {i}") for i in range(2)]
+        with self.captureOnCommitCallbacks(execute=True):
+            for formation in self.formations:
+                formation.modules.add(*self.modules)
+            UserFormation.objects.create(user=self.user, formation=self.formations[0])
+
+    def completed_items(self):
+        return dict(UserFormation.objects.filter(user=self.user).values_list('formation_id', 'completed_items'))
+
+    def test_application_a_la_validation(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                for m in self.modules[:2]:
+                    UserModule.objects.create(user=self.user, module=m, completed=True)
+                suivi = UserModule.objects.get(user=self.user, module=self.modules[0])
+                suivi.completed = False
+                suivi.save()
+                # Rien n'est écrit avant la validation
+                self.assertEqual(self.completed_items(), {self.formations[0].pk: 0})
+        # Deltas cumulés sur le suivi existant ; suivi manquant créé et recalculé
+        self.assertEqual(self.completed_items(), {self.formations[0].pk: 1, self.formations[1].pk: 1})
+
+    def test_rollback(self):
+        try:
+            with transaction.atomic():
+                UserModule.objects.create(user=self.user, module=self.modules[0], completed=True)
+                raise RuntimeError
+        except RuntimeError:
+            pass
+        self.assertEqual(self.completed_items(), {self.formations[0].pk: 0})
+
+        # Les deltas abandonnés ne s'ajoutent pas à ceux de la transaction suivante
+        with self.captureOnCommitCallbacks(execute=True):
+            UserModule.objects.create(user=self.user, module=self.modules[1], completed=True)
+        self.assertEqual(self.completed_items(), {self.formations[0].pk: 1, self.formations[1].pk: 1})
+
+
+class MarkResourcesReadTests(TestCase):
+    def test_lecture_en_masse(self):
+        user = personne("R001")
+        formation, autre = Formation.objects.create(titre="Formation"), Formation.objects.create(titre="Autre")
+        resources = [
+            Resource.objects.create(name=f"Ressource {i}", file=f"resources/{i}.pdf",
+                                    estimated_time=timedelta(minutes=5))
+            for i in range(3)
+        ]
+        with self.captureOnCommitCallbacks(execute=True):
+            formation.ressources.add(*resources)
+            autre.ressources.add(resources[1])
+            UserFormation.objects.create(user=user, formation=formation)
+            UserResource.objects.create(user=user, resource=resources[0], read=True)
+            UserResource.objects.create(user=user, resource=resources[1], read=False)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(mark_resources_read(user.pk, formation), 2)
+            # Déjà tout lu : rien de nouveau
+            self.assertEqual(mark_resources_read(user.pk, formation), 0)
+
+        self.assertEqual(
+            sorted(UserResource.objects.filter(user=user).values_list('resource_id', 'read')),
+            [(r.pk, True) for r in resources],
+        )
+        suivis = UserFormation.objects.filter(user=user).order_by('formation_id')
+        self.assertEqual([(s.formation_id, s.completed_items) for s in suivis], [(formation.pk, 3), (autre.pk, 1)])
+        self.assertEqual(recompute_progress(suivis), 0)
+
+
+class QuizGradingMixin:
+    def setUp(self):
+        self.user = personne("Q001")
+        formation = Formation.objects.create(titre="Formation")
+        self.quiz = Quiz.objects.create(formation=formation, estimated_time=timedelta(minutes=5))
+        self.simple = Question.objects.create(quiz=self.quiz, texte="Simple", type='single_choice', point=1)
+        self.multiple = Question.objects.create(quiz=self.quiz, texte="Multiple", type='multiple_choice', point=2)
+        self.texte = Question.objects.create(
+            quiz=self.quiz, texte="Texte", type='text', point=3, correct_keywords=['Norme', 'essai'])
+        self.options = {
+            question.pk: [Option.objects.create(question=question, texte=f"Option {i}", is_correct=i < bonnes)
+                          for i in range(3)]
+            for question, bonnes in ((self.simple, 1), (self.multiple, 2))
+        }
+
+    def reponses(self, simple, multiple, texte):
+        return [
+            {'question_id': self.simple.pk, 'selected_option_ids': [o.pk for o in simple]},
+            {'question_id': self.multiple.pk, 'selected_option_ids': [o.pk for o in multiple]},
+            {'question_id': self.texte.pk, 'text_response': texte},
+        ]
+
+
+class SaveAnswersTests(QuizGradingMixin, TestCase):
+    def stored(self):
+        return {
+            ua.question_id: (sorted(o.pk for o in ua.selected_options.all()), ua.text_response)
+            for ua in UserAnswer.objects.filter(user=self.user).prefetch_related('selected_options')
+        }
+
+    def test_notation_et_enregistrement(self):
+        key = AnswerKey.for_quiz(self.quiz)
+        simple, multiple = self.options[self.simple.pk], self.options[self.multiple.pk]
+        self.assertEqual(key.total, 6)
+
+        reponses = self.reponses([simple[0]], multiple[:2], "Une norme, un essai.")
+        self.assertEqual(key.grade(reponses), 6)
+        save_answers(self.user, key, reponses)
+        self.assertEqual(self.stored(), {
+            self.simple.pk: ([simple[0].pk], None),
+            self.multiple.pk: ([multiple[0].pk, multiple[1].pk], None),
+            self.texte.pk: ([], "Une norme, un essai."),
+        })
+
+        # Nouvelle soumission : mêmes lignes, options remplacées ; une option
+        # d'une autre question est ignorée. Lecture, textes, suppression et
+        # insertion des options : 4 requêtes quel que soit le nombre de questions
+        reponses = self.reponses([simple[1], multiple[0]], multiple[:1], "essai")
+        self.assertEqual(key.grade(reponses), 3)
+        with self.assertNumQueries(4):
+            save_answers(self.user, key, reponses)
+        self.assertEqual(UserAnswer.objects.filter(user=self.user).count(), 3)
+        self.assertEqual(self.stored(), {
+            self.simple.pk: ([simple[1].pk], None),
+            self.multiple.pk: ([multiple[0].pk], None),
+            self.texte.pk: ([], "essai"),
+        })
+
+
+class AnswerKeyInvalidationTests(QuizGradingMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        answer_key_cache.clear()
+        self.client = APIClient()
+
+    def cle(self):
+        self.quiz.refresh_from_db()
+        return answer_key_cache.get(self.quiz)
+
+    def test_ecritures_incrementent_la_version(self):
+        cle = self.cle()
+        self.assertIs(self.cle(), cle)
+        simple = self.options[self.simple.pk]
+        self.assertEqual(cle.correct[self.simple.pk], {simple[0].pk})
+
+        response = self.client.patch(f'/api/options/{simple[1].pk}/', {'is_correct': True}, format='json')
+        self.assertEqual(response.status_code, 200)
+        nouvelle = self.cle()
+        self.assertEqual(nouvelle.version, cle.version + 1)
+        self.assertEqual(nouvelle.correct[self.simple.pk], {simple[0].pk, simple[1].pk})
+
+        response = self.client.patch(f'/api/questions/{self.texte.pk}/', {'point': 5}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.cle().total, 8)
+
+        self.assertEqual(self.client.delete(f'/api/options/{simple[0].pk}/').status_code, 204)
+        self.assertEqual(self.cle().correct[self.simple.pk], {simple[1].pk})
+        self.assertEqual(self.quiz.version, cle.version + 3)
+
+
+class CompetenceFixtureMixin:
+    """
+    Une équipe et trois domaines : A a 80 % en Électrique et 60 % en
+    Mécanique, B 90 % en Mécanique, C n'a aucun quiz terminé ; personne
+    n'a de résultat en Qualité.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.equipe = Equipe.objects.create(name="Équipe")
+        cls.a, cls.b, cls.c = personne("A001"), personne("B001"), personne("C001")
+        cls.equipe.assigned_users.add(cls.a, cls.b, cls.c)
+        cls.domains = {}
+        quiz = {}
+        for name, points in (("Mécanique", 10), ("Électrique", 5), ("Qualité", 1)):
+            domain = cls.domains[name] = Domain.objects.create(name=name)
+            domain.equipes.add(cls.equipe)
+            formation = Formation.objects.create(titre=name, domain=domain)
+            quiz[name] = Quiz.objects.create(formation=formation, estimated_time=timedelta(minutes=5))
+            Question.objects.create(quiz=quiz[name], texte="Question", type='text', point=points)
+        for user, name, score in ((cls.a, "Électrique", 4), (cls.a, "Mécanique", 6), (cls.b, "Mécanique", 9)):
+            UserQuiz.objects.create(user=user, quiz=quiz[name], completed=True, score=score)
+        rebuild_domain_scores()
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.a)
+
+
+class RadarScoresTests(CompetenceFixtureMixin, TestCase):
+    def scores(self, query=''):
+        response = self.client.get(f'/api/quizzes/radar_scores/{query}')
+        self.assertEqual(response.status_code, 200)
+        return [(row['domaine'], row['score']) for row in response.data]
+
+    def test_moyennes_par_domaine(self):
+        # Domaines par nom ; moyenne des % de chaque quiz, None sans résultat
+        attendu = [("Mécanique", 75.0), ("Qualité", None), ("Électrique", 80.0)]
+        self.assertEqual(self.scores(), attendu)
+        self.assertEqual(self.scores(f'?equipe_id={self.equipe.pk}'), attendu)
+        self.assertEqual(
+            self.scores(f'?user_id={self.a.pk}'), [("Mécanique", 60.0), ("Qualité", None), ("Électrique", 80.0)])
+        self.assertEqual(
+            self.scores(f'?user_id={self.c.pk}'), [("Mécanique", None), ("Qualité", None), ("Électrique", None)])
+
+
+class CompetenceTableTests(CompetenceFixtureMixin, TestCase):
+    def test_format_historique(self):
+        response = self.client.get('/api/quizzes/competence_table/')
+        self.assertEqual(response.status_code, 200)
+        lignes = {row['user_id']: row for row in response.data}
+        # C, sans aucun quiz terminé, est écarté
+        self.assertEqual(set(lignes), {self.a.pk, self.b.pk})
+        a = lignes[self.a.pk]
+        self.assertEqual(a['equipe'], "Équipe")
+        self.assertEqual(
+            {name: value['score'] for name, value in a['scores'].items()},
+            {"Électrique": 80, "Mécanique": 60, "Qualité": None},
+        )
+        self.assertEqual(a['average'], 70)
+        self.assertEqual(lignes[self.b.pk]['average'], 90)
+
+    def test_layout_compact(self):
+        historique = self.client.get('/api/quizzes/competence_table/').data
+        compact = self.client.get('/api/quizzes/competence_table/?layout=compact').data
+
+        # Domaines et cibles une seule fois, puis une liste de scores par personne
+        noms = [domain['name'] for domain in compact['domains']]
+        self.assertEqual(sorted(noms), ["Mécanique", "Qualité", "Électrique"])
+        for domain in compact['domains']:
+            self.assertEqual(
+                set(domain), {'id', 'name', 'prerequisites', 'consultant_target', 'leader_target'})
+        self.assertEqual(len(compact['rows']), len(historique))
+        for ligne, attendu in zip(compact['rows'], historique):
+            self.assertEqual(
+                (ligne['user_id'], ligne['user'], ligne['equipe'], ligne['average']),
+                (attendu['user_id'], attendu['user'], attendu['equipe'], attendu['average']),
+            )
+            self.assertEqual(
+                dict(zip(noms, ligne['scores'])),
+                {name: value['score'] for name, value in attendu['scores'].items()},
+            )
+
+
+class CompetenceExportTests(CompetenceFixtureMixin, TestCase):
+    url = '/api/quizzes/competence_table/export/'
+    entete = ['Matricule', 'Collaborateur', 'Équipe', 'Mécanique', 'Électrique', 'Qualité', 'Moyenne']
+
+    def test_csv(self):
+        # Un paquet par personne : les lignes sont produites au fil des paquets
+        with mock.patch('formation.exports.CHUNK_SIZE', 1):
+            response = self.client.get(self.url)
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(response.streaming)
+            contenu = b''.join(response.streaming_content).decode('utf-8')
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertTrue(contenu.startswith('\ufeff'))
+        lignes = list(csv.reader(io.StringIO(contenu[1:]), delimiter=';'))
+        self.assertEqual(lignes, [
+            self.entete,
+            ['A001', 'A001 A001', 'Équipe', '60', '80', '', '70'],
+            ['B001', 'B001 B001', 'Équipe', '90', '', '', '90'],
+        ])
+
+    def test_xlsx(self):
+        response = self.client.get(self.url, {'format': 'xlsx', 'user_id': self.a.pk})
+        self.assertEqual(response.status_code, 200)
+        classeur = load_workbook(io.BytesIO(b''.join(response.streaming_content)), read_only=True)
+        self.assertEqual(classeur.sheetnames, ['Compétences', 'Domaines'])
+        self.assertEqual(
+            [list(row) for row in classeur['Compétences'].values],
+            [self.entete, ['A001', 'A001 A001', 'Équipe', 60, 80, None, 70]],
+        )
+        domaines = [row[:2] for row in classeur['Domaines'].values]
+        self.assertEqual(
+            domaines, [('Domaine', 'Score moyen'), ('Mécanique', 60), ('Qualité', None), ('Électrique', 80)])
 
-# Create your tests here.
+    def test_erreur_en_json(self):
+        self.client.force_authenticate(None)
+        for format in ('csv', 'xlsx'):
+            response = self.client.get(self.url, {'format': format})
+            self.assertEqual(response.status_code, 403)
+            self.assertEqual(response['Content-Type'], 'application/json')
+            self.assertIn('detail', json.loads(response.content))
@@ -4,7 +4,7 @@ from rest_framework.response import Response
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from django.db import transaction
-from django.db.models import Sum,Q,Avg,F, Case, When, FloatField
+from django.db.models import Sum,Q,Avg,F, Case, When, FloatField, Prefetch
 from django.db.models.functions import Cast
 from django.http import FileResponse
 from django.shortcuts import get_object_or_404
@@ -13,6 +13,10 @@ from rest_framework_simplejwt.authentication import JWTAuthentication  # si tu u
 from rest_framework.authentication import SessionAuthentication
 from .models import *
 from .serializers import *
+from .competences import CompetenceMatrix, radar_data
+from .exports import CSVRenderer, XLSXRenderer, competence_csv_response, competence_xlsx_response
+from .grading import answer_key_cache, save_answers
+from .progress import mark_progress_dirty, mark_resources_read, reset_progress, teams_progress_by_formation
 
 class EquipeViewSet(viewsets.ModelViewSet):
     queryset = Equipe.objects.all()
@@ -52,6 +56,12 @@ class ResourceViewSet(viewsets.ModelViewSet):
 class FormationViewSet(viewsets.ModelViewSet):
     queryset = Formation.objects.all()
 
+    def get_queryset(self):
+        if self.request.method == 'GET':
+            # Compteurs et relations calculés en un nombre fixe de requêtes
+            return Formation.objects.with_list_stats()
+        return Formation.objects.all()
+
     def get_permissions(self):
         if self.action == 'retrieve':
            return [IsAuthenticated()]     # token ou session obligatoire
@@ -61,6 +71,13 @@ class FormationViewSet(viewsets.ModelViewSet):
         if self.request.method in ['POST', 'PUT', 'PATCH']:
             return FormationWriteSerializer   # écriture
         return FormationReadSerializer        # lecture détaillée
+
+    def list(self, request, *args, **kwargs):
+        formations = list(self.filter_queryset(self.get_queryset()))
+        # Progression des équipes calculée une fois pour toute la liste
+        context = {**self.get_serializer_context(), 'teams_progress': teams_progress_by_formation(formations)}
+        serializer = self.get_serializer_class()(formations, many=True, context=context)
+        return Response(serializer.data)
     
     @transaction.atomic
     def update(self, request, *args, **kwargs):
@@ -240,34 +257,16 @@ class QuizViewSet(viewsets.ModelViewSet):
             uq.attempts_made += 1
 
 
+        # Corrigé du quiz en mémoire : la notation ne coûte plus une requête par question
+        key = answer_key_cache.get(quiz)
         data   = QuizSubmitSerializer(
-                    data=request.data, context={"quiz": quiz}
+                    data=request.data, context={"quiz": quiz, "answer_key": key}
                  )
         data.is_valid(raise_exception=True)
 
-
-        total_score = 0
-        for item in data.validated_data["answers"]:
-            q  = quiz.questions.get(id=item["question_id"])
-            ua, _ = UserAnswer.objects.get_or_create(user=user, question=q)
-
-            # 1) on enregistre la réponse
-            if q.type in ("single_choice", "multiple_choice"):
-                opts = Option.objects.filter(id__in=item.get("selected_option_ids", []),
-                                             question=q)
-                ua.selected_options.set(opts)
-            else:
-                ua.text_response = item.get("text_response", "")
-            ua.save()
-
-            # 2) On calcule le score en utilisant la méthode universelle du modèle
-            #    On remplace tout le bloc if/elif/else par un seul appel.
-            
-            score_for_question = q.get_score_for_answer(
-                selected_option_ids=item.get("selected_option_ids"),
-                text_response=item.get("text_response")
-            )
-            total_score += score_for_question
+        answers = data.validated_data["answers"]
+        save_answers(user, key, answers)
+        total_score = key.grade(answers)
 
         time_spent_str = request.data.get('time_spent')
         
@@ -283,7 +282,7 @@ class QuizViewSet(viewsets.ModelViewSet):
         return Response(
             {
                 "score": total_score,
-                "total": sum(q.point for q in quiz.questions.all())
+                "total": key.total
             },
             status=status.HTTP_201_CREATED
         )
@@ -311,172 +310,52 @@ class QuizViewSet(viewsets.ModelViewSet):
 
     @action(detail=False, methods=['get'], url_path='radar_scores', permission_classes=[IsAuthenticated])
     def radar_scores(self, request):
+        return Response(radar_data(self._selection(request)))
+
+    def _selection(self, request):
+        """Personnes visées par les filtres user_id / equipe_id / projet_id / manager_id."""
         user_id = request.query_params.get("user_id")
         equipe_id = request.query_params.get("equipe_id")
         projet_id = request.query_params.get("projet_id")
+        manager_id = request.query_params.get("manager_id")
 
         personnes = Personne.objects.all()
-
         if user_id:
             personnes = personnes.filter(matricule=user_id)
         elif equipe_id:
             personnes = personnes.filter(equipes__id=equipe_id)
         elif projet_id:
             personnes = personnes.filter(projet_id=projet_id)
-
-        domaines = Domain.objects.filter(
-            equipes__assigned_users__in=personnes
-        ).distinct().order_by('name')
-        data = []
-
-        for domaine in domaines:
-            formations = Formation.objects.filter(domain=domaine)
-            quizzes = Quiz.objects.filter(formation__in=formations)
-            
-            user_quizzes_in_domain = UserQuiz.objects.filter(
-                quiz__in=quizzes,
-                user__in=personnes,
-                completed=True
-            )
-
-
-            if not user_quizzes_in_domain.exists():
-                avg_score_percent = None
-            else:
-                # Cette requête complexe fait le calcul pour nous :
-                # Pour chaque UserQuiz, elle calcule le score en pourcentage, puis fait la moyenne de tous ces pourcentages.
-                # C'est la méthode la plus juste pour une équipe/projet.
-                aggregation = user_quizzes_in_domain.annotate(
-                    # Calculer le score maximum possible pour le quiz de chaque ligne UserQuiz
-                    max_points=Sum('quiz__questions__point'),
-                    # Calculer le score en % pour chaque ligne
-                    percentage_score=Case(
-                        When(max_points__gt=0, then=Cast(F('score'), FloatField()) * 100.0 / F('max_points')),
-                        default=0.0,
-                        output_field=FloatField()
-                    )
-                ).aggregate(
-                    # Calculer la moyenne de tous les pourcentages obtenus
-                    average_score=Avg('percentage_score')
-                )
-                avg_score_percent = aggregation.get('average_score') or 0
-            
-            if( avg_score_percent is None):
-                data.append({
-                    "domaine": domaine.name,
-                    "score": None,
-                    "prerequisites": float(domaine.prerequisites_level),
-                    "consultant_target": float(domaine.consultant_target),
-                    "leader_target": float(domaine.leader_target),
-                })
-            else:
-                data.append({
-                    "domaine": domaine.name,
-                    "score": round(avg_score_percent, 2),
-                    "prerequisites": float(domaine.prerequisites_level),
-                    "consultant_target": float(domaine.consultant_target),
-                    "leader_target": float(domaine.leader_target),
-                })
-
-        return Response(data)
+        elif manager_id:
+            # Toute la ligne hiérarchique du manager, tous niveaux confondus
+            personnes = personnes.reporting_line(manager_id)
+        return personnes
 
     @action(detail=False, methods=["get"], url_path="competence_table",
         permission_classes=[IsAuthenticated])
     def competence_table(self, request):
         """Retourne un tableau [ {user, equipe, scores:{dom:%}, average:%} ] - Version optimisée et correcte"""
-        user_id   = request.query_params.get("user_id")
-        equipe_id = request.query_params.get("equipe_id")
-        projet_id = request.query_params.get("projet_id")
-
-        personnes = Personne.objects.all().prefetch_related('equipes')
-        if user_id:
-            personnes = personnes.filter(matricule=user_id)
-        elif equipe_id:
-            personnes = personnes.filter(equipes__id=equipe_id)
-        elif projet_id:
-            personnes = personnes.filter(projet_id=projet_id)
+        personnes = self._selection(request)
 
-        # 1. Requête unique et optimisée pour récupérer tous les résultats des utilisateurs filtrés
-        # On annote chaque résultat avec le score maximum possible pour son quiz.
-        user_quizzes = UserQuiz.objects.filter(
-            user__in=personnes,
-            completed=True
-        ).select_related(
-            'user', 'quiz__formation__domain'
-        ).annotate(
-            max_points=Sum('quiz__questions__point')
-        )
+        # Tableaux denses personnes × domaines, depuis les scores précalculés
+        matrix = CompetenceMatrix(personnes)
 
-        # 2. On traite les résultats en Python pour regrouper par utilisateur et par domaine
-        # La structure sera : { user_id: { domain_id: {'score': X, 'max': Y, 'name': '...' } } }
-        processed_data = {}
-        for uq in user_quizzes:
-            # S'assurer que le quiz est bien lié à un domaine
-            if not hasattr(uq.quiz, 'formation') or not uq.quiz.formation.domain:
-                continue
-
-            user_id = uq.user_id
-            domain = uq.quiz.formation.domain
-
-            # Initialiser les dictionnaires si c'est la première fois qu'on les rencontre
-            processed_data.setdefault(user_id, {})
-            processed_data[user_id].setdefault(domain.id, {'total_score': 0, 'total_max': 0, 'domain_name': domain.name})
-
-            # Agréger les scores
-            processed_data[user_id][domain.id]['total_score'] += uq.score
-            # S'assurer que max_points n'est pas None
-            processed_data[user_id][domain.id]['total_max'] += uq.max_points or 0
-
-        # 3. On construit la réponse finale
-        rows = []
-        all_domains = list(Domain.objects.all())          # on les lit une fois
-        domain_map = {d.id: d for d in all_domains}       # id → objet
-
-        for pers in personnes:
-            user_scores = processed_data.get(pers.matricule, {})
-            if not user_scores:
-                continue                                  # pas de quiz terminé
-
-            final_scores = {}
-            total_pct_sum = 0
-            domain_with_scores = 0                        # compteur local 💡
-
-            # domaines où l’utilisateur a un résultat
-            for dom_id, data in user_scores.items():
-                pct = round(float(data['total_score']) / data['total_max'] * 100) \
-                    if data['total_max'] else 0
-                d_obj = domain_map[dom_id]
-                final_scores[data['domain_name']] = {
-                    'score': pct,
-                    'prerequisites': float(d_obj.prerequisites_level),
-                    'consultant_target': float(d_obj.consultant_target),
-                    'leader_target': float(d_obj.leader_target),
-                }
-                total_pct_sum += pct
-                domain_with_scores += 1                   # ← on incrémente ici
-
-            # domaines sans résultat
-            for d in all_domains:
-                if d.name not in final_scores:
-                    final_scores[d.name] = {
-                        'score': None,
-                        'prerequisites': float(d.prerequisites_level),
-                        'consultant_target': float(d.consultant_target),
-                        'leader_target': float(d.leader_target),
-                    }
-
-            # moyenne sur les seuls domaines scorés
-            average = round(total_pct_sum / domain_with_scores) if domain_with_scores else 0
-
-            rows.append({
-                "user_id": pers.matricule,
-                "user"   : f"{pers.first_name} {pers.last_name}",
-                "equipe" : pers.equipes.first().name if pers.equipes.exists() else "__",
-                "scores" : final_scores,
-                "average": average,
-            })
+        # ?layout=compact : cibles des domaines une seule fois, scores en listes
+        if request.query_params.get("layout") == "compact":
+            return Response(matrix.compact())
+        return Response(matrix.rows())
 
-        return Response(rows)
+    @action(detail=False, methods=["get"], url_path="competence_table/export",
+        permission_classes=[IsAuthenticated], renderer_classes=[CSVRenderer, XLSXRenderer])
+    def competence_table_export(self, request):
+        """
+        Export du tableau des compétences : ?format=csv (par défaut, en flux)
+        ou ?format=xlsx (avec une feuille des domaines et du radar).
+        """
+        personnes = self._selection(request)
+        if request.accepted_renderer.format == 'xlsx':
+            return competence_xlsx_response(personnes, radar_data(personnes))
+        return competence_csv_response(personnes)
 
     @action(detail=True, methods=['post'], url_path='retake')
     @transaction.atomic
@@ -521,25 +400,57 @@ class QuizViewSet(viewsets.ModelViewSet):
             "max_attempts": quiz.max_attempts
         })
 
-class QuestionViewSet(viewsets.ModelViewSet):
+class QuizContentViewSet(viewsets.ModelViewSet):
+    """
+    Toute écriture sur une question ou une option change le corrigé :
+    la version du quiz concerné est incrémentée pour invalider le cache.
+    """
+    # (filtre sur Quiz, attribut de l'instance) qui désignent le quiz du contenu
+    quiz_lookup = ('pk', 'quiz_id')
+
+    def quiz_of(self, instance):
+        lookup, attribut = self.quiz_lookup
+        return Quiz.objects.get(**{lookup: getattr(instance, attribut)})
+
+    def perform_create(self, serializer):
+        super().perform_create(serializer)
+        self.quiz_of(serializer.instance).bump_version()
+
+    def perform_update(self, serializer):
+        ancien_quiz = self.quiz_of(serializer.instance)
+        super().perform_update(serializer)
+        ancien_quiz.bump_version()
+        nouveau_quiz = self.quiz_of(serializer.instance)
+        if nouveau_quiz.pk != ancien_quiz.pk:
+            nouveau_quiz.bump_version()
+
+    def perform_destroy(self, instance):
+        quiz = self.quiz_of(instance)
+        super().perform_destroy(instance)
+        quiz.bump_version()
+
+class QuestionViewSet(QuizContentViewSet):
     queryset = Question.objects.all()
     serializer_class = QuestionSerializer
+    quiz_lookup = ('pk', 'quiz_id')
 
-class OptionViewSet(viewsets.ModelViewSet):
+class OptionViewSet(QuizContentViewSet):
     queryset = Option.objects.all()
     serializer_class = OptionSerializer
+    quiz_lookup = ('questions__pk', 'question_id')
 
 class UserFormationViewSet(viewsets.ModelViewSet):
     queryset = UserFormation.objects.all()
     permission_classes    = [IsAuthenticated]               # 🔑
     authentication_classes = [JWTAuthentication, SessionAuthentication]
     def get_queryset(self):
-        return(
-            UserFormation.objects
-            .select_related('formation', 'formation__domain')
-            .filter(user=self.request.user,
-                    formation__statut='actif')
-        )
+        queryset = UserFormation.objects.filter(user=self.request.user, formation__statut='actif')
+        if self.action == 'list':
+            # Formations annotées et préchargées comme dans la liste des formations
+            return queryset.prefetch_related(
+                Prefetch('formation', queryset=Formation.objects.with_list_stats())
+            )
+        return queryset.select_related('formation', 'formation__domain')
         
     def get_permissions(self):
         if self.action == 'retrieve':
@@ -552,44 +463,45 @@ class UserFormationViewSet(viewsets.ModelViewSet):
         user = request.user
         data = request.data
 
-        # --- ACTION 1: Compléter un module spécifique ---
-        # Le front-end enverra: { "completed_module_id": ID }
-        module_id = data.get('completed_module_id')
-        if module_id:
-            try:
-                module = instance.formation.modules.get(id=module_id)
-                user_module, _ = UserModule.objects.get_or_create(user=user, module=module)
-                user_module.completed = True
-                user_module.save() # Le signal mettra à jour la progression
-            except Module.DoesNotExist:
-                return Response({"error": "Module non trouvé."}, status=status.HTTP_404_NOT_FOUND)
-
-        # --- ACTION 2: Valider un onglet entier ---
-        # Le front-end enverra: { "completed_tab": "overview" | "resources" }
-        tab_name = data.get('completed_tab')
-        if tab_name:
-            if instance.completed_steps is None:
-                instance.completed_steps = {}
-
-            if tab_name == 'overview':
-                instance.completed_steps['overview'] = True
-                instance.save(update_fields=['completed_steps'])
+        # Les suivis touchés sont mis à jour une seule fois, à la validation
+        with transaction.atomic():
+            # --- ACTION 1: Compléter un module spécifique ---
+            # Le front-end enverra: { "completed_module_id": ID }
+            module_id = data.get('completed_module_id')
+            if module_id:
+                try:
+                    module = instance.formation.modules.get(id=module_id)
+                    user_module, _ = UserModule.objects.get_or_create(user=user, module=module)
+                    user_module.completed = True
+                    user_module.save() # Le signal mettra à jour la progression
+                except Module.DoesNotExist:
+                    return Response({"error": "Module non trouvé."}, status=status.HTTP_404_NOT_FOUND)
+
+            # --- ACTION 2: Valider un onglet entier ---
+            # Le front-end enverra: { "completed_tab": "overview" | "resources" }
+            tab_name = data.get('completed_tab')
+            if tab_name:
+                if instance.completed_steps is None:
+                    instance.completed_steps = {}
+
+                if tab_name == 'overview':
+                    delta = instance.mark_overview_done()
+                    instance.save(update_fields=['completed_steps'])
+                    if delta:
+                        mark_progress_dirty(instance.user_id, [instance.formation_id], delta)
             
-            elif tab_name == 'resources':
-                # Marquer toutes les ressources de cette formation comme "lues"
-                for resource in instance.formation.ressources.all():
-                    user_resource, _ = UserResource.objects.get_or_create(user=user, resource=resource)
-                    user_resource.read = True
-                    user_resource.save() # Le signal se déclenchera pour chaque, mettant à jour la progression
-                instance.completed_steps['resources'] = True
-                instance.save(update_fields=['completed_steps'])
+                elif tab_name == 'resources':
+                    # Marquer toutes les ressources de cette formation comme "lues"
+                    mark_resources_read(user.pk, instance.formation)
+                    instance.completed_steps['resources'] = True
+                    instance.save(update_fields=['completed_steps'])
             
-            elif tab_name == 'quiz' and hasattr(instance.formation, 'quiz'):
-                user_quiz, _ = UserQuiz.objects.get_or_create(user=user, quiz=instance.formation.quiz)
-                user_quiz.completed = True
-                user_quiz.save()
-                instance.completed_steps['quiz'] = True
-                instance.save(update_fields=['completed_steps'])
+                elif tab_name == 'quiz' and hasattr(instance.formation, 'quiz'):
+                    user_quiz, _ = UserQuiz.objects.get_or_create(user=user, quiz=instance.formation.quiz)
+                    user_quiz.completed = True
+                    user_quiz.save()
+                    instance.completed_steps['quiz'] = True
+                    instance.save(update_fields=['completed_steps'])
 
         # Après toute action, renvoyer l'état complet et à jour de la formation
         # L'instance de la formation est `instance.formation`
@@ -601,6 +513,16 @@ class UserFormationViewSet(viewsets.ModelViewSet):
             return FormationDetailSerializer
         return UserFormationDetailSerializer
 
+    def list(self, request, *args, **kwargs):
+        user_formations = list(self.filter_queryset(self.get_queryset()))
+        # Progression des équipes calculée une fois pour toutes les formations suivies
+        context = {
+            **self.get_serializer_context(),
+            'teams_progress': teams_progress_by_formation(uf.formation for uf in user_formations),
+        }
+        serializer = self.get_serializer_class()(user_formations, many=True, context=context)
+        return Response(serializer.data)
+
     @action(detail=False, methods=['get'], url_path='by-formation/(?P<formation_id>[^/.]+)')
     def by_formation(self, request, formation_id=None):
         user = request.user
@@ -636,49 +558,51 @@ class UserFormationViewSet(viewsets.ModelViewSet):
             except Formation.DoesNotExist:
                 return Response({"error": "Formation introuvable"}, status=404)
 
-            # ÉTAPE CLÉ : On récupère ou on crée l'objet de suivi.
-            # Ceci résout définitivement l'erreur "DoesNotExist".
-            user_formation, created = UserFormation.objects.get_or_create(
-                user=user,
-                formation=formation
-            )
-
-            delta_time_seconds = data.get("updates", {}).get("delta_time")
-            if delta_time_seconds:
-                try:
-                    # On l'ajoute au temps total existant
-                    user_formation.time_spent += timedelta(seconds=int(delta_time_seconds))
-                except (TypeError, ValueError):
-                    # Ignorer si la valeur n'est pas un nombre valide
-                    pass
-
-            if module_id:
-                try:
-                    module = formation.modules.get(id=module_id)
-                    user_module, _ = UserModule.objects.get_or_create(user=user, module=module)
-                    user_module.completed = True
-                    user_module.save()
-                except Module.DoesNotExist:
-                    return Response({"error": "Module non trouvé."}, status=status.HTTP_404_NOT_FOUND)
-
-            if tab_name:
-                if user_formation.completed_steps is None:
-                    user_formation.completed_steps = {}
+            # Les suivis touchés sont mis à jour une seule fois, à la validation
+            with transaction.atomic():
+                # ÉTAPE CLÉ : On récupère ou on crée l'objet de suivi.
+                # Ceci résout définitivement l'erreur "DoesNotExist".
+                user_formation, created = UserFormation.objects.get_or_create(
+                    user=user,
+                    formation=formation
+                )
 
-                if tab_name == 'overview':
-                    user_formation.completed_steps['overview'] = True
-                elif tab_name == 'resources':
-                    for resource in formation.ressources.all():
-                        user_resource, _ = UserResource.objects.get_or_create(user=user, resource=resource)
-                        user_resource.read = True
-                        user_resource.save()
-                    user_formation.completed_steps['resources'] = True
-                elif tab_name == 'quiz' and hasattr(formation, 'quiz'):
-                    user_formation.completed_steps['quiz'] = True
-                    
-                user_formation.update_progress()
-                
-                user_formation.save()
+                delta_time_seconds = data.get("updates", {}).get("delta_time")
+                if delta_time_seconds:
+                    try:
+                        # On l'ajoute au temps total existant
+                        user_formation.time_spent += timedelta(seconds=int(delta_time_seconds))
+                    except (TypeError, ValueError):
+                        # Ignorer si la valeur n'est pas un nombre valide
+                        pass
+
+                if module_id:
+                    try:
+                        module = formation.modules.get(id=module_id)
+                        user_module, _ = UserModule.objects.get_or_create(user=user, module=module)
+                        user_module.completed = True
+                        user_module.save()
+                    except Module.DoesNotExist:
+                        return Response({"error": "Module non trouvé."}, status=status.HTTP_404_NOT_FOUND)
+
+                if tab_name:
+                    if user_formation.completed_steps is None:
+                        user_formation.completed_steps = {}
+
+                    overview_delta = 0
+                    if tab_name == 'overview':
+                        overview_delta = user_formation.mark_overview_done()
+                    elif tab_name == 'resources':
+                        mark_resources_read(user.pk, formation)
+                        user_formation.completed_steps['resources'] = True
+                    elif tab_name == 'quiz' and hasattr(formation, 'quiz'):
+                        user_formation.completed_steps['quiz'] = True
+
+                    # La progression est tenue à jour par des deltas atomiques : on
+                    # n'enregistre que les champs modifiés ici pour ne pas l'écraser.
+                    user_formation.save(update_fields=['completed_steps', 'time_spent'])
+                    if overview_delta:
+                        mark_progress_dirty(user.pk, [formation.pk], overview_delta)
 
             # On renvoie toujours l'objet Formation complet et à jour
             serializer = FormationDetailSerializer(formation, context={'request': request})
@@ -703,53 +627,10 @@ class UserFormationViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_403_FORBIDDEN
             )
 
-        # --- ÉTAPE 1 : ARCHIVAGE (si un quiz existe) ---
-        if hasattr(formation, 'quiz'):
-            quiz = formation.quiz
-            
-            # Récupérer les 3 dernières tentatives de cet utilisateur pour ce quiz
-            latest_attempts = UserQuiz.objects.filter(
-                user=user, quiz=quiz
-            ).order_by('-completed_at')[:3]
-            
-            # Préparer les objets pour la création en masse
-            history_to_create = [
-                UserQuizHistory(
-                    user=user,
-                    formation=formation,
-                    score=attempt.score,
-                    completed_at=attempt.completed_at,
-                    time_spent=attempt.time_spent
-                ) for attempt in latest_attempts
-            ]
-            
-            # Créer tous les enregistrements d'historique en une seule requête
-            if history_to_create:
-                UserQuizHistory.objects.bulk_create(history_to_create)
-
-        # --- ÉTAPE 2 : RÉINITIALISATION (logique originale) ---
-
-        # a. Supprimer les suivis des modules liés
-        UserModule.objects.filter(user=user, module__in=formation.modules.all()).delete()
+        # Archivage des 3 dernières tentatives, puis réinitialisation
+        reset_progress(formation, [user.pk])
 
-        # b. Supprimer les suivis des ressources liées
-        UserResource.objects.filter(user=user, resource__in=formation.ressources.all()).delete()
-
-        # c. Supprimer les suivis du quiz (UserQuiz et toutes les UserAnswer)
-        if hasattr(formation, 'quiz'):
-            quiz = formation.quiz
-            UserQuiz.objects.filter(user=user, quiz=quiz).delete()
-            UserAnswer.objects.filter(user=user, question__quiz=quiz).delete()
-
-        # d. Réinitialiser l'objet UserFormation principal
-        user_formation.progress = 0
-        user_formation.status = 'nouvelle'
-        user_formation.completed_steps = {}
-        user_formation.last_accessed = None
-        user_formation.time_spent = timedelta(0)
-        user_formation.save()
-
-        # e. Renvoyer l'état mis à jour de la formation
+        # Renvoyer l'état mis à jour de la formation
         serializer = FormationDetailSerializer(formation, context={'request': request})
         return Response(serializer.data, status=status.HTTP_200_OK)
         
@@ -766,7 +647,7 @@ class UserFormationViewSet(viewsets.ModelViewSet):
         formation = get_object_or_404(Formation, pk=pk)  # self fait référence au FormationViewSet
 
         # Identifier tous les utilisateurs inscrits à la formation
-        enrolled_users = Personne.objects.filter(userformation__formation=formation)
+        enrolled_users = UserFormation.objects.filter(formation=formation).values('user_id')
 
         if not enrolled_users.exists():
             return Response(
@@ -774,59 +655,9 @@ class UserFormationViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_200_OK
             )
 
-        # Pour chaque utilisateur inscrit, appliquer la même logique que restart
-        for user in enrolled_users:
-            # Récupérer l'objet UserFormation pour cet utilisateur
-            try:
-                user_formation = UserFormation.objects.get(user=user, formation=formation)
-            except UserFormation.DoesNotExist:
-                continue  # Passer à l'utilisateur suivant si pas de UserFormation
-
-            # --- ÉTAPE 1 : ARCHIVAGE (si un quiz existe) ---
-            if hasattr(formation, 'quiz'):
-                quiz = formation.quiz
-                
-                # Récupérer les 3 dernières tentatives de cet utilisateur pour ce quiz
-                latest_attempts = UserQuiz.objects.filter(
-                    user=user, quiz=quiz
-                ).order_by('-completed_at')[:3]
-                
-                # Préparer les objets pour la création en masse
-                history_to_create = [
-                    UserQuizHistory(
-                        user=user,
-                        formation=formation,
-                        score=attempt.score,
-                        completed_at=attempt.completed_at,
-                        time_spent=attempt.time_spent
-                    ) for attempt in latest_attempts
-                ]
-                
-                # Créer tous les enregistrements d'historique en une seule requête
-                if history_to_create:
-                    UserQuizHistory.objects.bulk_create(history_to_create)
-
-            # --- ÉTAPE 2 : RÉINITIALISATION (logique identique à restart) ---
-
-            # a. Supprimer les suivis des modules liés
-            UserModule.objects.filter(user=user, module__in=formation.modules.all()).delete()
-
-            # b. Supprimer les suivis des ressources liées
-            UserResource.objects.filter(user=user, resource__in=formation.ressources.all()).delete()
-
-            # c. Supprimer les suivis du quiz (UserQuiz et toutes les UserAnswer)
-            if hasattr(formation, 'quiz'):
-                quiz = formation.quiz
-                UserQuiz.objects.filter(user=user, quiz=quiz).delete()
-                UserAnswer.objects.filter(user=user, question__quiz=quiz).delete()
-
-            # d. Réinitialiser l'objet UserFormation principal
-            user_formation.progress = 0
-            user_formation.status = 'nouvelle'
-            user_formation.completed_steps = {}
-            user_formation.last_accessed = None
-            user_formation.time_spent = timedelta(0)
-            user_formation.save()
+        # Même logique que restart, appliquée à tous les inscrits d'un coup :
+        # archivage des 3 dernières tentatives de chacun, puis réinitialisation
+        reset_progress(formation, enrolled_users)
 
         return Response(
             {"status": "success", "message": f"La formation '{formation.titre}' a été réinitialisée pour tous les collaborateurs."},
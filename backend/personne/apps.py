@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class PersonneConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'personne'
+
+    def ready(self):
+        import personne.signals
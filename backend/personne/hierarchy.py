@@ -0,0 +1,78 @@
+import logging
+
+from django.db.models import Count, Prefetch
+
+from formation.models import Domain, Equipe
+from formation.serializers import EquipeSerializer
+from .models import Personne
+from .serializers import PersonneHierarchieSerializer
+
+logger = logging.getLogger(__name__)
+
+
+def _equipes_par_personne():
+    """
+    Sérialise chaque équipe une seule fois et retourne
+    {matricule: [équipe sérialisée, ...]}.
+    """
+    equipes = Equipe.objects.prefetch_related(
+        'assigned_users',
+        Prefetch('domains', queryset=Domain.objects.annotate(nb_formations=Count('formations'))),
+    )
+    equipes_data = {equipe.id: data for equipe, data in zip(equipes, EquipeSerializer(equipes, many=True).data)}
+
+    par_personne = {}
+    memberships = Equipe.assigned_users.through.objects.values_list('personne_id', 'equipe_id').order_by('equipe_id')
+    for matricule, equipe_id in memberships:
+        par_personne.setdefault(matricule, []).append(equipes_data[equipe_id])
+    return par_personne
+
+
+def build_hierarchy():
+    """
+    Construit l'organigramme (manager → subordonnés) en mémoire.
+
+    Toutes les personnes et leurs équipes sont chargées en quelques requêtes,
+    puis l'arbre est assemblé à partir d'un dictionnaire manager → subordonnés.
+    Le JSON produit a la même forme que l'ancien PersonneHierarchieSerializer
+    récursif. Les personnes prises dans une boucle de managers (A → B → A)
+    n'ont pas de racine : elles sont ignorées et signalées dans les logs.
+    """
+    personnes = list(Personne.objects.all())
+    equipes = _equipes_par_personne()
+
+    subordonnes = {}
+    racines = []
+    for personne in personnes:
+        if personne.manager_id is None:
+            racines.append(personne)
+        else:
+            subordonnes.setdefault(personne.manager_id, []).append(personne)
+
+    noeuds = {
+        personne.matricule: {
+            **data,
+            'subordinates': [],
+            'equipes': equipes.get(personne.matricule, []),
+        }
+        for personne, data in zip(personnes, PersonneHierarchieSerializer(personnes, many=True).data)
+    }
+
+    # Parcours itératif depuis les racines : une personne n'est placée qu'une fois
+    visites = set()
+    pile = [personne.matricule for personne in racines]
+    visites.update(pile)
+    while pile:
+        matricule = pile.pop()
+        for subordonne in subordonnes.get(matricule, []):
+            if subordonne.matricule in visites:
+                continue
+            visites.add(subordonne.matricule)
+            noeuds[matricule]['subordinates'].append(noeuds[subordonne.matricule])
+            pile.append(subordonne.matricule)
+
+    orphelins = [personne.matricule for personne in personnes if personne.matricule not in visites]
+    if orphelins:
+        logger.warning("Hiérarchie : boucle de managers détectée, personnes ignorées : %s", orphelins)
+
+    return [noeuds[personne.matricule] for personne in racines]
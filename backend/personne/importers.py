@@ -0,0 +1,330 @@
+import pandas as pd
+from django.db import transaction
+
+from projet.models import Projet
+from .models import Personne
+from .name_index import PersonneNameIndex
+
+POSITIONS_VALIDES = {'I1', 'I2', 'I3', 'I4', 'I5', 'I6', 'T1', 'T2', 'T3', 'T4', 'T5', 'T6'}
+
+# Nombre de lignes envoyées par requête pour les bulk_create / bulk_update
+BATCH_SIZE = 500
+# Fréquence (en lignes) des notifications de progression
+PROGRESS_EVERY = 200
+
+PROJET_FIELDS = ['ordre_travail', 'sop', 'final_client', 'date_demarrage']
+PERSONNE_FIELDS = [
+    'dt_Embauche', 'position', 'manager', 'status', 'profile', 'projet',
+    'experience_expleo', 'experience_total',
+]
+
+
+class ChargePlanError(Exception):
+    """Fichier ou feuille de plan de charge inexploitable."""
+
+
+def read_charge_plan(source, sheet_name, nrows=None):
+    """
+    Lit la feuille demandée et retourne (DataFrame, nom de la colonne "Début PdC").
+    Lève ChargePlanError avec un message lisible si le fichier est inexploitable.
+    `nrows=0` ne lit que la ligne d'en-tête.
+    """
+    try:
+        xls = pd.ExcelFile(source)
+        if sheet_name not in xls.sheet_names:
+            raise ChargePlanError(f"La feuille '{sheet_name}' n'existe pas dans le fichier Excel.")
+        df = pd.read_excel(xls, sheet_name=sheet_name, nrows=nrows)
+    except ChargePlanError:
+        raise
+    except Exception as e:
+        raise ChargePlanError(f"Erreur de lecture Excel : {str(e)}")
+
+    for col in df.columns:
+        if str(col).strip().startswith('Début PdC'):
+            return df, col
+    raise ChargePlanError("Aucune colonne commençant par 'Début Pdc' n'a été trouvée dans le fichier.")
+
+
+def validate_charge_plan(source, sheet_name):
+    """Vérifie le format du fichier et l'en-tête de la feuille, sans lire les lignes."""
+    read_charge_plan(source, sheet_name, nrows=0)
+    if hasattr(source, 'seek'):
+        source.seek(0)
+
+
+def _clean(row, column):
+    """Retourne la valeur nettoyée d'une cellule, ou None si elle est vide."""
+    value = row.get(column)
+    return str(value).strip() if pd.notna(value) else None
+
+
+def _split_full_name(full_name):
+    """
+    Sépare "NOM Prénom" : les mots entièrement en MAJUSCULES forment
+    le nom de famille, le reste forme le prénom.
+    """
+    last_name_parts = []
+    first_name_parts = []
+    for part in full_name.strip().split():
+        if part.isupper():
+            last_name_parts.append(part)
+        else:
+            first_name_parts.append(part)
+    return " ".join(first_name_parts), " ".join(last_name_parts)
+
+
+def _parse_embauche(raw_embauche):
+    try:
+        if pd.isna(raw_embauche):
+            return None
+        if isinstance(raw_embauche, str):
+            return pd.to_datetime(raw_embauche).date()
+        if isinstance(raw_embauche, pd.Timestamp):
+            return raw_embauche.date()
+        return raw_embauche
+    except Exception:
+        return None
+
+
+def _projet_differs(personne, projet):
+    if projet.pk is None:
+        # Projet créé par cet import : seule une affectation faite plus haut
+        # dans ce même import peut déjà y correspondre.
+        return not (Personne.projet.is_cached(personne) and personne.projet is projet)
+    return personne.projet_id != projet.pk
+
+
+class ChargePlanImporter:
+    """
+    Importe les projets et les personnes d'une feuille "Plan de charge".
+
+    Les projets et personnes existants sont chargés une seule fois en mémoire
+    (indexés par nom et par matricule) et les différences sont calculées en
+    Python, sans rien écrire. Elles sont ensuite appliquées par lots avec
+    bulk_create / bulk_update dans une seule transaction courte.
+
+    `on_progress(step, processed, total)` est appelé régulièrement pendant
+    le calcul, hors transaction, pour suivre l'avancement.
+    """
+
+    def __init__(self, df, date_column_name, batch_size=BATCH_SIZE):
+        self.rows = df.to_dict('records')
+        self.date_column_name = date_column_name
+        self.batch_size = batch_size
+        # Noms de managers qui correspondent à plusieurs personnes
+        self.managers_ambigus = []
+
+    def run(self, on_progress=None):
+        self.on_progress = on_progress
+        projets = self.plan_projets()
+        personnes = self.plan_personnes()
+        self._notify('écriture', 0, len(self.rows))
+        with transaction.atomic():
+            self.apply()
+        self._notify('écriture', len(self.rows), len(self.rows))
+        return {
+            "personnes": personnes,
+            "projets": projets,
+        }
+
+    def _notify(self, step, processed, total):
+        if self.on_progress is not None:
+            self.on_progress(step, processed, total)
+
+    def _iter_rows(self, step):
+        total = len(self.rows)
+        for i, row in enumerate(self.rows):
+            if i % PROGRESS_EVERY == 0:
+                self._notify(step, i, total)
+            yield row
+        self._notify(step, total, total)
+
+    def apply(self):
+        # Les projets d'abord : les nouvelles personnes peuvent y être rattachées
+        Projet.objects.bulk_create(self.projets_a_creer, batch_size=self.batch_size)
+        if self.projets_a_modifier:
+            Projet.objects.bulk_update(self.projets_a_modifier, PROJET_FIELDS, batch_size=self.batch_size)
+        Personne.objects.bulk_create(self.personnes_a_creer, batch_size=self.batch_size)
+        if self.personnes_a_modifier:
+            Personne.objects.bulk_update(self.personnes_a_modifier, PERSONNE_FIELDS, batch_size=self.batch_size)
+        # bulk_* ne passe pas par save() : chemins hiérarchiques recalculés en une passe
+        Personne.objects.rebuild_org_paths(batch_size=self.batch_size)
+
+    # ------------------------------------------------------------------
+    # Projets
+    # ------------------------------------------------------------------
+    def _projet_data(self, row, client_final):
+        raw_sop = str(row.get("I/E", "")).strip().lower()
+        donnees_projet = {
+            'ordre_travail': str(row.get("WO", "")).strip(),
+            'sop': "Externe" if raw_sop.startswith("exter") else "Interne",
+            'final_client': str(row.get("Client", client_final)),
+        }
+        raw_date_demarrage = row.get(self.date_column_name)
+        if pd.notna(raw_date_demarrage):
+            date_dt = pd.to_datetime(raw_date_demarrage, errors='coerce')
+            if pd.notna(date_dt):
+                donnees_projet['date_demarrage'] = date_dt.date()
+        return donnees_projet
+
+    def plan_projets(self):
+        # nom → liste des projets portant ce nom (plusieurs = ambiguïté)
+        self.projets_par_nom = {}
+        for projet in Projet.objects.order_by('projet_id'):
+            self.projets_par_nom.setdefault(projet.nom, []).append(projet)
+
+        to_create, to_update = [], {}
+        crees, modifies, ignores = 0, 0, 0
+
+        for row in self._iter_rows('projets'):
+            nom_projet = str(row.get("Project name", "")).strip()
+            client_final = str(row.get("Client", "")).strip()
+
+            # On a besoin au minimum d'un nom et d'un client pour identifier le projet
+            if not nom_projet or not client_final:
+                ignores += 1
+                continue
+
+            donnees_projet = self._projet_data(row, client_final)
+            projets_existants = self.projets_par_nom.get(nom_projet, [])
+
+            if len(projets_existants) == 1:
+                projet = projets_existants[0]
+                has_changed = False
+                for key, value in donnees_projet.items():
+                    if getattr(projet, key) != value:
+                        setattr(projet, key, value)
+                        has_changed = True
+                if has_changed:
+                    # Un projet créé dans ce même import est simplement modifié en mémoire
+                    if projet.pk is not None:
+                        to_update[projet.pk] = projet
+                    modifies += 1
+
+            elif not projets_existants:
+                projet = Projet(nom=nom_projet, **donnees_projet)
+                to_create.append(projet)
+                self.projets_par_nom[nom_projet] = [projet]
+                crees += 1
+
+            else:
+                # Plusieurs projets ont le même nom : on ignore la ligne
+                # pour ne pas corrompre les données.
+                ignores += 1
+
+        self.projets_a_creer = to_create
+        self.projets_a_modifier = list(to_update.values())
+
+        return {"créés": crees, "modifiés": modifies, "ignorés": ignores}
+
+    # ------------------------------------------------------------------
+    # Personnes
+    # ------------------------------------------------------------------
+    def _find_manager(self, manager_name):
+        match = self.name_index.lookup(manager_name)
+        if match.ambiguous:
+            self.managers_ambigus.append({
+                "manager": manager_name,
+                "candidats": [p.matricule for p in match.candidates],
+                "retenu": match.personne.matricule,
+            })
+        return match.personne
+
+    def plan_personnes(self):
+        personnes = list(Personne.objects.all())
+        personnes_par_matricule = {p.matricule: p for p in personnes}
+        self.name_index = PersonneNameIndex(personnes)
+
+        to_create, to_update = {}, {}
+        created, updated, skipped = 0, 0, 0
+
+        for row in self._iter_rows('personnes'):
+            matricule = str(row.get("Matricule")).strip()
+            full_name = str(row.get("Name")).strip()
+            date_embauche = _parse_embauche(row.get("Date d'embauche"))
+            sexe = _clean(row, "Sexe")
+
+            raw_position = _clean(row, "Position") or ''
+            position_f = raw_position if raw_position in POSITIONS_VALIDES else 'N/A'
+
+            manager_name = _clean(row, "Hierarchical manager")
+            status_f = _clean(row, "Status")
+            profile_f = _clean(row, "Profil")
+            projet_name = _clean(row, "Project name")
+
+            projets = self.projets_par_nom.get(projet_name) if projet_name else None
+            projet_c = projets[0] if projets else None
+
+            if not matricule or matricule == "nan":
+                skipped += 1
+                continue
+
+            manager_obj = self._find_manager(manager_name) if manager_name else None
+
+            personne = personnes_par_matricule.get(matricule)
+            if personne is not None:
+                # Mise à jour sans changer nom/prénom
+                has_changed = False
+                if date_embauche is not None and personne.dt_Embauche != date_embauche:
+                    personne.dt_Embauche = date_embauche
+                    has_changed = True
+
+                if position_f and personne.position != position_f:
+                    personne.position = position_f
+                    has_changed = True
+
+                if manager_obj and personne.manager_id != manager_obj.pk:
+                    personne.manager = manager_obj
+                    has_changed = True
+
+                if status_f and personne.status != status_f:
+                    personne.status = status_f
+                    has_changed = True
+
+                if profile_f and personne.profile != profile_f:
+                    personne.profile = profile_f
+                    has_changed = True
+
+                if projet_c and _projet_differs(personne, projet_c):
+                    personne.projet = projet_c
+                    has_changed = True
+
+                if has_changed:
+                    if matricule not in to_create:
+                        to_update[matricule] = personne
+                    updated += 1
+            else:
+                first_name, last_name = _split_full_name(full_name)
+                personne = Personne(
+                    matricule=matricule,
+                    first_name=first_name,
+                    last_name=last_name,
+                    sexe=sexe or "Homme",
+                    dt_Debut_Carriere=None,  # Pas de date de début de carrière dans l'import
+                    dt_Embauche=date_embauche,
+                    position=position_f,
+                    manager=manager_obj,
+                    role='COLLABORATEUR',
+                    projet=projet_c,
+                    status=status_f,
+                    profile=profile_f,
+                    is_active=False,
+                )
+                # Pas de hachage ligne à ligne (coûteux) : le compte, inactif,
+                # reçoit son mot de passe à l'activation (réinitialisation).
+                personne.set_unusable_password()
+                to_create[matricule] = personne
+                personnes_par_matricule[matricule] = personne
+                self.name_index.add(personne)
+                created += 1
+
+        # bulk_create / bulk_update n'appellent pas Personne.save() :
+        # on recalcule donc les expériences ici.
+        for personne in [*to_create.values(), *to_update.values()]:
+            personne.experience_expleo = personne.calcul_experience_expleo()
+            personne.experience_total = personne.calcul_experience_total()
+
+        self.personnes_a_creer = list(to_create.values())
+        self.personnes_a_modifier = list(to_update.values())
+
+        return {"créés": created, "modifiés": updated, "ignorés": skipped}
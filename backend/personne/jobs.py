@@ -0,0 +1,80 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from .importers import ChargePlanError, ChargePlanImporter, read_charge_plan
+from .models import ImportJob
+from .snapshots import record_bench_prod, write_month_snapshot
+
+logger = logging.getLogger(__name__)
+
+# Un seul worker : les imports sont sérialisés (SQLite n'accepte qu'un écrivain)
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='import-plan-de-charge')
+
+# Un job en attente / en cours sans nouvelle depuis ce délai est considéré
+# comme perdu (processus redémarré pendant l'import)
+STALE_AFTER = timedelta(minutes=15)
+
+
+def enqueue_import_job(job):
+    """Lance le job en arrière-plan une fois la transaction courante validée."""
+    transaction.on_commit(lambda: _executor.submit(run_import_job, job.pk))
+
+
+def _update(job_id, **fields):
+    # update() ne passe pas par auto_now : le signe de vie est posé ici
+    ImportJob.objects.filter(pk=job_id).update(updated_at=timezone.now(), **fields)
+
+
+def fail_stale_jobs(queryset=None):
+    """Passe en échec les jobs interrompus ; retourne leur nombre."""
+    queryset = ImportJob.objects.all() if queryset is None else queryset
+    now = timezone.now()
+    return queryset.filter(
+        status__in=['en_attente', 'en_cours'], updated_at__lt=now - STALE_AFTER,
+    ).update(
+        status='echec', finished_at=now, updated_at=now,
+        errors=["Import interrompu (le serveur a redémarré pendant le traitement)."],
+    )
+
+
+def run_import_job(job_id):
+    try:
+        job = ImportJob.objects.select_related('fichier').get(pk=job_id)
+        _update(job_id, status='en_cours', started_at=timezone.now())
+
+        if not job.fichier or not job.fichier.fichier:
+            raise ChargePlanError("Le fichier importé n'est plus disponible.")
+
+        df, date_column_name = read_charge_plan(job.fichier.fichier.path, job.sheet_name)
+
+        def on_progress(step, processed, total):
+            _update(job_id, step=step, processed_rows=processed, total_rows=total)
+
+        importer = ChargePlanImporter(df, date_column_name)
+        résumé = importer.run(on_progress=on_progress)
+
+        # Snapshot des mois et effectifs bench/production pour le graphique (non bloquant)
+        try:
+            _update(job_id, step='snapshot')
+            index = write_month_snapshot(job.fichier.fichier.path)
+            record_bench_prod(job, job.fichier.fichier.path, index)
+        except Exception:
+            logger.exception("Impossible d'écrire le snapshot du plan de charge (job %s)", job_id)
+
+        _update(
+            job_id,
+            status='terminee',
+            finished_at=timezone.now(),
+            summary={"résumé": résumé, "managers_ambigus": importer.managers_ambigus},
+        )
+    except ChargePlanError as e:
+        _update(job_id, status='echec', finished_at=timezone.now(), errors=[str(e)])
+    except Exception as e:
+        logger.exception("Échec de l'import du plan de charge (job %s)", job_id)
+        _update(job_id, status='echec', finished_at=timezone.now(), errors=[f"Erreur interne : {str(e)}"])
+    finally:
+        close_old_connections()
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('personne', '0008_importjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BenchProdSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.PositiveSmallIntegerField()),
+                ('position', models.PositiveSmallIntegerField()),
+                ('month_label', models.CharField(max_length=20)),
+                ('bench_count', models.PositiveIntegerField(default=0)),
+                ('prod_count', models.PositiveIntegerField(default=0)),
+                ('import_job', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='bench_prod', to='personne.importjob')),
+            ],
+            options={
+                'ordering': ['year', 'position'],
+                'indexes': [models.Index(fields=['year', 'import_job', 'position'], name='personne_be_year_06cb71_idx')],
+                'constraints': [models.UniqueConstraint(fields=('import_job', 'year', 'position'), name='unique_bench_prod_month')],
+            },
+        ),
+    ]
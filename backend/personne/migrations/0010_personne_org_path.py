@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:14
+
+from django.db import migrations, models
+
+
+def remplir_org_path(apps, schema_editor):
+    Personne = apps.get_model('personne', 'Personne')
+    rows = list(Personne.objects.values_list('matricule', 'manager_id'))
+    subordonnes = {}
+    for matricule, manager_id in rows:
+        subordonnes.setdefault(manager_id, []).append(matricule)
+
+    paths = {}
+    # Racines d'abord, puis un membre de chaque boucle éventuelle de managers
+    for racine in subordonnes.get(None, []) + [m for m, _ in rows]:
+        pile = [(racine, '/')]
+        while pile:
+            matricule, parent_path = pile.pop()
+            if matricule in paths:
+                continue
+            paths[matricule] = f"{parent_path}{matricule}/"
+            pile.extend((s, paths[matricule]) for s in subordonnes.get(matricule, []))
+
+    Personne.objects.bulk_update(
+        [Personne(matricule=m, org_path=path) for m, path in paths.items()],
+        ['org_path'], batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('personne', '0009_benchprodsnapshot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='personne',
+            name='org_path',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=1024),
+        ),
+        migrations.RunPython(remplir_org_path, migrations.RunPython.noop),
+    ]
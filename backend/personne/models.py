@@ -1,7 +1,57 @@
+import logging
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, PermissionsMixin
 from django.db import models
+from django.db.models import Prefetch, Value
+from django.db.models.functions import Concat, Substr
 from datetime import date
 
+logger = logging.getLogger(__name__)
+
+# Séparateur du chemin hiérarchique : "/CL/TL2/TL1/matricule/"
+ORG_PATH_SEP = '/'
+
+
+class PersonneQuerySet(models.QuerySet):
+    def reporting_line(self, matricule, include_self=False):
+        """
+        Toutes les personnes sous `matricule`, à tous les niveaux : le chemin
+        du manager est lu d'abord, puis filtré par préfixe (LIKE 'chemin%',
+        servi par l'index sur org_path).
+        """
+        org_path = Personne.objects.filter(matricule=matricule).values_list('org_path', flat=True).first()
+        if not org_path:
+            return self.none()
+        qs = self.filter(org_path__startswith=org_path)
+        return qs if include_self else qs.exclude(matricule=matricule)
+
+    def with_related_info(self, fields=None):
+        """
+        Charge ce qu'affiche PersonneSerializer pour les champs `fields` (tous
+        par défaut) : manager, backup et projet (avec son TL) par jointure,
+        équipes préchargées avec leurs membres et leurs domaines. La liste
+        coûte alors un nombre constant de requêtes.
+        """
+        from formation.models import Domain, Equipe
+
+        def demande(name):
+            return fields is None or name in fields
+
+        qs = self.select_related(*(
+            relation for name, relation in (
+                ('manager_info', 'manager'),
+                ('backup_info', 'backup'),
+                ('projet_info', 'projet__tl'),
+            ) if demande(name)
+        ))
+        if demande('equipe_info'):
+            return qs.prefetch_related(Prefetch('equipes', queryset=Equipe.objects.prefetch_related(
+                Prefetch('assigned_users', queryset=Personne.objects.only('matricule', 'first_name', 'last_name')),
+                Prefetch('domains', queryset=Domain.objects.annotate(nb_formations=models.Count('formations'))),
+            )))
+        if demande('equipe_id'):
+            return qs.prefetch_related('equipes')
+        return qs
+
 
 class PersonneManager(BaseUserManager):
     def create_user(self, matricule, password=None, **extra_fields):
@@ -24,6 +74,46 @@ class PersonneManager(BaseUserManager):
 
         return self.create_user(matricule, password, **extra_fields)
 
+    def rebuild_org_paths(self, batch_size=500):
+        """
+        Recalcule org_path pour toute la base (après un import en masse, qui
+        ne passe pas par save()). Les personnes prises dans une boucle de
+        managers sont traitées comme des racines. Retourne le nombre de lignes
+        modifiées.
+        """
+        rows = list(self.values_list('matricule', 'manager_id', 'org_path'))
+        subordonnes = {}
+        for matricule, manager_id, _ in rows:
+            subordonnes.setdefault(manager_id, []).append(matricule)
+
+        paths = {}
+
+        def descendre(racine):
+            pile = [(racine, ORG_PATH_SEP)]
+            while pile:
+                matricule, parent_path = pile.pop()
+                if matricule in paths:
+                    continue
+                paths[matricule] = f"{parent_path}{matricule}{ORG_PATH_SEP}"
+                pile.extend((s, paths[matricule]) for s in subordonnes.get(matricule, []))
+
+        for racine in subordonnes.get(None, []):
+            descendre(racine)
+
+        en_boucle = [m for m, _, _ in rows if m not in paths]
+        if en_boucle:
+            logger.warning("Boucle de managers détectée pour : %s", en_boucle)
+        for matricule in en_boucle:
+            # Chaque boucle est rattachée sous un de ses membres, pris comme racine
+            descendre(matricule)
+
+        modifies = [
+            self.model(matricule=matricule, org_path=paths[matricule])
+            for matricule, _, org_path in rows if org_path != paths[matricule]
+        ]
+        self.bulk_update(modifies, ['org_path'], batch_size=batch_size)
+        return len(modifies)
+
 class Personne(AbstractBaseUser, PermissionsMixin):
     POSITION_CHOICES = [
         ('I1', 'I1'),
@@ -109,6 +199,11 @@ class Personne(AbstractBaseUser, PermissionsMixin):
         related_name='projet_persons'
     )
 
+    # Chemin matérialisé de la ligne hiérarchique, racine comprise et
+    # personne comprise : "/<matricule CL>/<matricule TL2>/.../<matricule>/".
+    # Maintenu par save() et par PersonneManager.rebuild_org_paths().
+    org_path = models.CharField(max_length=1024, blank=True, default='', db_index=True, editable=False)
+
 
     password = models.CharField(max_length=128)
     photo = models.ImageField(upload_to='photos/', blank=True, null=True)
@@ -121,7 +216,7 @@ class Personne(AbstractBaseUser, PermissionsMixin):
     is_superuser = models.BooleanField(default=False)
     is_active = models.BooleanField(default=True) 
 
-    objects = PersonneManager()
+    objects = PersonneManager.from_queryset(PersonneQuerySet)()
 
     def calcul_experience_expleo(self):
         today = date.today()
@@ -153,13 +248,55 @@ class Personne(AbstractBaseUser, PermissionsMixin):
         """Does the user have permissions to view the app `app_label`?"""
         return self.is_superuser
     
+    def compute_org_path(self):
+        """
+        Chemin hiérarchique d'après celui du manager. Une personne prise dans
+        une boucle de managers (tolérée à l'import) est traitée comme une
+        racine, comme dans rebuild_org_paths ; les serializers refusent de
+        créer une boucle.
+        """
+        parent_path = ORG_PATH_SEP
+        if self.manager_id:
+            parent_path = self.manager.org_path or f"{ORG_PATH_SEP}{self.manager_id}{ORG_PATH_SEP}"
+            if f"{ORG_PATH_SEP}{self.matricule}{ORG_PATH_SEP}" in parent_path:
+                logger.warning("Boucle de managers détectée pour : %s", [self.matricule])
+                parent_path = ORG_PATH_SEP
+        return f"{parent_path}{self.matricule}{ORG_PATH_SEP}"
+
+    def is_above(self, personne):
+        """Vrai si `personne` fait partie de la ligne hiérarchique de self."""
+        return f"{ORG_PATH_SEP}{self.matricule}{ORG_PATH_SEP}" in (personne.org_path or '') \
+            and personne.matricule != self.matricule
+
+    def ancestors(self):
+        """Tous les managers au-dessus de la personne (une seule requête)."""
+        matricules = [m for m in self.org_path.split(ORG_PATH_SEP) if m][:-1]
+        return Personne.objects.filter(matricule__in=matricules)
+
+    def reporting_line(self, include_self=False):
+        qs = Personne.objects.filter(org_path__startswith=self.org_path)
+        return qs if include_self else qs.exclude(matricule=self.matricule)
+
     def save(self, *args, **kwargs):
         # Calculer et stocker les expériences lors de la création ou de la mise à jour
         self.experience_expleo = self.calcul_experience_expleo()
         self.experience_total = self.calcul_experience_total()
-        
+
+        update_fields = kwargs.get('update_fields')
+        old_path = self.org_path
+        if update_fields is None or 'manager' in update_fields:
+            self.org_path = self.compute_org_path()
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'org_path'}
+
         super(Personne, self).save(*args, **kwargs)
 
+        # Un changement de manager déplace tout le sous-arbre : une seule requête
+        if old_path and old_path != self.org_path:
+            Personne.objects.filter(org_path__startswith=old_path).exclude(pk=self.pk).update(
+                org_path=Concat(Value(self.org_path), Substr('org_path', len(old_path) + 1))
+            )
+
 
 
 class ImportedExcel(models.Model):
@@ -169,3 +306,64 @@ class ImportedExcel(models.Model):
     def __str__(self):
         return f"Fichier importé le {self.importé_le.strftime('%Y-%m-%d %H:%M:%S')}"
 
+
+
+class ImportJob(models.Model):
+    """
+    Import d'un plan de charge exécuté en arrière-plan.
+    Le client interroge /api/personne/import-jobs/<id>/ pour suivre l'avancement.
+    """
+    STATUS_CHOICES = [
+        ('en_attente', 'En attente'),
+        ('en_cours', 'En cours'),
+        ('terminee', 'Terminée'),
+        ('echec', 'Échec'),
+    ]
+
+    fichier = models.ForeignKey(ImportedExcel, on_delete=models.SET_NULL, blank=True, null=True, related_name='jobs')
+    sheet_name = models.CharField(max_length=100)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='en_attente')
+    step = models.CharField(max_length=20, blank=True, default='')
+
+    total_rows = models.PositiveIntegerField(default=0)
+    processed_rows = models.PositiveIntegerField(default=0)
+    summary = models.JSONField(default=dict, blank=True)
+    errors = models.JSONField(default=list, blank=True)
+
+    created_by = models.ForeignKey(Personne, on_delete=models.SET_NULL, blank=True, null=True, related_name='import_jobs')
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+    # Dernier signe de vie du worker (mis à jour à chaque étape / progression)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"Import {self.pk} ({self.get_status_display()})"
+
+
+
+class BenchProdSnapshot(models.Model):
+    """
+    Effectifs au bench / en production par mois, calculés une fois à l'import
+    (colonnes R à AF de la feuille "Plan de charge ME <année>"). Les lignes des
+    imports précédents sont conservées pour garder l'historique.
+    """
+    import_job = models.ForeignKey(ImportJob, on_delete=models.CASCADE, related_name='bench_prod')
+    year = models.PositiveSmallIntegerField()
+    position = models.PositiveSmallIntegerField()
+    month_label = models.CharField(max_length=20)
+    bench_count = models.PositiveIntegerField(default=0)
+    prod_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['year', 'position']
+        indexes = [models.Index(fields=['year', 'import_job', 'position'])]
+        constraints = [
+            models.UniqueConstraint(fields=['import_job', 'year', 'position'], name='unique_bench_prod_month'),
+        ]
+
+    def __str__(self):
+        return f"{self.month_label} {self.year} (import {self.import_job_id})"
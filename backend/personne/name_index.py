@@ -0,0 +1,99 @@
+from bisect import bisect_left, insort
+from typing import NamedTuple, Optional
+
+
+def normalize_name(value):
+    """Supprime les espaces et met en majuscules : "Dupont Jean" → "DUPONTJEAN"."""
+    return (value or "").replace(" ", "").upper()
+
+
+class NameMatch(NamedTuple):
+    personne: Optional[object]
+    candidates: list
+    ambiguous: bool
+
+
+NO_MATCH = NameMatch(None, [], False)
+
+
+class PersonneNameIndex:
+    """
+    Index des personnes par nom, construit une seule fois (par import).
+
+    Chaque personne est indexée sous trois variantes normalisées :
+    prénom+nom, nom+prénom et nom seul. Les recherches se font par
+    niveau de précision décroissant : correspondance exacte (dictionnaire),
+    préfixe (parcours de la liste triée des variantes à partir du point
+    d'insertion), puis sous-chaîne (parcours de toutes les variantes).
+    """
+
+    def __init__(self, personnes=()):
+        self._personnes = []
+        # variante → rangs des personnes qui la portent
+        self._exact = {}
+        self._keys = []
+        for personne in personnes:
+            self._index(personne)
+        self._keys = sorted(self._exact)
+
+    def __len__(self):
+        return len(self._personnes)
+
+    @staticmethod
+    def variants(personne):
+        fn = personne.first_name or ""
+        ln = personne.last_name or ""
+        return {normalize_name(fn + ln), normalize_name(ln + fn), normalize_name(ln)} - {""}
+
+    def _index(self, personne):
+        """Indexe la personne ; retourne les variantes jamais vues."""
+        rank = len(self._personnes)
+        self._personnes.append(personne)
+        nouvelles = []
+        for variant in self.variants(personne):
+            if variant not in self._exact:
+                nouvelles.append(variant)
+            self._exact.setdefault(variant, []).append(rank)
+        return nouvelles
+
+    def add(self, personne):
+        """Ajoute une personne ; l'ordre d'ajout sert à départager les ex aequo."""
+        for variant in self._index(personne):
+            insort(self._keys, variant)
+
+    def _to_personnes(self, keys):
+        ranks = {rank for key in keys for rank in self._exact[key]}
+        return [self._personnes[rank] for rank in sorted(ranks)]
+
+    def exact(self, name):
+        key = normalize_name(name)
+        return self._to_personnes([key] if key in self._exact else [])
+
+    def prefix(self, name):
+        key = normalize_name(name)
+        if not key:
+            return []
+        keys = []
+        i = bisect_left(self._keys, key)
+        while i < len(self._keys) and self._keys[i].startswith(key):
+            keys.append(self._keys[i])
+            i += 1
+        return self._to_personnes(keys)
+
+    def substring(self, name):
+        key = normalize_name(name)
+        return self._to_personnes([k for k in self._keys if key in k]) if key else []
+
+    def lookup(self, name):
+        """
+        Retourne un NameMatch pour le niveau le plus précis qui trouve au
+        moins une personne. `ambiguous` est vrai si plusieurs personnes
+        correspondent à ce niveau ; `personne` est alors la première ajoutée.
+        """
+        if not normalize_name(name):
+            return NO_MATCH
+        for finder in (self.exact, self.prefix, self.substring):
+            candidates = finder(name)
+            if candidates:
+                return NameMatch(candidates[0], candidates, len(candidates) > 1)
+        return NO_MATCH
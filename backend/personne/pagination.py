@@ -0,0 +1,22 @@
+from rest_framework.pagination import CursorPagination
+
+
+class OptionalCursorPagination(CursorPagination):
+    """
+    Pagination par curseur (stable quand des lignes sont ajoutées entre deux
+    pages), activée seulement si le client la demande avec ?page_size= ou
+    ?cursor= : sans ces paramètres la liste complète est renvoyée, comme avant.
+    """
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+
+    def paginate_queryset(self, queryset, request, view=None):
+        params = request.query_params
+        if self.cursor_query_param not in params and self.page_size_query_param not in params:
+            return None
+        return super().paginate_queryset(queryset, request, view)
+
+
+class PersonneCursorPagination(OptionalCursorPagination):
+    ordering = 'matricule'
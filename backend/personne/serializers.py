@@ -1,6 +1,6 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model, authenticate
-from .models import Personne
+from .models import Personne, ImportJob
 from formation.serializers import EquipeSerializer
 from projet.models import Projet
 from datetime import date
@@ -37,7 +37,40 @@ class MiniProjetSerializer(serializers.ModelSerializer):
         ]
 
 
+def _valider_manager(instance, manager):
+    """Refuse un manager qui créerait une boucle dans la hiérarchie."""
+    if instance is not None and manager is not None:
+        if manager.pk == instance.pk or instance.is_above(manager):
+            raise serializers.ValidationError("Un collaborateur ne peut pas avoir pour manager un de ses subordonnés.")
+    return manager
+
+
+def parse_fieldset(query_params):
+    """
+    Listes ?fields= et ?expand= (noms séparés par des virgules) ; None pour
+    un paramètre absent.
+    """
+    def noms(param):
+        value = query_params.get(param)
+        if value is None:
+            return None
+        return [nom.strip() for nom in value.split(',') if nom.strip()]
+    return noms('fields'), noms('expand')
+
+
 class PersonneSerializer(serializers.ModelSerializer):
+    """
+    Fiche complète d'une personne. En lecture, `fields` restreint la sortie
+    à certains champs ; les objets imbriqués coûteux (EXPANDABLE) n'y sont
+    alors ajoutés que s'ils sont nommés dans `fields` ou dans `expand`.
+    """
+    # Nom court pour ?expand= → champ imbriqué
+    EXPANDABLE = {
+        'manager': 'manager_info',
+        'backup': 'backup_info',
+        'projet': 'projet_info',
+        'equipe': 'equipe_info',
+    }
 
     manager = serializers.PrimaryKeyRelatedField(
         queryset=Personne.objects.all(),
@@ -54,6 +87,7 @@ class PersonneSerializer(serializers.ModelSerializer):
         allow_null = True,
         required = False
     )
+    equipe_id = serializers.SerializerMethodField()
     equipe_info = serializers.SerializerMethodField()
     manager_info =  MiniPersonneSerializer(source='manager',read_only=True)
     backup_info =  MiniPersonneSerializer(source='backup',read_only=True)
@@ -89,27 +123,63 @@ class PersonneSerializer(serializers.ModelSerializer):
             'is_active',
             'experience_expleo',
             'experience_total',
+            'equipe_id',
             'equipe_info',
         ]
         extra_kwargs = {'password': {'write_only': True, 'required': False}}
+
+    def __init__(self, *args, fields=None, expand=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is None and not expand:
+            return
+        demandes = self.requested_fields(fields, expand)
+        for nom in set(self.fields) - demandes:
+            self.fields.pop(nom)
+
+    @classmethod
+    def requested_fields(cls, fields=None, expand=None):
+        """Noms des champs renvoyés pour ?fields= / ?expand= (voir parse_fieldset)."""
+        demandes = set(cls.Meta.fields) if fields is None else set(fields)
+        demandes.update(cls.EXPANDABLE.get(nom, nom) for nom in expand or ())
+        inconnus = demandes - set(cls.Meta.fields)
+        if inconnus:
+            raise serializers.ValidationError(
+                {'fields': f"Champ(s) inconnu(s) : {', '.join(sorted(inconnus))}."}
+            )
+        return demandes
+
+    def validate_manager(self, value):
+        return _valider_manager(self.instance, value)
+
+    def _premiere_equipe(self, obj):
+        # Lue une seule fois pour equipe_id et equipe_info ; depuis le
+        # préchargement de with_related_info() quand il existe
+        if not hasattr(obj, '_premiere_equipe'):
+            if 'equipes' in getattr(obj, '_prefetched_objects_cache', {}):
+                obj._premiere_equipe = min(obj.equipes.all(), key=lambda e: e.pk, default=None)
+            else:
+                obj._premiere_equipe = obj.equipes.first()
+        return obj._premiere_equipe
+
+    def get_equipe_id(self, obj):
+        premiere_equipe = self._premiere_equipe(obj)
+        return premiere_equipe.pk if premiere_equipe else None
+
     def get_equipe_info(self, obj):
-        premiere_equipe = obj.equipes.first() 
+        premiere_equipe = self._premiere_equipe(obj)
         if premiere_equipe:
             # Si une équipe est trouvée, on la sérialise et on la retourne
             return EquipeSerializer(premiere_equipe).data
         # Si la personne n'a aucune équipe, on ne retourne rien
         return None
 class PersonneHierarchieSerializer(serializers.ModelSerializer):
-    subordinates=serializers.SerializerMethodField()
-    equipes = EquipeSerializer(many=True, read_only=True)
-
+    """
+    Noeud de l'organigramme. Les champs 'subordinates' et 'equipes' sont
+    ajoutés par personne.hierarchy.build_hierarchy, qui assemble l'arbre.
+    """
     class Meta:
         model = Personne
-        fields = ['matricule', 'first_name', 'last_name', 'role','photo', 'subordinates','equipes']
-    
-    def get_subordinates(self, obj):
-        subordinates = obj.manager_persons.all()
-        return PersonneHierarchieSerializer(subordinates, many=True).data
+        fields = ['matricule', 'first_name', 'last_name', 'role', 'photo']
 
 class PersonneLoginSerializer(serializers.Serializer):
     identifier = serializers.CharField(max_length=150)  # matricule OU email
@@ -283,6 +353,9 @@ class PersonneUpdateSerializer(serializers.ModelSerializer):
             'diplome': {'allow_null': True}
         }
 
+    def validate_manager(self, value):
+        return _valider_manager(self.instance, value)
+
     def validate_matricule(self, value):
         """Valider le matricule pour éviter les doublons, sauf pour le matricule de la personne mise à jour."""
         instance = self.instance
@@ -361,3 +434,32 @@ class PersonneUpdateSerializer(serializers.ModelSerializer):
 class ChangePasswordSerializer(serializers.Serializer):
     old_password = serializers.CharField(required=True)
     new_password = serializers.CharField(required=True)
+
+
+class ImportJobSerializer(serializers.ModelSerializer):
+    progress = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ImportJob
+        fields = [
+            'id',
+            'sheet_name',
+            'status',
+            'step',
+            'total_rows',
+            'processed_rows',
+            'progress',
+            'summary',
+            'errors',
+            'created_at',
+            'started_at',
+            'finished_at',
+        ]
+
+    def get_progress(self, obj):
+        """Avancement en % de l'étape en cours."""
+        if obj.status == 'terminee':
+            return 100
+        if not obj.total_rows:
+            return 0
+        return int(obj.processed_rows * 100 / obj.total_rows)
@@ -0,0 +1,19 @@
+from django.db.models import Value
+from django.db.models.functions import Concat, Substr
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+from .models import ORG_PATH_SEP, Personne
+
+
+@receiver(post_delete, sender=Personne)
+def detacher_subordonnes(sender, instance, **kwargs):
+    """
+    Le manager supprimé est retiré des chemins de tout son sous-arbre
+    (ses subordonnés directs deviennent des racines, cf. on_delete=SET_NULL).
+    """
+    if not instance.org_path:
+        return
+    Personne.objects.filter(org_path__startswith=instance.org_path).update(
+        org_path=Concat(Value(ORG_PATH_SEP), Substr('org_path', len(instance.org_path) + 1))
+    )
@@ -0,0 +1,142 @@
+import json
+import logging
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from .models import BenchProdSnapshot
+from .workbook_cache import SHEET_PREFIX
+
+logger = logging.getLogger(__name__)
+
+# Colonnes des mois dans la feuille : R à AF (indices 17 à 31)
+MONTH_COLUMNS = slice(17, 32)
+REQUIRED_COLUMNS = 32
+
+VALID_MONTHS = {
+    'janvier', 'février', 'mars', 'avril', 'mai', 'juin',
+    'juillet', 'août', 'septembre', 'octobre', 'novembre', 'décembre'
+}
+
+
+def snapshot_dir(xlsx_path):
+    """Dossier du snapshot, à côté du classeur : plan_de_charge_actuel_snapshot/."""
+    root, _ = os.path.splitext(xlsx_path)
+    return f"{root}_snapshot"
+
+
+def _source_version(xlsx_path):
+    st = os.stat(xlsx_path)
+    return [st.st_mtime_ns, st.st_size]
+
+
+def month_columns(df):
+    """Retourne les en-têtes des colonnes R–AF qui sont des mois valides."""
+    return [
+        col for col in df.columns[MONTH_COLUMNS]
+        if str(col).strip().lower() in VALID_MONTHS
+    ]
+
+
+def month_values(df, columns):
+    """Matrice float64 (lignes × mois) ; NaN pour les cellules non numériques."""
+    if not columns:
+        return np.empty((len(df), 0))
+    return np.column_stack([
+        pd.to_numeric(df[col], errors='coerce').to_numpy(dtype=np.float64)
+        for col in columns
+    ])
+
+
+def bench_prod_counts(values):
+    """
+    Effectifs (bench, production) par mois : 0 = au bench, > 0 = en production.
+    Les cellules non numériques (NaN) ne sont comptées ni dans l'un ni dans l'autre.
+    """
+    return (
+        [int(n) for n in (values == 0).sum(axis=0)],
+        [int(n) for n in (values > 0).sum(axis=0)],
+    )
+
+
+def write_month_snapshot(xlsx_path):
+    """
+    Écrit, pour chaque feuille "Plan de charge ME <année>", les colonnes des
+    mois dans <année>.npy (float64, NaN pour les cellules non numériques)
+    et un index.json avec les libellés des mois. Retourne l'index.
+    """
+    target = snapshot_dir(xlsx_path)
+    tmp = f"{target}.tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+
+    index = {"source": _source_version(xlsx_path), "years": {}}
+    xls = pd.ExcelFile(xlsx_path)
+    for sheet_name in xls.sheet_names:
+        year_str = sheet_name[len(SHEET_PREFIX):]
+        if not sheet_name.startswith(SHEET_PREFIX) or not year_str.isdigit():
+            continue
+
+        df = pd.read_excel(xls, sheet_name=sheet_name, header=0)
+        columns = month_columns(df)
+        np.save(os.path.join(tmp, f"{year_str}.npy"), month_values(df, columns))
+
+        index["years"][year_str] = {
+            "labels": [str(col).strip() for col in columns],
+            "column_count": int(df.shape[1]),
+        }
+
+    with open(os.path.join(tmp, "index.json"), "w", encoding="utf-8") as f:
+        json.dump(index, f, ensure_ascii=False)
+
+    shutil.rmtree(target, ignore_errors=True)
+    os.replace(tmp, target)
+    return index
+
+
+def load_month_snapshot(xlsx_path):
+    """
+    Retourne l'index du snapshot, ou None s'il n'existe pas ou ne
+    correspond plus au classeur actuel.
+    """
+    try:
+        with open(os.path.join(snapshot_dir(xlsx_path), "index.json"), encoding="utf-8") as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if index.get("source") != _source_version(xlsx_path):
+        return None
+    return index
+
+
+def load_month_values(xlsx_path, year_str):
+    """Matrice (lignes × mois) de l'année, mappée en mémoire."""
+    path = os.path.join(snapshot_dir(xlsx_path), f"{year_str}.npy")
+    try:
+        return np.load(path, mmap_mode='r')
+    except ValueError:
+        # Un tableau vide ne peut pas être mappé en mémoire
+        return np.load(path)
+
+
+def record_bench_prod(job, xlsx_path, index):
+    """
+    Enregistre dans BenchProdSnapshot les effectifs mensuels de chaque année
+    du snapshot. Les feuilles sans les colonnes R à AF sont ignorées.
+    """
+    rows = []
+    for year_str, sheet in index["years"].items():
+        if sheet["column_count"] < REQUIRED_COLUMNS:
+            continue
+        labels = sheet["labels"]
+        bench, prod = bench_prod_counts(load_month_values(xlsx_path, year_str))
+        rows.extend(
+            BenchProdSnapshot(
+                import_job=job, year=int(year_str), position=position,
+                month_label=label, bench_count=bench[position], prod_count=prod[position],
+            )
+            for position, label in enumerate(labels)
+        )
+    BenchProdSnapshot.objects.bulk_create(rows)
@@ -0,0 +1,307 @@
+import io
+import tempfile
+from datetime import date, timedelta
+
+import pandas as pd
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from formation.tests import SyntheticQueryCountMixin
+from projet.models import Projet
+
+from .importers import ChargePlanImporter
+from .jobs import STALE_AFTER
+from .models import BenchProdSnapshot, ImportJob, Personne
+from .name_index import NO_MATCH, NameMatch, PersonneNameIndex
+
+
+class PersonneQueryCountMixin(SyntheticQueryCountMixin):
+    query_counts = {
+        'personne-list': 4,
+        'personne-list-directory': 2,
+        'hierarchie': 5,
+        'dashboard-stats': 15,
+    }
+
+    def test_personne_list(self):
+        self.assertEndpointQueries('personne-list')
+        self.assertEndpointQueries('personne-list-directory')
+
+    def test_hierarchie(self):
+        self.assertEndpointQueries('hierarchie')
+
+    def test_dashboard_stats(self):
+        self.assertEndpointQueries('dashboard-stats')
+
+
+class PersonneQueryCountSmallTests(PersonneQueryCountMixin, TestCase):
+    scale = 10
+
+
+class PersonneQueryCountLargeTests(PersonneQueryCountMixin, TestCase):
+    scale = 200
+
+
+class ChargePlanImporterTests(TestCase):
+    def _import(self, rows):
+        return ChargePlanImporter(pd.DataFrame(rows), 'Début PdC').run()
+
+    def test_import_plusieurs_lignes(self):
+        Personne.objects.create_user(
+            matricule='M000', first_name='Alice', last_name='MARTIN', dt_Embauche=date(2015, 1, 1))
+        ligne = {
+            'Project name': 'Projet A', 'Client': 'Renault', 'WO': 'WO1', 'I/E': 'Interne',
+            'Début PdC': '2024-01-15', 'Date d\'embauche': '2020-03-01', 'Sexe': 'Femme',
+            'Position': 'I2', 'Hierarchical manager': 'MARTIN Alice', 'Status': 'En cours',
+            'Profil': 'Calcul',
+        }
+        resultat = self._import([
+            {**ligne, 'Matricule': 'M001', 'Name': 'DURAND Paul'},
+            {**ligne, 'Matricule': 'M002', 'Name': 'PETIT Julie'},
+            {**ligne, 'Matricule': 'M003', 'Name': 'BERNARD Luc', 'Position': 'X9'},
+            {**ligne, 'Matricule': 'M000', 'Name': 'MARTIN Alice', 'Hierarchical manager': None},
+        ])
+
+        self.assertEqual(resultat['personnes'], {"créés": 3, "modifiés": 1, "ignorés": 0})
+        self.assertEqual(resultat['projets'], {"créés": 1, "modifiés": 0, "ignorés": 0})
+        projet = Projet.objects.get(nom='Projet A')
+        nouveaux = Personne.objects.filter(matricule__in=['M001', 'M002', 'M003']).order_by('matricule')
+        self.assertEqual([p.last_name for p in nouveaux], ['DURAND', 'PETIT', 'BERNARD'])
+        for personne in nouveaux:
+            self.assertEqual(personne.manager_id, 'M000')
+            self.assertEqual(personne.projet_id, projet.pk)
+            self.assertEqual(personne.org_path, f'/M000/{personne.matricule}/')
+            self.assertFalse(personne.is_active)
+            self.assertFalse(personne.has_usable_password())
+        self.assertEqual(nouveaux[2].position, 'N/A')
+        self.assertEqual(Personne.objects.get(pk='M000').projet_id, projet.pk)
+
+        # Réimporter la même feuille ne crée ni ne modifie rien
+        resultat = self._import([
+            {**ligne, 'Matricule': 'M001', 'Name': 'DURAND Paul'},
+            {**ligne, 'Matricule': 'M002', 'Name': 'PETIT Julie'},
+        ])
+        self.assertEqual(resultat['personnes'], {"créés": 0, "modifiés": 0, "ignorés": 0})
+
+
+class PersonneNameIndexTests(TestCase):
+    def setUp(self):
+        self.dupont = Personne(matricule='P1', first_name='Jean', last_name='DUPONT')
+        self.dupond = Personne(matricule='P2', first_name='Marie', last_name='DUPOND')
+        self.martin = Personne(matricule='P3', first_name='Anne Laure', last_name='MARTIN')
+        self.index = PersonneNameIndex([self.dupont, self.dupond, self.martin])
+
+    def test_exact(self):
+        match = self.index.lookup('DUPONT Jean')
+        self.assertEqual(match, NameMatch(self.dupont, [self.dupont], False))
+        self.assertEqual(self.index.lookup('jean dupont').personne, self.dupont)
+
+    def test_prefixe(self):
+        self.assertEqual(self.index.lookup('MARTIN Anne').personne, self.martin)
+
+    def test_sous_chaine(self):
+        match = self.index.lookup('Laure')
+        self.assertEqual(match, NameMatch(self.martin, [self.martin], False))
+
+    def test_ambigu(self):
+        match = self.index.lookup('DUPON')
+        self.assertTrue(match.ambiguous)
+        self.assertEqual(match.candidates, [self.dupont, self.dupond])
+        self.assertEqual(match.personne, self.dupont)
+
+    def test_exact_prioritaire_sur_prefixe(self):
+        homonyme = Personne(matricule='P4', first_name='Jean', last_name='DUPONTEL')
+        self.index.add(homonyme)
+        self.assertEqual(self.index.lookup('DUPONT').candidates, [self.dupont])
+        self.assertEqual(self.index.lookup('DUPONTE').personne, homonyme)
+
+    def test_aucune_correspondance(self):
+        self.assertEqual(self.index.lookup('DURAND'), NO_MATCH)
+        self.assertEqual(self.index.lookup('  '), NO_MATCH)
+
+
+class ImportJobTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        def personne(matricule, **extra):
+            return Personne.objects.create_user(
+                matricule=matricule, first_name=matricule, last_name=matricule,
+                dt_Embauche=date(2015, 1, 1), role='TL1', **extra)
+        cls.auteur = personne('J001')
+        cls.autre = personne('J002')
+        cls.admin = personne('J003', is_staff=True)
+        cls.job = ImportJob.objects.create(sheet_name='Plan de charge ME 2025', created_by=cls.auteur)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.url = f'/api/personne/import-jobs/{self.job.pk}/'
+
+    def test_job_visible_par_son_auteur_et_le_staff(self):
+        for user, attendu in ((self.auteur, 200), (self.admin, 200), (self.autre, 404)):
+            self.client.force_authenticate(user)
+            self.assertEqual(self.client.get(self.url).status_code, attendu)
+
+    def test_job_interrompu_passe_en_echec(self):
+        self.client.force_authenticate(self.auteur)
+        self.assertEqual(self.client.get(self.url).data['status'], 'en_attente')
+
+        ImportJob.objects.filter(pk=self.job.pk).update(
+            status='en_cours', updated_at=timezone.now() - STALE_AFTER - timedelta(minutes=1))
+        data = self.client.get(self.url).data
+        self.assertEqual(data['status'], 'echec')
+        self.assertTrue(data['errors'])
+
+    def _post(self, df, sheet_name):
+        contenu = io.BytesIO()
+        df.to_excel(contenu, sheet_name=sheet_name, index=False)
+        fichier = SimpleUploadedFile('plan.xlsx', contenu.getvalue())
+        self.client.force_authenticate(self.auteur)
+        return self.client.post('/api/personne/import-excel/', {'file': fichier, 'sheet_name': 'Feuille'})
+
+    def test_en_tete_invalide_refuse_immediatement(self):
+        df = pd.DataFrame([{'Matricule': 'M1', 'Name': 'DURAND Paul'}])
+        response = self._post(df, 'Feuille')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Début Pdc', response.data['error'])
+
+        response = self._post(df.assign(**{'Début PdC': '2024-01-01'}), 'Autre')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("n'existe pas", response.data['error'])
+
+        fichier = SimpleUploadedFile('plan.xlsx', b'pas un classeur')
+        response = self.client.post('/api/personne/import-excel/', {'file': fichier})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(ImportJob.objects.count(), 1)
+
+
+@override_settings(MEDIA_ROOT=tempfile.gettempdir() + '/gestionme-tests-vide')
+class BenchProdChartTests(TestCase):
+    url = '/api/personne/stats/bench-prod-chart/?year=2025'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.tl = Personne.objects.create_user(
+            matricule='B001', first_name='B', last_name='B', dt_Embauche=date(2015, 1, 1), role='TL1')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.tl)
+
+    def _job(self, status, finished_at, bench=None):
+        job = ImportJob.objects.create(sheet_name='Plan de charge ME 2025', status=status, finished_at=finished_at)
+        if bench is not None:
+            BenchProdSnapshot.objects.create(
+                import_job=job, year=2025, position=0, month_label='Janvier', bench_count=bench, prod_count=10)
+        return job
+
+    def test_dernier_import_reussi(self):
+        now = timezone.now()
+        self._job('terminee', now - timedelta(days=2), bench=1)
+        self._job('terminee', now - timedelta(days=1), bench=2)
+        self._job('echec', now, bench=3)
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['datasets'][1]['data'], [2])
+
+    def test_import_sans_effectifs_ignore_les_anciens(self):
+        now = timezone.now()
+        self._job('terminee', now - timedelta(days=2), bench=1)
+        self._job('terminee', now - timedelta(days=1))
+        # Repli sur le fichier actuel, absent ici
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+
+class ReportingLineTests(TestCase):
+    def test_ligne_hierarchique(self):
+        def personne(matricule, manager=None):
+            return Personne.objects.create_user(
+                matricule=matricule, first_name=matricule, last_name=matricule,
+                dt_Embauche=date(2015, 1, 1), manager=manager)
+        chef = personne('R1')
+        n1 = personne('R11', chef)
+        n2 = personne('R111', n1)
+        personne('R2')
+
+        self.assertEqual(set(Personne.objects.reporting_line('R1')), {n1, n2})
+        self.assertEqual(set(Personne.objects.reporting_line('R11', include_self=True)), {n1, n2})
+        self.assertFalse(Personne.objects.reporting_line('INCONNU').exists())
+
+    def test_enregistrer_un_membre_de_boucle(self):
+        a, b = (
+            Personne.objects.create_user(matricule=m, first_name=m, last_name=m, dt_Embauche=date(2015, 1, 1))
+            for m in ('B1', 'B2')
+        )
+        # Boucle créée comme par l'import, sans passer par save()
+        Personne.objects.filter(pk=a.pk).update(manager=b)
+        Personne.objects.filter(pk=b.pk).update(manager=a)
+        with self.assertLogs('personne.models', 'WARNING'):
+            Personne.objects.rebuild_org_paths()
+
+        a.refresh_from_db()
+        a.first_name = 'Modifié'
+        with self.assertLogs('personne.models', 'WARNING'):
+            a.save()
+        b.refresh_from_db()
+        self.assertEqual((a.org_path, b.org_path), ('/B1/', '/B1/B2/'))
+        b.save(update_fields=['manager'])
+        b.refresh_from_db()
+        self.assertEqual(b.org_path, '/B1/B2/')
+
+
+class PersonneListTests(TestCase):
+    url = '/api/personne/personnes/'
+
+    @classmethod
+    def setUpTestData(cls):
+        def personne(matricule, **extra):
+            return Personne.objects.create_user(
+                matricule=matricule, first_name=f"P{matricule}", last_name=matricule,
+                dt_Embauche=date(2015, 1, 1), **extra)
+        cls.chef = personne('L000')
+        cls.personnes = [cls.chef] + [personne(f'L00{i}', manager=cls.chef) for i in range(1, 5)]
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.chef)
+
+    def pages(self, url):
+        """Parcourt les pages en suivant les liens `next` ; retourne les résultats."""
+        resultats = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            resultats.extend(response.data['results'])
+            url = response.data['next']
+        return resultats
+
+    def test_sans_pagination_par_defaut(self):
+        response = self.client.get(self.url)
+        self.assertIsInstance(response.data, list)
+        self.assertEqual(len(response.data), 5)
+        self.assertIn('manager_info', response.data[0])
+
+    def test_curseur_et_champs(self):
+        response = self.client.get(self.url, {'page_size': 2, 'fields': 'matricule,first_name'})
+        self.assertEqual(len(response.data['results']), 2)
+        # Une personne ajoutée entre deux pages n'en décale aucune
+        Personne.objects.create_user(matricule='L009', first_name='Nouveau', last_name='L009',
+                                     dt_Embauche=date(2015, 1, 1))
+        resultats = response.data['results'] + self.pages(response.data['next'])
+        self.assertEqual([r['matricule'] for r in resultats], ['L000', 'L001', 'L002', 'L003', 'L004', 'L009'])
+        self.assertEqual(set(resultats[0]), {'matricule', 'first_name'})
+
+    def test_expand(self):
+        resultats = self.pages(f'{self.url}?page_size=10&fields=matricule&expand=manager')
+        self.assertEqual(set(resultats[1]), {'matricule', 'manager_info'})
+        self.assertIsNone(resultats[0]['manager_info'])
+        self.assertEqual(resultats[1]['manager_info']['matricule'], 'L000')
+
+        # Sans ?fields=, expand n'ajoute rien : tous les champs sont déjà là
+        resultats = self.pages(f'{self.url}?page_size=10&expand=equipe')
+        self.assertIn('projet_info', resultats[0])
+
+    def test_champ_inconnu(self):
+        response = self.client.get(self.url, {'fields': 'matricule,salaire'})
+        self.assertEqual(response.status_code, 400)
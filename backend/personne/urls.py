@@ -1,6 +1,6 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import PersonneViewSet, HierarchieView, PersonneLoginView, change_password, ImportChargePlanView, download_last_imported_file, DashboardStatsAPIView, BenchProdChartDataAPIView
+from .views import PersonneViewSet, HierarchieView, PersonneLoginView, change_password, ImportChargePlanView, ImportJobDetailView, download_last_imported_file, DashboardStatsAPIView, BenchProdChartDataAPIView
 
 router = DefaultRouter()
 router.register(r'personnes', PersonneViewSet)
@@ -11,6 +11,7 @@ urlpatterns = [
     path('login/', PersonneLoginView.as_view(), name='login'),
     path('change-password/', change_password, name='change_password'),
     path('import-excel/', ImportChargePlanView.as_view(), name='import-excel'),
+    path('import-jobs/<int:pk>/', ImportJobDetailView.as_view(), name='import-job-detail'),
     path('download-latest-excel/', download_last_imported_file),
     path('stats/', DashboardStatsAPIView.as_view(), name='dashboard-stats'),
     path('stats/bench-prod-chart/', BenchProdChartDataAPIView.as_view(), name='BenchProd-stats'),
@@ -11,28 +11,55 @@ from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.parsers import MultiPartParser
-from django.db.models import Count, Q, Case, When, Value, IntegerField
+from django.db.models import Count, Q, Case, When, Value, IntegerField, Subquery
 from django.core.exceptions import ObjectDoesNotExist, MultipleObjectsReturned
 from django.http import FileResponse
+from django.shortcuts import get_object_or_404
 from django.db import models
 from django.conf import settings
-from .models import Personne, ImportedExcel
+from .models import Personne, ImportedExcel, ImportJob, BenchProdSnapshot
 from formation.models import Formation, Equipe
+from formation.progress import teams_progress_by_formation
 from projet.models import Projet 
-from .serializers import PersonneSerializer, PersonneLoginSerializer, PersonneHierarchieSerializer, PersonneCreateSerializer,PersonneUpdateSerializer,ChangePasswordSerializer
+from .pagination import PersonneCursorPagination
+from .serializers import parse_fieldset, PersonneSerializer, PersonneLoginSerializer, PersonneCreateSerializer,PersonneUpdateSerializer,ChangePasswordSerializer, ImportJobSerializer
 from .permissions import IsTeamLeader, IsCollaborateur
+from .hierarchy import build_hierarchy
+from .importers import ChargePlanError, validate_charge_plan
+from .jobs import enqueue_import_job, fail_stale_jobs
+from .workbook_cache import workbook_cache, charge_plan_path, sheet_years
+from .snapshots import REQUIRED_COLUMNS, bench_prod_counts, load_month_snapshot, load_month_values, month_columns, month_values
 from rest_framework.permissions import IsAuthenticated, AllowAny
 
 class PersonneViewSet(viewsets.ModelViewSet):
+    """
+    Lecture : ?fields=matricule,first_name,... restreint les champs renvoyés,
+    ?expand=manager,backup,projet,equipe y ajoute les objets imbriqués, et
+    ?page_size= / ?cursor= activent la pagination par curseur de la liste.
+    """
     queryset = Personne.objects.all()
     serializer_class = PersonneSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = PersonneCursorPagination
     lookup_field = 'matricule'
 
     def get_serializer_class(self):
         if self.action == 'create':
             return PersonneCreateSerializer
         return PersonneSerializer
+
+    def get_serializer(self, *args, **kwargs):
+        if self.request.method == 'GET' and self.get_serializer_class() is PersonneSerializer:
+            kwargs['fields'], kwargs['expand'] = parse_fieldset(self.request.query_params)
+        return super().get_serializer(*args, **kwargs)
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.request.method == 'GET':
+            # Relations affichées chargées en un nombre constant de requêtes
+            fields = PersonneSerializer.requested_fields(*parse_fieldset(self.request.query_params))
+            queryset = queryset.with_related_info(fields)
+        return queryset
     
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
@@ -64,6 +91,7 @@ class PersonneViewSet(viewsets.ModelViewSet):
         personne = request.user  # récupère l'utilisateur connecté
         
         if request.method == 'GET':
+            personne = self.get_queryset().get(pk=personne.pk)
             serializer = self.get_serializer(personne)
             return Response(serializer.data)
 
@@ -94,10 +122,8 @@ class PersonneViewSet(viewsets.ModelViewSet):
 
 class HierarchieView(APIView):
     def get(self, request):
-        # Prendre les personnes au sommet (sans manager)
-        leaders = Personne.objects.filter(manager__isnull=True)
-        serializer = PersonneHierarchieSerializer(leaders, many=True)
-        return Response(serializer.data)
+        # Personnes au sommet (sans manager) avec leurs subordonnés imbriqués
+        return Response(build_hierarchy())
 
 class PersonneLoginView(APIView):
     permission_classes = [AllowAny]
@@ -142,12 +168,19 @@ class ImportChargePlanView(APIView):
     permission_classes = [IsAuthenticated]
     
     def post(self, request, format=None):
-        POSITIONS_VALIDES = {'I1', 'I2', 'I3', 'I4', 'I5', 'I6', 'T1', 'T2', 'T3', 'T4', 'T5', 'T6'}
         file = request.FILES.get('file')
 
         if not file:
             return Response({'error': 'Aucun fichier reçu'}, status=400)
-        
+
+        # Format et en-tête vérifiés tout de suite (lecture de l'en-tête seule) :
+        # seul le traitement des lignes part en arrière-plan
+        sheet_name = request.POST.get('sheet_name') or 'Plan de charge ME 2025'
+        try:
+            validate_charge_plan(file, sheet_name)
+        except ChargePlanError as e:
+            return Response({'error': str(e)}, status=400)
+
         fixed_filename = "plan_de_charge_actuel.xlsx"
 
         file.name = fixed_filename
@@ -160,255 +193,31 @@ class ImportChargePlanView(APIView):
 
         # Enregistrer le nouveau fichier
         imported_file = ImportedExcel.objects.create(fichier=file)
+        workbook_cache.invalidate(imported_file.fichier.path)
 
+        # Le traitement est fait en arrière-plan : on renvoie tout de suite l'id du job
+        job = ImportJob.objects.create(
+            fichier=imported_file,
+            sheet_name=sheet_name,
+            created_by=request.user,
+        )
+        enqueue_import_job(job)
 
-        sheetName = request.POST.get('sheet_name') or 'Plan de charge ME 2025'
-        if not file:
-            return Response({'error': 'Aucun fichier reçu'}, status=400)
+        return Response(ImportJobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
 
-        try:
-            xls = pd.ExcelFile(file)
-            if sheetName not in xls.sheet_names:
-                return Response({'error': f"La feuille '{sheetName}' n'existe pas dans le fichier Excel."}, status=400)
-            df = pd.read_excel(xls, sheet_name=sheetName)
-        except Exception as e:
-            return Response({'error': f"Erreur de lecture Excel : {str(e)}"}, status=400)
-        
-        date_column_name = None
-        for col in df.columns:
-            # str(col).startswith(...) est la fonction clé ici
-            if str(col).strip().startswith('Début PdC'):
-                date_column_name = col
-                break # On s'arrête dès qu'on a trouvé la colonne
-
-        # 2. Si aucune colonne ne correspond, on retourne une erreur claire
-        if not date_column_name:
-            return Response({
-                'error': "Colonne introuvable.",
-                'message': "Aucune colonne commençant par 'Début Pdc' n'a été trouvée dans le fichier."
-            }, status=400)
-        
-        
 
-        projets_crees, projets_modifies, projets_ignores = 0, 0, 0
-        for _, row in df.iterrows():
-
-             # 1. Extraire les champs pour notre clé composite
-            nom_projet = str(row.get("Project name", "")).strip()
-            client_final = str(row.get("Client", "")).strip()
-
-            # 1. On récupère la valeur brute et on la met en minuscules
-            raw_sop = str(row.get("I/E", "")).strip().lower()
-
-            # 2. On définit une valeur par défaut
-            sop_value = "Interne" 
-
-            # 3. On vérifie si elle commence par "exter"
-            if raw_sop.startswith("exter"):
-                sop_value = "Externe"
-
-            # On a besoin au minimum d'un nom et d'un client pour identifier le projet
-            if not nom_projet or not client_final:
-                projets_ignores += 1
-                continue
-            
-            donnees_projet = {
-                'ordre_travail': str(row.get("WO", "")).strip(),
-                'sop': sop_value,
-                'final_client': str(row.get("Client",client_final)),
-            }
-            # Gestion de la date
-            
-
-            raw_date_demarrage = row.get(date_column_name)
-            if pd.notna(raw_date_demarrage):
-                date_dt = pd.to_datetime(raw_date_demarrage, errors='coerce')
-                if pd.notna(date_dt):
-                    donnees_projet['date_demarrage'] = date_dt.date()
-
-            # 3. Chercher les projets existants avec notre clé composite
-            projets_existants = Projet.objects.filter(nom=nom_projet)
-
-            if projets_existants.count() == 1:
-                # CAS 1 : Un seul projet trouvé. On le met à jour.
-                projet = projets_existants.first()
-                has_changed = False
-                for key, value in donnees_projet.items():
-                     if getattr(projet, key) != value:
-                        # Si les valeurs sont différentes, on met à jour l'attribut et on note qu'il y a eu un changement
-                        setattr(projet, key, value)
-                        has_changed = True
-                if has_changed:
-                    projet.save()
-                    projets_modifies += 1
-                
-            elif projets_existants.count() == 0:
-                # CAS 2 : Aucun projet trouvé. On le crée.
-                Projet.objects.create(
-                    nom=nom_projet,
-                    **donnees_projet
-                )
-                projets_crees += 1
-
-            else: # projets_existants.count() > 1
-                # CAS 3 : Plusieurs projets ont le même nom pour le même client.
-                # C'est une ambiguïté. On ignore la ligne pour ne pas corrompre les données.
-                projets_ignores += 1
-                continue
-
-
-
-
-        created, updated, skipped = 0, 0, 0
-
-        for _, row in df.iterrows():
-            matricule = str(row.get("Matricule")).strip()
-            full_name = str(row.get("Name")).strip()
-            raw_embauche = row.get("Date d'embauche")
-            sexe = str(row.get("Sexe")).strip() if pd.notna(row.get("Sexe")) else None
-
-            raw_position = str(row.get("Position")).strip() if pd.notna(row.get("Position")) else ''
-            position_f = raw_position if raw_position in POSITIONS_VALIDES else 'N/A'
-
-            manager_name = str(row.get("Hierarchical manager")).strip() if pd.notna(row.get("Hierarchical manager")) else None
-            Status = str(row.get("Status")).strip() if pd.notna(row.get("Status")) else None
-            profile_f = str(row.get("Profil")).strip() if pd.notna(row.get("Profil")) else None
-            projet_name = str(row.get("Project name")).strip() if pd.notna(row.get("Project name")) else None
-
-            if projet_name:                                # évite les '' ou None
-                try:
-                    projet_c = Projet.objects.filter(nom=projet_name).first()
-                except ObjectDoesNotExist:
-                    projet_c = None
-                except MultipleObjectsReturned:
-                    projet_c = Projet.objects.filter(nom=projet_name).first()
-            else:
-                projet_c = None
-
-            # Validation
-            if not matricule or matricule == "nan":
-                skipped += 1
-                continue
-
-            # Convertir date d'embauche
-            try:
-                if pd.isna(raw_embauche):
-                    date_embauche = None
-                elif isinstance(raw_embauche, str):
-                    date_embauche = pd.to_datetime(raw_embauche).date()
-                elif isinstance(raw_embauche, pd.Timestamp):
-                    date_embauche = raw_embauche.date()
-                else:
-                    date_embauche = raw_embauche
-            except Exception:
-                date_embauche = None
-
-            # Extraire last_name (2 premiers mots en MAJUSCULES), puis reste = first_name
-            parts = full_name.strip().split()
-            last_name_parts = []
-            first_name_parts = []
-
-            # On parcourt les mots pour trouver la séparation
-            for part in parts:
-                # Si le mot est entièrement en majuscules ET qu'on n'a pas encore trouvé de prénom
-                if part.isupper():
-                    last_name_parts.append(part)
-                else:
-                    first_name_parts.append(part)
-
-            last_name = " ".join(last_name_parts)
-            first_name = " ".join(first_name_parts)
-
-            # Chercher le manager si possible
-            manager_obj = None
-            if manager_name:
-                manager_name_cleaned = manager_name.replace(" ", "").upper()
-
-                for m in Personne.objects.all():
-                    fn = m.first_name or ""
-                    ln = m.last_name or ""
-
-                    full_1 = (fn + ln).replace(" ", "").upper()
-                    full_2 = (ln + fn).replace(" ", "").upper()
-                    ln_clean = ln.replace(" ", "").upper()
-
-                    if (
-                        manager_name_cleaned in full_1 or
-                        manager_name_cleaned in full_2 or
-                        manager_name_cleaned in ln_clean
-                    ):
-                        manager_obj = m
-                        break
-
-            try:
-                personne = Personne.objects.get(matricule=matricule)
-
-                # Mise à jour sans changer nom/prénom
-                has_changed = False
-                if personne.dt_Embauche != date_embauche and date_embauche is not None:
-                    personne.dt_Embauche = date_embauche or personne.dt_Embauche
-                    has_changed = True
-                
-                if personne.position != position_f and position_f:
-                    personne.position = position_f or personne.position
-                    has_changed = True
-
-                if personne.manager != manager_obj and manager_obj:
-                    personne.manager = manager_obj or personne.manager
-                    has_changed = True
-
-                if personne.status != Status and Status:
-                    personne.status = Status or personne.status
-                    has_changed = True
-
-                if personne.profile != profile_f and profile_f:
-                    personne.profile = profile_f or personne.profile
-                    has_changed = True
-
-                if personne.projet != projet_c and projet_c:
-                    personne.projet =  projet_c or personne.projet
-                    has_changed = True
-                
-                if has_changed:
-                    personne.save()
-                    updated += 1
-            except Personne.DoesNotExist:
-                # Création
-                personne = Personne.objects.create_user(
-                    matricule=matricule,
-                    password=matricule,
-                    first_name=first_name,
-                    last_name=last_name,
-                    sexe=sexe or "Homme",
-                    dt_Debut_Carriere=None,  # Pas de date de début de carrière dans l'import
-                    dt_Embauche=date_embauche,
-                    position=position_f,
-                    manager=manager_obj,
-                    role='COLLABORATEUR',
-                    projet=projet_c,
-                    status=Status,
-                    profile=profile_f,
-                    is_active=False
-                )
-                created += 1
-
-        return Response({
-            "message": "Importation terminée avec succès.",
-            # On ajoute la clé "résumé" qui contient les deux objets
-            "résumé": {
-                "personnes": {
-                    "créés": created,
-                    "modifiés": updated,
-                    "ignorés": skipped
-                },
-                "projets": {
-                    "créés": projets_crees,
-                    "modifiés": projets_modifies,
-                    "ignorés": projets_ignores,
-                },
-            }
-        }, status=200)
-    
+class ImportJobDetailView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, pk):
+        # Chacun ne suit que ses propres imports ; l'administration les voit tous
+        jobs = ImportJob.objects.all()
+        if not request.user.is_staff:
+            jobs = jobs.filter(created_by=request.user)
+        fail_stale_jobs(jobs.filter(pk=pk))
+        job = get_object_or_404(jobs, pk=pk)
+        return Response(ImportJobSerializer(job).data)
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def download_last_imported_file(request):
@@ -428,64 +237,70 @@ class BenchProdChartDataAPIView(APIView):
         selected_year = int(year_str)
         
         try:
-            file_path = os.path.join(settings.MEDIA_ROOT, 'excels', 'plan_de_charge_actuel.xlsx')
+            # Effectifs calculés lors du dernier import réussi (jamais d'un import plus ancien)
+            latest_import = (
+                ImportJob.objects.filter(status='terminee')
+                .order_by('-finished_at', '-pk').values('pk')[:1]
+            )
+            rows = list(
+                BenchProdSnapshot.objects
+                .filter(year=selected_year, import_job_id=Subquery(latest_import))
+                .order_by('position')
+                .values_list('month_label', 'bench_count', 'prod_count')
+            )
+            if rows:
+                labels, bench_counts, prod_counts = (list(col) for col in zip(*rows))
+                return Response(self._chart_data(labels, bench_counts, prod_counts))
+
+            # Pas d'effectifs enregistrés par cet import : calcul à partir du fichier actuel
+            file_path = charge_plan_path()
             if not os.path.exists(file_path):
                 return Response({"error": "Fichier plan de charge non trouvé."}, status=404)
 
-            sheet_name_to_read = f"Plan de charge ME {selected_year}"
-            
-            xls = pd.ExcelFile(file_path)
-            if sheet_name_to_read not in xls.sheet_names:
-                return Response({"error": f"La feuille pour l'année {selected_year} n'existe pas."}, status=404)
-
-            # On lit la première ligne comme en-tête (comportement par défaut)
-            df = pd.read_excel(xls, sheet_name=sheet_name_to_read, header=0)
-
-            # Vérifier si le fichier a assez de colonnes (jusqu'à AF, soit l'indice 31)
-            if df.shape[1] < 32:
-                return Response({"error": "Le fichier ne contient pas les colonnes requises jusqu'à AF."}, status=400)
-
-            # --- NOUVELLE LOGIQUE D'EXTRACTION ET VALIDATION DES MOIS ---
-
-            # 1. Définir les noms des mois valides en français (en minuscules)
-            VALID_MONTHS = {
-                'janvier', 'février', 'mars', 'avril', 'mai', 'juin',
-                'juillet', 'août', 'septembre', 'octobre', 'novembre', 'décembre'
-            }
-
-            labels = []
-            bench_counts = []
-            prod_counts = []
-
-            # 2. Itérer sur les en-têtes des colonnes R à AF (indices 17 à 31)
-            for col_header in df.columns[17:32]:
-                # Nettoyer l'en-tête pour la comparaison
-                cleaned_header = str(col_header).strip().lower()
-
-                # 3. Vérifier si l'en-tête est un mois valide
-                if cleaned_header in VALID_MONTHS:
-                    # Si c'est valide, on ajoute l'étiquette et on calcule les données
-                    labels.append(str(col_header).strip()) # On garde la casse originale pour l'affichage
-
-                    # Calculer les données pour la colonne correspondante
-                    numeric_data = pd.to_numeric(df[col_header], errors='coerce').dropna()
-                    bench_counts.append(int((numeric_data == 0).sum()))
-                    prod_counts.append(int((numeric_data > 0).sum()))
-
-            # 4. Construire la réponse avec les données validées
-            chart_data = {
-                "labels": labels,
-                "datasets": [
-                    {"label": 'En Production', "data": prod_counts, "backgroundColor": 'rgba(54, 162, 235, 0.7)'},
-                    {"label": 'Au Bench', "data": bench_counts, "backgroundColor": 'rgba(255, 99, 132, 0.7)'}
-                ]
-            }
-            return Response(chart_data)
+            snapshot = load_month_snapshot(file_path)
+            if snapshot is not None:
+                # Snapshot NumPy écrit lors de l'import : on ne lit que les mois, en mmap
+                sheet = snapshot["years"].get(str(selected_year))
+                if sheet is None:
+                    return Response({"error": f"La feuille pour l'année {selected_year} n'existe pas."}, status=404)
+                if sheet["column_count"] < REQUIRED_COLUMNS:
+                    return Response({"error": "Le fichier ne contient pas les colonnes requises jusqu'à AF."}, status=400)
+                labels = sheet["labels"]
+                values = load_month_values(file_path, str(selected_year))
+            else:
+                sheet_name_to_read = f"Plan de charge ME {selected_year}"
+                if sheet_name_to_read not in workbook_cache.sheet_names(file_path):
+                    return Response({"error": f"La feuille pour l'année {selected_year} n'existe pas."}, status=404)
+
+                # On lit la première ligne comme en-tête (comportement par défaut)
+                df = workbook_cache.sheet(file_path, sheet_name_to_read)
+
+                # Vérifier si le fichier a assez de colonnes (jusqu'à AF, soit l'indice 31)
+                if df.shape[1] < REQUIRED_COLUMNS:
+                    return Response({"error": "Le fichier ne contient pas les colonnes requises jusqu'à AF."}, status=400)
+
+                # Seuls les en-têtes R à AF qui sont des mois valides sont retenus
+                columns = month_columns(df)
+                labels = [str(col).strip() for col in columns]  # On garde la casse originale pour l'affichage
+                values = month_values(df, columns)
+
+            bench_counts, prod_counts = bench_prod_counts(values)
+            return Response(self._chart_data(labels, bench_counts, prod_counts))
 
         except Exception as e:
             print(f"Erreur serveur pour le graphique du plan de charge : {e}")
             return Response({"error": "Erreur interne du serveur."}, status=500)
 
+    @staticmethod
+    def _chart_data(labels, bench_counts, prod_counts):
+        return {
+            "labels": labels,
+            "datasets": [
+                {"label": 'En Production', "data": prod_counts, "backgroundColor": 'rgba(54, 162, 235, 0.7)'},
+                {"label": 'Au Bench', "data": bench_counts, "backgroundColor": 'rgba(255, 99, 132, 0.7)'}
+            ]
+        }
+
 
 class DashboardStatsAPIView(APIView):
     permission_classes = [IsTeamLeader]
@@ -613,36 +428,19 @@ class DashboardStatsAPIView(APIView):
             total_completed=Count('userformation', filter=Q(userformation__progress__gte=100), distinct=True)
         ).order_by('deadline')
 
+        upcoming_formations = list(upcoming_deadlines_qs)
+        # Progression par équipe de toutes les formations en quelques requêtes groupées
+        teams_progress = teams_progress_by_formation(upcoming_formations)
+
         upcoming_deadlines = []
-        for formation in upcoming_deadlines_qs:
-            assigned_teams = formation.assigned_teams.all()
-            
-            # On va construire une liste de la progression de chaque équipe
-            teams_progress_list = []
-            for team in assigned_teams:
-                total_members = team.assigned_users.count()
-                if total_members == 0:
-                    continue
-
-                completed_members = Personne.objects.filter(
-                    equipes=team,
-                    userformation__formation=formation,
-                    userformation__progress__gte=100
-                ).count()
-                
-                teams_progress_list.append({
-                    'name': team.name,
-                    'completed': completed_members,
-                    'total': total_members,
-                })
-            
+        for formation in upcoming_formations:
             upcoming_deadlines.append({
                 'titre': formation.titre,
                 'deadline': formation.deadline,
                 'total_enrolled': formation.total_enrolled,
                 'total_completed': formation.total_completed,
                 # ✅ On remplace les anciens décomptes par la liste détaillée
-                'teams_progress': teams_progress_list,
+                'teams_progress': teams_progress[formation.pk],
             })
 
         available_profiles = list(Personne.objects.exclude(profile__in=[None, '']).values_list('profile', flat=True).distinct())
@@ -653,24 +451,9 @@ class DashboardStatsAPIView(APIView):
         
         available_years = []
         try:
-            file_path = os.path.join(settings.MEDIA_ROOT, 'excels', 'plan_de_charge_actuel.xlsx')
+            file_path = charge_plan_path()
             if os.path.exists(file_path):
-                xls = pd.ExcelFile(file_path)
-                
-                # On définit le préfixe attendu pour les noms de feuilles
-                sheet_prefix = "Plan de charge ME "
-                
-                for sheet_name in xls.sheet_names:
-                    # On vérifie si le nom de la feuille commence par le préfixe
-                    if sheet_name.startswith(sheet_prefix):
-                        # On extrait la partie qui devrait être l'année
-                        year_str = sheet_name[len(sheet_prefix):]
-                        
-                        # On s'assure que c'est bien un nombre avant de l'ajouter
-                        if year_str.isdigit():
-                            available_years.append(int(year_str))
-                            
-                available_years.sort(reverse=True) # Trier de la plus récente à la plus ancienne
+                available_years = sheet_years(file_path)
         except Exception as e:
             print(f"Impossible de lire les années depuis le fichier Excel : {e}")
 
@@ -0,0 +1,120 @@
+import os
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+from django.conf import settings
+
+# Limites de la mémoire occupée par les feuilles gardées en cache (par processus)
+MAX_SHEETS = 8
+MAX_BYTES = 64 * 1024 * 1024
+
+SHEET_PREFIX = "Plan de charge ME "
+
+
+def charge_plan_path():
+    """Chemin du dernier plan de charge importé."""
+    return os.path.join(settings.MEDIA_ROOT, 'excels', 'plan_de_charge_actuel.xlsx')
+
+
+def _compact(df):
+    """Réduit les colonnes numériques au plus petit type qui les contient."""
+    for col in df.columns:
+        kind = df[col].dtype.kind
+        if kind == 'f':
+            df[col] = pd.to_numeric(df[col], downcast='float')
+        elif kind in 'iu':
+            df[col] = pd.to_numeric(df[col], downcast='integer')
+    return df
+
+
+class WorkbookCache:
+    """
+    Cache des classeurs Excel lus avec pandas.
+
+    Une entrée est identifiée par (chemin, mtime, taille) : remplacer le
+    fichier suffit donc à l'invalider. La liste des feuilles est gardée pour
+    chaque fichier ; les feuilles lues sont gardées dans un LRU borné en
+    nombre et en octets. Les DataFrames renvoyés sont partagés et ne doivent
+    pas être modifiés.
+    """
+
+    def __init__(self, max_sheets=MAX_SHEETS, max_bytes=MAX_BYTES):
+        self.max_sheets = max_sheets
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._sheet_names = {}
+        self._sheets = OrderedDict()
+        self._bytes = 0
+
+    @staticmethod
+    def _version(path):
+        st = os.stat(path)
+        return (os.path.abspath(path), st.st_mtime_ns, st.st_size)
+
+    def sheet_names(self, path):
+        version = self._version(path)
+        with self._lock:
+            names = self._sheet_names.get(version)
+        if names is None:
+            names = list(pd.ExcelFile(path).sheet_names)
+            with self._lock:
+                self._forget_path(version[0], keep=version)
+                self._sheet_names[version] = names
+        return names
+
+    def sheet(self, path, sheet_name):
+        version = self._version(path)
+        key = (version, sheet_name)
+        with self._lock:
+            entry = self._sheets.get(key)
+            if entry is not None:
+                self._sheets.move_to_end(key)
+                return entry[0]
+
+        df = _compact(pd.read_excel(path, sheet_name=sheet_name, header=0))
+        size = int(df.memory_usage(deep=True).sum())
+        with self._lock:
+            if key not in self._sheets:
+                self._sheets[key] = (df, size)
+                self._bytes += size
+                self._evict()
+        return df
+
+    def invalidate(self, path=None):
+        with self._lock:
+            if path is None:
+                self._sheet_names.clear()
+                self._sheets.clear()
+                self._bytes = 0
+            else:
+                self._forget_path(os.path.abspath(path))
+
+    # -- interne (appelé avec le verrou) ---------------------------------
+    def _forget_path(self, abspath, keep=None):
+        for version in [v for v in self._sheet_names if v[0] == abspath and v != keep]:
+            del self._sheet_names[version]
+        for key in [k for k in self._sheets if k[0][0] == abspath and k[0] != keep]:
+            self._drop(key)
+
+    def _drop(self, key):
+        _, size = self._sheets.pop(key)
+        self._bytes -= size
+
+    def _evict(self):
+        while self._sheets and (len(self._sheets) > self.max_sheets or self._bytes > self.max_bytes):
+            self._drop(next(iter(self._sheets)))
+
+
+workbook_cache = WorkbookCache()
+
+
+def sheet_years(path):
+    """Années des feuilles "Plan de charge ME <année>", de la plus récente à la plus ancienne."""
+    years = []
+    for sheet_name in workbook_cache.sheet_names(path):
+        if sheet_name.startswith(SHEET_PREFIX):
+            year_str = sheet_name[len(SHEET_PREFIX):]
+            if year_str.isdigit():
+                years.append(int(year_str))
+    return sorted(years, reverse=True)
@@ -3,6 +3,7 @@ import { Modal, Button, ProgressBar } from 'react-bootstrap';
 import { UploadCloud } from 'lucide-react';
 import styles from './ExcelImportModal.module.css';
 import { toast } from 'react-hot-toast';
+import api from '../../../api/api';
 
 const ExcelImportModal = ({ show, onHide }) => {
   const [file, setFile] = useState(null);
@@ -25,6 +26,33 @@ const ExcelImportModal = ({ show, onHide }) => {
     }
   };
 
+  // L'import tourne en arrière-plan : on interroge le job jusqu'à la fin
+  const pollImportJob = (jobId) => {
+    const poll = async () => {
+      try {
+        const { data: job } = await api.get(`/personne/import-jobs/${jobId}/`);
+        if (job.status === 'terminee') {
+          setIsUploading(false);
+          setUploadProgress(0);
+          toast.success('Importation réussie');
+          setImportSummary(job.summary.résumé);
+        } else if (job.status === 'echec') {
+          setIsUploading(false);
+          setUploadProgress(0);
+          toast.error('❌ ' + (job.errors[0] || 'Erreur inconnue'));
+        } else {
+          setUploadProgress(job.progress);
+          setTimeout(poll, 1000);
+        }
+      } catch {
+        setIsUploading(false);
+        setUploadProgress(0);
+        toast.error('❌ Erreur serveur');
+      }
+    };
+    poll();
+  };
+
   const handleUpload = async () => {
     if (!file) return;
 
@@ -46,14 +74,13 @@ const ExcelImportModal = ({ show, onHide }) => {
     };
 
     xhr.onload = () => {
-      setIsUploading(false);
-      setUploadProgress(0);
-      if (xhr.status === 200) {
-        
-        toast.success('Importation réussie');
-        const response = JSON.parse(xhr.responseText);
-        setImportSummary(response.résumé);
+      if (xhr.status === 202) {
+        const job = JSON.parse(xhr.responseText);
+        setUploadProgress(0);
+        pollImportJob(job.id);
       } else {
+        setIsUploading(false);
+        setUploadProgress(0);
         try {
           const err = JSON.parse(xhr.responseText);
           toast.error('❌ ' + (err.error || err.message || 'Erreur inconnue'));